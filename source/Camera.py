@@ -12,89 +12,223 @@ import cv2
 import numpy as np
 
 from decision_points.PointList import PointList
-from decision_points.MoveGetCirclePoint import MoveGetCirclePoint
+from decision_points.BingoAreaDetector import BingoAreaDetector
+from decision_points.CirclePointDetector import CirclePointDetector
+from decision_points.DriftDetector import DriftDetector
+from capture.FrameGrabber import FrameGrabber
+from capture.FrameSource import FrameSource
+from capture.MjpegStreamReader import MjpegStreamReader
+from capture.PerspectiveMaps import PerspectiveMaps
+from capture.DebugImageWriter import DebugImageWriter
+from capture.FrameQualityGate import FrameQualityGate
 
 
 class Camera:
-    def __init__(self, url="http://raspberrypi.local/?action=stream"):
+    PADDING_COLOR = (255, 255, 255)  # キャプチャした画像の余白の色
+    NUMBER_JITTERS = ((-1, 0), (1, 0), (0, -1), (0, 1))  # 数字カードをずらして切り取る方向（左右上下）
+
+    def __init__(self, url="http://raspberrypi.local/?action=stream", grabber=None, debug_writer=None, source=None):
         self.camera_url = url
+        # 画像の取得元（映像配信、画像ファイル、画像のディレクトリ、動画ファイル）。Noneの場合はurlから決める
+        self.source = source if source is not None else FrameSource.open(url)
+        # デバッグ用の画像を別スレッドで保存する（debug_writer.enabledをFalseにすると保存しない）
+        self.debug_writer = debug_writer if debug_writer is not None else DebugImageWriter()
+        self.grabber = grabber  # バックグラウンドで画像を受信し続けるFrameGrabber（Noneの場合はsourceから取得する）
+        self.grab_timeout = 3.0  # 新しい画像を取得するまで待つ時間（秒）
+        self.last_frame_time = None  # 最後にキャプチャした画像の取得時刻
+        # ぼやけた画像などを認識に使わないように、キャプチャした画像の品質を調べる（Noneにすると調べない）
+        self.quality_gate = FrameQualityGate()
+        self.max_capture_attempts = 5  # 品質の低い画像を読み飛ばしてキャプチャし直す最大の回数（映像配信の場合だけ）
+        self.frame_quality = None  # キャプチャした画像の品質（FrameQualityGate.measureの結果）
+        self.frame = None  # キャプチャしてきた元画像（余白なし）
+        self.frame_dummy = None  # キャプチャしてきた元画像（座標指定用、余白なし）
+        self.padding = 0  # 切り取る座標を指定する画像の余白（単位：px）
         # NOTE: 座標を指定すると画像に点や線が入ってしまうため処理用と座標指定用を分けた
-        self.original_img = None  # キャプチャしてきた元画像（処理用）
-        self.original_img_dummy = None  # キャプチャしてきた元画像（座標指定用）
+        # NOTE: 余白を付けた画像は座標を指定する場合だけ必要なため、original_img, original_img_dummyを参照した時に作る
+        self._original_img = None  # キャプチャしてきた元画像に余白を付けた画像（処理用）
+        self._original_img_dummy = None  # キャプチャしてきた元画像に余白を付けた画像（座標指定用）
         self.block_bingo_img = None  # 切り取ったブロックビンゴエリアの画像（処理用）
         self.block_bingo_img_dummy = None  # 切り取ったブロックビンゴエリアの画像（座標指定用）
         self.loaded_settings_file = False
         self.modified_settings = False
+        self.modified_ranges = False  # 切り取るための座標を指定・補正したか（Trueの場合は保存する時に特徴点を求め直す）
         self.is_left = True  # TrueだとLコース
-        self.move_get_circle_point = MoveGetCirclePoint()
+        self._move_get_circle_point = None  # 座標指定用のウィンドウ（座標を指定する時に作る）
+        # ブロックビンゴエリアの四隅を自動で検出する（Noneにすると常に手動で指定する）
+        self.bingo_area_detector = BingoAreaDetector()
+        # 切り取った画像から各種サークルの座標を自動で検出する（Noneにすると常に手動で指定する）
+        self.circle_point_detector = CirclePointDetector()
+        # サークルの座標を検出し直した時に、それまでの座標を置き換えるずれの下限（単位：px）
+        # （検出のたびに1px程度ずれるため、ずれが小さい場合は設定ファイルを書き換えない）
+        self.circle_tolerance = 3.0
+        # 設定ファイルの座標を指定した時からカメラが動いたかを調べる（Noneにすると調べない）
+        self.drift_detector = DriftDetector()
 
         # 以下ファイルへ保存するデータ
         self.number_img_range = None  # 数字カードを切り取るための座標情報
         self.block_bingo_img_range = None  # ブロックビンゴエリアを切り取るための座標情報
         self.block_bingo_circle_coordinates = None  # ブロックビンゴエリアの各種サークルの座標情報
+        self.reference_features = None  # 座標を指定した時の画像の特徴点（カメラが動いたかを調べるため）
 
     def capture(self, url=None, padding=0):
         """
-        URLから流れてくる映像をキャプチャし、静止画として保存する
+        取得元（source）から画像をキャプチャし、静止画として保持する（debug_writerが有効な場合はファイルにも保存する）
+        start_grabberで画像の受信を開始している場合は、前回のキャプチャより後に受信した最新の画像を使う
+        録画した画像の取得元の場合は、キャプチャするたびに次の画像を使う
+        映像配信の場合、品質の低い画像（ぼやけている、明るすぎる・暗すぎる、途中で切れている）は読み飛ばし、次の画像をキャプチャし直す
+        max_capture_attempts回キャプチャしても品質の低い画像しかない場合は、最後の画像を使う
 
         Parameters
         ----------
         url: str
-            映像配信URL
+            映像配信URLや画像のパス。Noneの場合はsourceから取得する
 
         padding: int
             キャプチャした画像の余白（単位：px）。
+            余白は座標を指定する画面にだけ付け、切り取りは余白の分だけ座標をずらして元画像から直接行う
 
         Returns
         -------
         target_name: numpy.ndarray
             キャプチャした静止画
         """
-        if url is None:
-            url = self.camera_url
-        cap = cv2.VideoCapture(url)  # カメラシステムを使う場合
-        if not cap.isOpened():
+        if url is not None and url != self.camera_url:
+            # 別のURLから取得する場合は、このキャプチャの間だけ取得元を開く
+            with FrameSource.open(url) as source:
+                frame = self.capture_from(source)
+        elif self.grabber is not None:
+            # 受信し続けている最新の画像を使う（前回キャプチャした画像より新しいものを待つ）
+            frame = self.capture_from(self.grabber)
+        else:
+            frame = self.capture_from(self.source)
+        # 座標指定用の画像（点や線を描く画像）は余白を付ける時に別の配列になるため、同じ画像を使う
+        (self.last_frame_time, img) = frame
+        img_dummy = img
+
+        # 画像をメンバ変数に格納
+        self.frame = img
+        self.frame_dummy = img_dummy
+        self.padding = padding
+        self._original_img = None
+        self._original_img_dummy = None
+        if self.debug_writer.enabled:
+            # NOTE: 保存しない場合は余白を付けた画像を作らずに済むため、enabledを確認してから渡す
+            # NOTE: 座標指定用の画像は保存する前に点や線が描かれるため、複製してから渡す
+            self.debug_writer.write('./img/img_padding2.png', self.original_img)
+            self.debug_writer.write('./img/img_dummy2.png', self.original_img_dummy, copy=True)
+
+    def capture_from(self, source):
+        """
+        取得元から品質を満たす(取得時刻, 画像)を取得する
+        """
+        frame = source.latest(after=self.last_frame_time, timeout=self.grab_timeout)
+        if frame is None:
             # HACK: エラーを返した方がいいかも
             print("On file {}".format(__file__))
             print("画像のキャプチャに失敗しました")
             sys.exit()
+        return self.skip_low_quality_frames(source, frame)
 
-        # カメラFPSを30FPSに設定
-        cap.set(cv2.CAP_PROP_FPS, 30)
-
-        # カメラ画像の横幅を1280に設定
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+    def skip_low_quality_frames(self, source, frame):
+        """
+        品質の低い画像を読み飛ばし、品質を満たす(取得時刻, 画像)を返す
+        映像配信以外の取得元（画像ファイル、録画した画像）は読み飛ばさずにそのまま返す
+        """
+        self.frame_quality = None
+        if self.quality_gate is None:
+            return frame
+        # NOTE: 画像ファイルはキャプチャし直しても同じ画像が返り、録画した画像は再生する位置が進んでしまうため、
+        #       キャプチャし直すのは映像配信だけにする
+        max_attempts = self.max_capture_attempts if source.is_live else 1
+        skipped = []  # 読み飛ばした画像の品質の問題
+        for attempt in range(max_attempts):
+            self.frame_quality = self.quality_gate.measure(frame[1])
+            problems = self.quality_gate.problems(self.frame_quality)
+            if not problems:
+                break
+            if attempt + 1 == max_attempts:
+                break
+            next_frame = source.latest(after=frame[0], timeout=self.grab_timeout)
+            if next_frame is None:
+                break
+            skipped.extend(problem for problem in problems if problem not in skipped)
+            frame = next_frame
+        # キャプチャごとに1回だけ表示する
+        if problems:
+            print("キャプチャした画像の品質が低いですが、そのまま使います（{}）".format("、".join(problems)))
+        elif skipped:
+            print("品質の低い画像を読み飛ばしました（{}）".format("、".join(skipped)))
+        return frame
+
+    @property
+    def original_img(self):
+        """
+        キャプチャしてきた元画像に余白を付けた画像（処理用）
+        """
+        if self._original_img is None and self.frame is not None:
+            self._original_img = self.create_padding(self.frame, self.padding)
+        return self._original_img
 
-        # カメラ画像の縦幅を720に設定
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+    @property
+    def original_img_dummy(self):
+        """
+        キャプチャしてきた元画像に余白を付けた画像（座標指定用）
+        """
+        if self._original_img_dummy is None and self.frame_dummy is not None:
+            self._original_img_dummy = self.create_padding(self.frame_dummy, self.padding)
+        return self._original_img_dummy
 
-        # ピクセル配列をゼロ初期化
-        img = np.zeros((720, 1280, 3), dtype=np.uint8)
-        img_img = np.zeros((720, 1280, 3), dtype=np.uint8)
+    @classmethod
+    def create_padding(cls, img, padding):
+        """
+        画像の周囲に余白を付ける
+        """
+        return cv2.copyMakeBorder(img, padding, padding, padding, padding, cv2.BORDER_CONSTANT, value=cls.PADDING_COLOR)
 
-        # 画像をキャプチャ
-        ret, img = cap.read()
-        ret_dummy, img_dummy = cap.read()
-        if img_dummy is None:
-            img_dummy = img
+    def clip_captured(self, img, output_size, img_range):
+        """
+        キャプチャした画像（余白なし）から、余白付きの画像で指定した座標の部分を切り抜く
+        """
+        return self.clip(img, output_size=output_size,
+                         l_top=img_range["l_top"], l_btm=img_range["l_btm"],
+                         r_btm=img_range["r_btm"], r_top=img_range["r_top"],
+                         offset=(self.padding, self.padding), border_value=self.PADDING_COLOR)
 
-        # 余白を設定する
-        def create_padding(im):
-            tmp = im[:, :]
-            height, width = img.shape[:2]
-            new_img = cv2.resize(np.full((1, 1, 3), fill_value=255, dtype=np.uint8),
-                                 dsize=(width + padding * 2, height + padding * 2))
-            new_img[padding:height + padding, padding:width + padding] = tmp
-            return new_img
+    def start_grabber(self, buffer_size=4):
+        """
+        バックグラウンドで映像配信から画像を受信し続ける。以降のcaptureは受信済みの最新の画像を使う
 
-        # 画像をメンバ変数に格納
-        self.original_img = create_padding(img)
-        self.original_img_dummy = create_padding(img_dummy)
-        cv2.imwrite('./img/img_padding2.png', self.original_img)
-        cv2.imwrite('./img/img_dummy2.png', self.original_img_dummy)
+        HTTPの映像配信(mjpg-streamer)はMjpegStreamReaderで受信し、最新のJPEGをキャプチャする時だけ復号する。
+        それ以外の映像配信はcv2.VideoCaptureを使うFrameGrabberで受信する。
+        取得元が映像配信でない場合（画像ファイルや録画など）は何もせず、Noneを返す
+        """
+        if self.grabber is None:
+            if not self.source.is_live:
+                return None
+            if self.camera_url.startswith(("http://", "https://")):
+                self.grabber = MjpegStreamReader(self.camera_url)
+            else:
+                self.grabber = FrameGrabber(self.camera_url, buffer_size=buffer_size)
+        return self.grabber.start()
+
+    def stop_grabber(self):
+        """
+        画像の受信を終了する。以降のcaptureはキャプチャのたびに接続する
+        """
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber = None
 
-        # キャプチャ終了
-        cap.release()
+    @property
+    def move_get_circle_point(self):
+        """
+        サークルの座標を指定するウィンドウ（tkinterのウィンドウを作るため、初めて使う時に作る）
+        """
+        if self._move_get_circle_point is None:
+            # NOTE: tkinterとPILは座標を手動で指定する場合だけ必要なため、初めて使う時に読み込む
+            from decision_points.MoveGetCirclePoint import MoveGetCirclePoint
+            self._move_get_circle_point = MoveGetCirclePoint()
+        return self._move_get_circle_point
 
     def get_img(self, npoints, wname):
         ptlist = PointList(npoints)
@@ -124,11 +258,10 @@ class Camera:
             # 切り取りのための座標情報をメンバ変数に格納
             self.number_img_range = self.get_img(npoints, wname)
             self.modified_settings = True
+            self.modified_ranges = True
 
         # 画像を切り取る
-        result_img = self.clip(self.original_img, output_size=output_size,
-                               l_top=self.number_img_range["l_top"], l_btm=self.number_img_range["l_btm"],
-                               r_btm=self.number_img_range["r_btm"], r_top=self.number_img_range["r_top"])
+        result_img = self.clip_captured(self.frame, output_size, self.number_img_range)
         # 台形補正の結果を表示（何かキーを押すと終了）
         if is_debug:
             cv2.imshow("color", result_img)
@@ -137,22 +270,57 @@ class Camera:
             cv2.destroyAllWindows()
         return result_img
 
+    def get_number_imgs(self, jitter=4, output_size=(420, 297), is_debug=True):
+        """
+        数字カードを、切り取る座標を上下左右に少しずつずらして複数切り取る（複数の画像で数字を認識するため）
+        :param jitter: int ずらす大きさ（px）
+        :param output_size: tuple[int, int] サイズ[width, height]
+        :param is_debug: bool Trueだとずらしていない画像を表示する
+        :return: list[numpy.ndarray] 切り取った画像のリスト（最初の画像はずらしていない）
+        """
+        result_imgs = [self.get_number_img(output_size=output_size, is_debug=is_debug)]
+        # NOTE: ずらす方向は毎回同じため、台形補正の座標表はキャッシュしたものを使える
+        for (dx, dy) in self.NUMBER_JITTERS:
+            img_range = {key: np.add(point, (dx * jitter, dy * jitter))
+                         for (key, point) in self.number_img_range.items()}
+            result_imgs.append(self.clip_captured(self.frame, output_size, img_range))
+        return result_imgs
+
+    def detect_block_bingo_range(self):
+        """
+        キャプチャした画像からブロックビンゴエリアの四隅を自動で検出する
+
+        Returns
+        -------
+        named_points: dict
+            get_imgと同じ、余白付きの画像における四隅の座標。検出できない場合（信頼度が低い場合を含む）はNone
+        """
+        if self.bingo_area_detector is None or self.frame is None:
+            return None
+        result = self.bingo_area_detector.detect(self.frame, self.is_left)
+        if result is None:
+            print("ブロックビンゴエリアを検出できませんでした")
+            return None
+        (named_points, confidence) = result
+        if confidence < self.bingo_area_detector.min_confidence:
+            print("ブロックビンゴエリアの検出結果の信頼度が低いため使いません（信頼度：{:.2f}）".format(confidence))
+            return None
+        print("ブロックビンゴエリアを検出しました（信頼度：{:.2f}）".format(confidence))
+        # 座標は余白付きの画像で指定するため、余白の分だけずらす
+        return {key: point + self.padding for (key, point) in named_points.items()}
+
     def get_block_bingo_img(self, wname="Clip 'Block Bingo' area", npoints=4, output_size=(640, 640), is_debug=True):
-        # ファイルから座標データを読み込んでいない場合は、切り取るための領域を選択する
+        # ファイルから座標データを読み込んでいない場合は、自動で検出し、検出できなければ切り取るための領域を選択する
         if self.block_bingo_img_range is None:
             # 切り取りのための座標情報をメンバ変数に格納
-            self.block_bingo_img_range = self.get_img(npoints, wname)
+            self.block_bingo_img_range = self.detect_block_bingo_range()
+            if self.block_bingo_img_range is None:
+                self.block_bingo_img_range = self.get_img(npoints, wname)
             self.modified_settings = True
+            self.modified_ranges = True
 
         # 画像を切り取り、保存する
-        result_img = self.clip(self.original_img, output_size=output_size,
-                               l_top=self.block_bingo_img_range["l_top"], l_btm=self.block_bingo_img_range["l_btm"],
-                               r_btm=self.block_bingo_img_range["r_btm"], r_top=self.block_bingo_img_range["r_top"])
-        result_img_dummy = self.clip(self.original_img_dummy, output_size=output_size,
-                                     l_top=self.block_bingo_img_range["l_top"],
-                                     l_btm=self.block_bingo_img_range["l_btm"],
-                                     r_btm=self.block_bingo_img_range["r_btm"],
-                                     r_top=self.block_bingo_img_range["r_top"])
+        result_img = self.clip_captured(self.frame, output_size, self.block_bingo_img_range)
         # 台形補正の結果を表示（何かキーを押すと終了）
         if is_debug:
             cv2.imshow("color", result_img)
@@ -160,20 +328,69 @@ class Camera:
             cv2.waitKey(0)
             cv2.destroyAllWindows()
         self.block_bingo_img = result_img
-        self.block_bingo_img_dummy = result_img_dummy
+        # NOTE: 点や線は余白付きの画像（original_img_dummy）にだけ描くため、座標指定用の画像は処理用と同じ切り取り結果になる
+        #       同じ画像を2回台形補正しないように、処理用の画像をそのまま使う（座標指定の画面は画像を書き換えない）
+        self.block_bingo_img_dummy = result_img
         return result_img
 
-    def get_circle_coordinates_with_range(self, window_name="Choose circles"):
+    def detect_circle_coordinates(self):
+        """
+        切り取ったブロックビンゴエリアの画像から各種サークルの座標を自動で検出する
+
+        Returns
+        -------
+        named_points: dict
+            GetCirclePoint.named_pointsと同じ、各種サークルの座標。検出できない場合（信頼度が低い場合を含む）はNone
+        """
+        if self.circle_point_detector is None or self.block_bingo_img is None:
+            return None
+        result = self.circle_point_detector.detect(self.block_bingo_img)
+        if result is None:
+            print("サークルの座標を検出できませんでした")
+            return None
+        (named_points, confidence) = result
+        if confidence < self.circle_point_detector.min_confidence:
+            print("サークルの座標の検出結果の信頼度が低いため使いません（信頼度：{:.2f}）".format(confidence))
+            return None
+        print("サークルの座標を検出しました（信頼度：{:.2f}）".format(confidence))
+        return named_points
+
+    def get_circle_coordinates_with_range(self, window_name="Choose circles", redetect=False):
+        """
+        各種サークルの座標を返す。ファイルから読み込んでいない場合は自動で検出し、検出できなければ座標を指定する
+
+        Parameters
+        ----------
+        window_name: str
+            座標を指定するウィンドウの名前
+        redetect: bool
+            Trueの場合は、ファイルから読み込んだ座標があっても検出し直す（検出できなければ読み込んだ座標を使う）
+        """
+        if self.block_bingo_circle_coordinates is None or redetect:
+            named_points = self.detect_circle_coordinates()
+            if named_points is not None and self.circles_moved(named_points):
+                self.block_bingo_circle_coordinates = named_points
+                self.modified_settings = True
         if self.block_bingo_circle_coordinates is None:
-            img = './img/block_bingo_img_dummy.png'
-            cv2.imwrite(img, self.block_bingo_img_dummy)  # 画像保存
+            self.debug_writer.write('./img/block_bingo_img_dummy.png', self.block_bingo_img_dummy, copy=True)
             self.move_get_circle_point.window_name = window_name
-            self.move_get_circle_point.convert_img(img)
+            self.move_get_circle_point.convert_img(self.block_bingo_img_dummy)
             self.move_get_circle_point.run()
             self.block_bingo_circle_coordinates = self.move_get_circle_point.get_circle_point.named_points
             self.modified_settings = True
         return self.block_bingo_circle_coordinates
 
+    def circles_moved(self, named_points):
+        """
+        検出したサークルの座標が、それまでの座標からcircle_toleranceより大きくずれているかを返す
+        それまでの座標がない場合や、サークルのキーが違う場合はTrue
+        """
+        current = self.block_bingo_circle_coordinates
+        if current is None or set(current) != set(named_points):
+            return True
+        shift = max(np.hypot(*np.subtract(named_points[key], current[key])) for key in named_points)
+        return shift > self.circle_tolerance
+
     def load_settings(self, file_name="camera_settings.json"):
         """
         切り取るための座標情報や、各種サークルの座標情報をファイルから読み込む
@@ -206,8 +423,49 @@ class Camera:
         self.number_img_range = tmp["number_img_range"]
         self.block_bingo_img_range = tmp["block_bingo_img_range"]
         self.block_bingo_circle_coordinates = tmp["block_bingo_circle_coordinates"]
+        # 以前の設定ファイルには特徴点がない（その場合はカメラが動いたかを調べない）
+        self.reference_features = tmp.get("reference_features")
         self.loaded_settings_file = True
 
+    def check_calibration(self):
+        """
+        設定ファイルの座標を指定した時と、キャプチャした画像を比べて、カメラが動いたかを調べる
+        カメラが動いた場合は、切り取るための座標を射影変換で移して補正する
+        補正できない場合は、座標を消して指定し直す（get_number_img, get_block_bingo_imgで指定する画面を出す）
+        各種サークルの座標は切り取った画像の座標のため、切り取るための座標を補正すればそのまま使える
+
+        Returns
+        -------
+        result: bool
+            座標をそのまま使える場合か、補正した場合はTrue。座標を指定し直す必要がある場合はFalse
+        """
+        if self.drift_detector is None or self.reference_features is None or self.frame is None:
+            return True
+        if self.number_img_range is None or self.block_bingo_img_range is None:
+            return True
+        result = self.drift_detector.estimate(self.reference_features, self.frame)
+        if result is None:
+            print("カメラが動いたため座標を補正できません。座標を指定し直してください")
+            self.number_img_range = None
+            self.block_bingo_img_range = None
+            self.block_bingo_circle_coordinates = None
+            self.reference_features = None
+            return False
+        (matrix, _) = result
+        # 座標は余白付きの画像で指定するため、余白の分だけずらして比べる
+        points = [np.array(point) - self.padding for img_range in (self.number_img_range, self.block_bingo_img_range)
+                  for point in img_range.values()]
+        shift = self.drift_detector.shift(matrix, points)
+        if shift <= self.drift_detector.tolerance:
+            print("カメラは動いていません（ずれ：{:.1f}px）".format(shift))
+            return True
+        print("カメラが動いたため座標を補正しました（ずれ：{:.1f}px）".format(shift))
+        self.number_img_range = self.drift_detector.transform(matrix, self.number_img_range, self.padding)
+        self.block_bingo_img_range = self.drift_detector.transform(matrix, self.block_bingo_img_range, self.padding)
+        self.modified_settings = True
+        self.modified_ranges = True
+        return True
+
     def save_settings(self, file_name="camera_settings.json"):
         """
         切り取るための座標情報や、各種サークルの座標情報をファイルへ保存する
@@ -218,27 +476,41 @@ class Camera:
         settings = {"number_img_range": self.array_to_list(self.number_img_range),
                     "block_bingo_img_range": self.array_to_list(self.block_bingo_img_range),
                     "block_bingo_circle_coordinates": self.block_bingo_circle_coordinates}
+        # 次に読み込んだ時にカメラが動いたかを調べるため、座標を指定した画像の特徴点を一緒に保存する
+        # NOTE: 特徴点は座標を指定・補正した時だけ求め直す（サークルの座標だけ変えた場合などに、
+        #       動いたカメラの画像が基準にならないように、読み込んだ特徴点をそのまま保存する）
+        if self.modified_ranges and self.drift_detector is not None and self.frame is not None:
+            regions = [[np.array(point) - self.padding for point in img_range.values()]
+                       for img_range in (self.number_img_range, self.block_bingo_img_range) if img_range is not None]
+            self.reference_features = self.drift_detector.describe(self.frame, regions)
+            self.modified_ranges = False
+        if self.reference_features is not None:
+            settings["reference_features"] = self.reference_features
         with open(file_name, mode="w") as fp:
-            print(settings)
+            print({key: value for (key, value) in settings.items() if key != "reference_features"})
             json.dump(settings, fp, indent=4)
+        self.modified_settings = False
         print("[{}.{}]設定を保存しました".format(self.__class__.__name__, sys._getframe().f_code.co_name))
 
     @staticmethod
     def array_to_list(src_dict):
         """
         ptlist.named_listの座標(array)をリストに変換する
+        ファイルから読み込んだ座標(list)はそのまま残す
         """
         target_dict = {}
         for key in src_dict:
-            if type(src_dict[key]) != type(np.array([])):
-                continue
-            target_dict[key] = src_dict[key].tolist()
+            if isinstance(src_dict[key], np.ndarray):
+                target_dict[key] = src_dict[key].tolist()
+            elif isinstance(src_dict[key], (list, tuple)):
+                target_dict[key] = list(src_dict[key])
         return target_dict
 
     @staticmethod
     def clip(img, output_size=(420, 297),
              l_top=(-30, 460), l_btm=(190, 620),
-             r_top=(400, 450), r_btm=(200, 360)):
+             r_top=(400, 450), r_btm=(200, 360),
+             offset=(0, 0), border_value=0):
         """
         画像から指定された座標の部分を切り抜き、台形補正し保存する。
 
@@ -262,6 +534,13 @@ class Camera:
         r_btm: list
             数字カードの右下の座標。[X, Y]の順
 
+        offset: list
+            上記の座標を指定した画像における、入力画像の左上の座標。[X, Y]の順
+            （余白付きの画像で座標を指定した場合は余白の大きさ）
+
+        border_value: int or tuple
+            入力画像の外側の画素値
+
         Returns
         -------
         clipped_img: numpy.ndarray
@@ -271,36 +550,32 @@ class Camera:
         -----------
          https://note.nkmk.me/python-opencv-warp-affine-perspective/
         """
-        # 出力サイズを引数から取得
-        h, w = output_size
         # [左上の座標],[右上の座標],[左下の座標],[右下の座標]
-        src_pts = np.array([l_top, r_top, l_btm, r_btm], dtype=np.float32)
-        dst_pts = np.array([[0, 0], [w, 0], [0, h], [w, h]], dtype=np.float32)
-        mat = cv2.getPerspectiveTransform(src_pts, dst_pts)
-
-        clipped_img = cv2.warpPerspective(img, mat, (w, h))
+        src_pts = [l_top, r_top, l_btm, r_btm]
+        # NOTE: 切り取る座標は実行中に変わらないため、台形補正の座標表を初回だけ作り、以降は表を引くだけにする
+        clipped_img = PerspectiveMaps.get(src_pts, output_size, offset).warp(img, border_value)
 
         return clipped_img
 
 
 if __name__ == '__main__':
-    edit_settings = False  # 設定ファイルの内容を上書きするかどうか（設定ファイルが存在しない場合は関係ない）
-    if len(sys.argv) != 1:
-        if sys.argv[1] == "-e":
-            edit_settings = True
-
-    # ラズパイから映像を受信し、保存する
-    camera = Camera(
-        "https://raw.githubusercontent.com/KatLab-MiyazakiUniv/CameraSystem/master/source/detection_number/imgs/sample.jpg")
+    # 使い方: python Camera.py [-e] [映像配信URL・画像ファイル・画像のディレクトリ・動画ファイル]
+    args = sys.argv[1:]
+    edit_settings = "-e" in args  # 設定ファイルの内容を上書きするかどうか（設定ファイルが存在しない場合は関係ない）
+    targets = [arg for arg in args if arg != "-e"]
+
+    # ラズパイから映像を受信し、保存する（取得元を指定した場合は、その画像を使う）
+    camera = Camera(*targets[:1])
     if not edit_settings:
         camera.load_settings()
     # 余白を設定
     camera.capture(padding=100)
+    camera.check_calibration()  # 設定ファイルの座標を指定した時からカメラが動いていれば補正する
     num_img = camera.get_number_img()  # 数字カードの画像
     cv2.imwrite("aaa.png", num_img)
 
     bingo_img = camera.get_block_bingo_img()  # ブロックビンゴエリアの画像
     cv2.imwrite("bbb.png", bingo_img)
 
-    circle_coordinates = camera.get_circle_coordinates()  # 上記の画像における各種サークルの座標
+    circle_coordinates = camera.get_circle_coordinates_with_range()  # 上記の画像における各種サークルの座標
     camera.save_settings()
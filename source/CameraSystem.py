@@ -1,27 +1,93 @@
-from detection_number.DetectionNumber import DetectionNumber
-from Camera import Camera
-from bluetooth.Bluetooth import Bluetooth
-from bluetooth.search_serial_port import search_com_ports
-from detection_block.BlockRecognizer import BlockRecognizer
-from block_bingo.BlackBlockCommands import BlackBlockCommands
-from block_bingo.commands import Instructions
-from block_bingo.BlockBingoSolver import BlockBingoSolver, Bingo
+# NOTE: 最初の質問をすぐに表示するため、OpenCV・NumPy・pyserialなどを使うモジュールはここでは読み込まない
+#       カメラの準備、学習済みモデルの読み込み、BT接続は別スレッドで行い、その中で読み込む
+#       （各モジュールの読み込み時間はbenchmark/bench_startup.pyで測れる）
+#       pprintもdataclasses・inspectを読み込んで時間がかかるため、使う時に読み込む
 import time
 import threading
-import pprint
 
 
 class CameraSystem:
     def __init__(self, url="http://raspberrypi.local/?action=stream"):
-        self.camera = Camera(url)
-
-        # NOTE: 以前に座標ポチポチしたデータを読み込む（ファイルが存在場合は何もしない）
-        #       座標ポチポチをやり直したい場合は、camera.load_settings()を呼び出さなければOK
-        self.camera.load_settings()
-
-        self.bt = Bluetooth()
+        self.url = url
+        self._camera = None
+        self._camera_error = None  # カメラの準備中に起きた例外（cameraを参照した時に投げ直す）
+        # カメラの準備のスレッドがNumPy・OpenCVを読み込んだか（学習済みモデルの読み込みはこれを待ってから始める）
+        self._modules_ready = threading.Event()
+        # NOTE: カメラの準備（モジュールの読み込み、設定ファイルの読み込み、映像配信への接続）を別スレッドで始める
+        #       cameraを参照すると、準備が終わるまで待つ
+        self.camera_thread = threading.Thread(target=self._setup_camera, name="CameraSystem.setup_camera", daemon=True)
+        self.camera_thread.start()
+
+        self.bt = None  # EV3とのBT通信（BT接続のスレッドで作る）
         self.port = "COM6"
+        self.number_model_path = "./detection_number/my_model.npz"  # 数字カードの学習済みモデル
+        self.number_model_thread = None  # 学習済みモデルを読み込むスレッド（startで始める）
+        self.number_jitter = 4  # 数字カードをずらして切り取る大きさ（px）
+        self.min_number_confidence = 0.8  # 数字の認識結果を採用する確率の下限（下回る場合はキャプチャし直す）
+        self.max_number_captures = 5  # 数字の認識に使うキャプチャの最大数
         self.is_debug = False
+        self.max_block_frames = 10  # ブロックの認識に使う画像の最大数
+        self.block_timeout = 3.0  # ブロックの認識にかける最大の時間(秒)
+
+    @property
+    def camera(self):
+        """
+        カメラ（別スレッドで準備している間は、準備が終わるまで待つ）
+        """
+        self.camera_thread.join()
+        if self._camera_error is not None:
+            raise self._camera_error
+        return self._camera
+
+    def _setup_camera(self):
+        """
+        カメラを準備する（別スレッドで実行する）
+        """
+        try:
+            # NOTE: NumPyを複数のスレッドで同時に読み込むと失敗することがあるため、このスレッドで最初に読み込み、
+            #       読み込み終わってから学習済みモデルの読み込み（別スレッド）を始める
+            import numpy
+            import cv2
+        except Exception as error:
+            self._camera_error = error
+            return
+        finally:
+            self._modules_ready.set()
+        try:
+            from Camera import Camera
+            from detection_block.HistogramBank import HistogramBank
+
+            camera = Camera(self.url)
+            # NOTE: 以前に座標ポチポチしたデータを読み込む（ファイルが存在場合は何もしない）
+            #       座標ポチポチをやり直したい場合は、camera.load_settings()を呼び出さなければOK
+            camera.load_settings()
+            # NOTE: 映像配信への接続を保ち、バックグラウンドで最新の画像を受信し続ける（接続が切れた場合は自動で再接続する）
+            camera.start_grabber()
+
+            # NOTE: ブロック認識に使うサンプル画像のヒストグラムを開始前に読み込んでおく
+            HistogramBank.load()
+            self._camera = camera
+        except Exception as error:
+            self._camera_error = error
+
+    def _load_number_model(self):
+        """
+        数字カードの学習済みモデルを読み込む（別スレッドで実行する。読み込めない場合は認識する時にエラーになる）
+        """
+        # NOTE: NumPy・OpenCVの読み込みだけを待ち、カメラの準備の残り（映像配信への接続など）とは並行して読み込む
+        self._modules_ready.wait()
+        try:
+            # NOTE: chainerを読み込まないように、NumPyだけで推論するクラスを使う（認識結果はDetectionNumberと同じ）
+            from detection_number.NumpyDetectionNumber import NumpyDetectionNumber
+        except Exception as error:
+            # 数字カードを認識する時にもう一度読み込み、その時にエラーを出す
+            print("SYS: 数字カードの認識器を読み込めませんでした（{}: {}）".format(type(error).__name__, error))
+            return
+        try:
+            NumpyDetectionNumber.load_model(self.number_model_path)
+        except Exception as error:
+            print("SYS: 学習済みモデル({})を読み込めませんでした（{}: {}）".format(
+                self.number_model_path, type(error).__name__, error))
 
     def start(self):
         """
@@ -29,11 +95,13 @@ class CameraSystem:
         :return:
         """
 
-        search_com_ports()
         # スレッドを立てて、BT接続を始める。
         connect_thread = threading.Thread(target=self._connect_to_ev3)
         connect_thread.start()
-        time.sleep(3)
+        # BT接続・カメラの準備と並行して、数字カードの学習済みモデルを読み込んでおく（開始の合図の後は推論だけで済む）
+        self.number_model_thread = threading.Thread(
+            target=self._load_number_model, name="CameraSystem.load_number_model", daemon=True)
+        self.number_model_thread.start()
 
         while True:
             print("SYS: 本番ですか？")
@@ -60,6 +128,8 @@ class CameraSystem:
                 break
 
         self.camera.is_left = is_left  # LコースかRコースか
+        # 本番ではデバッグ用の画像を保存しない
+        self.camera.debug_writer.enabled = self.is_debug
         # 座標ギメ
         print("\nSYS: 数字カードを切り取ってください")
         self._detection_number_decision_points()
@@ -81,6 +151,9 @@ class CameraSystem:
         print("\nSYS: ブロック運搬経路を計算しています...")
         commands = self._path_planning(card_number, is_left)
 
+        import pprint
+        from block_bingo.commands import Instructions
+
         instructions = Instructions()
         print("運搬経路コマンド")
         pprint.pprint([instructions.translate(command)
@@ -92,10 +165,18 @@ class CameraSystem:
         else:
             print(commands)
 
+        self.camera.stop_grabber()
+        self.camera.debug_writer.close()
+
     def _connect_to_ev3(self):
         """
         EV3とBT接続
         """
+        from bluetooth.Bluetooth import Bluetooth
+        from bluetooth.search_serial_port import search_com_ports
+
+        search_com_ports()
+        self.bt = Bluetooth()
         print("\nSYS: Connect EV3")
         self.bt.connect(self.port)
         while True:
@@ -113,19 +194,34 @@ class CameraSystem:
         :return: 数字カードの数字
         """
         self.camera.capture(padding=100)
+        # 設定ファイルを読み込んだ場合は、カメラが動いていないかを調べる（動いた場合は座標を補正するか、指定し直す）
+        self.camera.check_calibration()
         self.camera.get_number_img(is_debug=self.is_debug)
         return
 
     def _detection_number(self):
         """
         数字カードの切り取りと数字の識別
+        ずらして切り取った複数の画像で数字を認識し、確率が低い場合はキャプチャし直して画像を追加する
         :return: 数字カードの数字
         """
-        self.camera.capture(padding=100)
-        number_card = self.camera.get_number_img(is_debug=self.is_debug)
-        detection_number = DetectionNumber(
-            img=number_card, model_path="./detection_number/my_model.npz")
-        return detection_number.get_detect_number()
+        if self.number_model_thread is not None:
+            # 学習済みモデルの読み込みが終わるまで待つ（同じモデルを2回読み込まないように）
+            self.number_model_thread.join()
+        from detection_number.NumpyDetectionNumber import NumpyDetectionNumber
+
+        detection_number = NumpyDetectionNumber(model_path=self.number_model_path)
+        number_cards = []
+        for capture_count in range(1, self.max_number_captures + 1):
+            self.camera.capture(padding=100)
+            number_cards += self.camera.get_number_imgs(
+                jitter=self.number_jitter, is_debug=self.is_debug and capture_count == 1)
+            (card_number, confidence) = detection_number.get_detect_number_batch(number_cards)
+            if confidence >= self.min_number_confidence:
+                break
+            print(f"SYS: 数字カードの認識結果の確率が低いため、キャプチャし直します（{card_number}番、{confidence:.2f}）")
+        print(f"SYS: {capture_count}回のキャプチャ（{len(number_cards)}枚の画像）で認識しました（確率{confidence:.2f}）")
+        return card_number
 
     def _path_planning(self, card_number, is_left):
         # ブロックの認識
@@ -162,19 +258,35 @@ class CameraSystem:
         is_left : bool
             Lコースかどうか
         """
+        import pprint
+        from detection_block.BlockRecognizer import BlockRecognizer
+
         while True:
             # 領域、座標指定
             block_bingo_img = self.camera.get_block_bingo_img(
                 is_debug=self.is_debug)  # 領域指定して画像取得
-            circles_coordinates = self.camera.get_circle_coordinates_with_range()  # 座標をドラッグ・アンド・ドロップ
-            self.camera.save_settings()  # 座標ポチポチした結果を保存
+            # キャプチャした画像でサークルの座標を検出し直す（検出できなければ保存した座標か、ドラッグ・アンド・ドロップ）
+            circles_coordinates = self.camera.get_circle_coordinates_with_range(redetect=True)
+            if self.camera.modified_settings:
+                # 検出し直した座標が保存した座標からずれた場合（circle_toleranceより大きい場合）だけ保存する
+                self.camera.save_settings()
             # ブロックの認識器の生成
             recognizer = BlockRecognizer(card_number, is_left)
-            # ブロックの認識(戻り値は、BlockCirclesCoordinateとCrossCirclesCoordinateのインスタンス)
-            (block_circle, cross_circle) = recognizer.recognize(
-                block_bingo_img, circles_coordinates)
+            # 複数の画像の識別結果の多数決でブロックを認識する(戻り値は、BlockCirclesCoordinateとCrossCirclesCoordinateのインスタンス)
+            try:
+                (block_circle, cross_circle) = recognizer.recognize_stream(
+                    self._block_bingo_frames(block_bingo_img), circles_coordinates,
+                    max_frames=self.max_block_frames, timeout=self.block_timeout)
+            except ValueError:
+                # 時間内に識別できる画像がなかった場合は、キャプチャし直す
+                print("SYS: ブロックを認識できる画像がなかったため、キャプチャし直します")
+                self.camera.capture(padding=100)
+                continue
+            print(f"SYS: {recognizer.frame_count}枚の画像で認識しました")
             print(f"黒ブロック配置サークルは{block_circle.black_circle}番")
             print(f"カラーブロック配置サークルは{block_circle.color_circle}番")
+            if recognizer.ambiguous_circles:
+                print(f"SYS: 多数決が定まらなかったサークルがあります {recognizer.ambiguous_circles}")
 
             if block_circle is not None and cross_circle is not None:
                 break
@@ -183,6 +295,20 @@ class CameraSystem:
         pprint.pprint(cross_circle.cross_circles)
         return (block_circle, cross_circle)
 
+    def _block_bingo_frames(self, first_img):
+        """
+        ブロックの認識に使う画像を順番に返す。最初は取得済みの画像を返し、以降はキャプチャし直した画像を返す。
+
+        Parameters
+        ----------
+        first_img : numpy.ndarray
+            取得済みのブロックビンゴエリアの画像
+        """
+        yield first_img
+        while True:
+            self.camera.capture(padding=100)
+            yield self.camera.get_block_bingo_img(is_debug=False)
+
     def _black_circles_path(self, block_circles, is_left):
         """
         ブロックサークル内の黒ブロックを運搬する経路を計算する。
@@ -192,6 +318,8 @@ class CameraSystem:
         block_circles : BlockCirclesCoordinate
             ブロックサークルの座標
         """
+        from block_bingo.BlackBlockCommands import BlackBlockCommands
+
         solver = BlackBlockCommands(
             block_circles.bonus_circle, block_circles.black_circle, block_circles.color_circle, is_left=is_left)
         commands = list(solver.gen_commands())
@@ -211,6 +339,8 @@ class CameraSystem:
         path : list
             黒ブロックを運搬するためのブロックサークル間移動の運搬経路
         """
+        from block_bingo.BlockBingoSolver import BlockBingoSolver, Bingo
+
         solver = BlockBingoSolver(block_circles, cross_circles, path)
         return solver.solve(bingo=Bingo.DOUBLE_BINGO)
 
@@ -0,0 +1,55 @@
+"""
+@file: bench_bingo_area.py
+@brief: ブロックビンゴエリアの四隅の自動検出(decision_points/BingoAreaDetector.py)の処理時間と、
+        手動で指定した座標(corpus.jsonのblock_bingo_img_range)との差を測る
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=. python benchmark/bench_bingo_area.py
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmark import corpus
+from decision_points.BingoAreaDetector import BingoAreaDetector
+
+
+KEYS = ("l_top", "r_top", "l_btm", "r_btm")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=corpus.DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--scale', type=float, default=0.5, help='検出に使う画像の縮小率')
+    args = parser.parse_args()
+
+    detector = BingoAreaDetector(scale=args.scale)
+    entries = [entry for entry in corpus.load_corpus(args.corpus) if "block_bingo_img_range" in entry]
+    print("{:<20} {:>8} {:>8} {:>6}  {}".format(
+        "name", "p50[ms]", "p90[ms]", "conf", "手動の座標との差[px] ({})".format(", ".join(KEYS))))
+    all_times = []
+    for entry in entries:
+        img = corpus.read_image(entry)
+        times = np.empty(args.repeat)
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            result = detector.detect(img)
+            times[i] = (time.perf_counter() - start) * 1000
+        all_times.extend(times)
+        if result is None:
+            print("{:<20} {:>8.2f} {:>8.2f} {:>6}  検出できませんでした".format(
+                entry["name"], np.percentile(times, 50), np.percentile(times, 90), "-"))
+            continue
+        (named_points, confidence) = result
+        errors = [np.linalg.norm(named_points[key] - entry["block_bingo_img_range"][key]) for key in KEYS]
+        print("{:<20} {:>8.2f} {:>8.2f} {:>6.2f}  {}".format(
+            entry["name"], np.percentile(times, 50), np.percentile(times, 90), confidence,
+            " ".join("{:5.1f}".format(error) for error in errors)))
+    print("\n全体: p50 {:.2f}ms  p90 {:.2f}ms  max {:.2f}ms".format(
+        np.percentile(all_times, 50), np.percentile(all_times, 90), np.max(all_times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+@file: bench_circle_point.py
+@brief: 各種サークルの座標の自動検出(decision_points/CirclePointDetector.py)の処理時間と、
+        手動で指定した座標(corpus.jsonのcircles_coordinates)との差を測る
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=. python benchmark/bench_circle_point.py
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmark import corpus
+from decision_points.CirclePointDetector import CirclePointDetector
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=corpus.DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    detector = CirclePointDetector()
+    print("{:<20} {:>8} {:>8} {:>6} {:>9} {:>8}  {}".format(
+        "name", "p50[ms]", "p90[ms]", "conf", "mean[px]", "max[px]", "差が最も大きいサークル"))
+    all_times = []
+    for entry in corpus.load_corpus(args.corpus):
+        img = corpus.clip(entry, corpus.read_image(entry))
+        times = np.empty(args.repeat)
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            result = detector.detect(img)
+            times[i] = (time.perf_counter() - start) * 1000
+        all_times.extend(times)
+        if result is None:
+            print("{:<20} {:>8.2f} {:>8.2f} {:>6}  検出できませんでした".format(
+                entry["name"], np.percentile(times, 50), np.percentile(times, 90), "-"))
+            continue
+        (named_points, confidence) = result
+        errors = {key: np.linalg.norm(np.subtract(named_points[key], point))
+                  for (key, point) in entry["circles_coordinates"].items()}
+        worst = max(errors, key=errors.get)
+        print("{:<20} {:>8.2f} {:>8.2f} {:>6.2f} {:>9.1f} {:>8.1f}  {}".format(
+            entry["name"], np.percentile(times, 50), np.percentile(times, 90), confidence,
+            np.mean(list(errors.values())), errors[worst], worst))
+    print("\n全体: p50 {:.2f}ms  p90 {:.2f}ms  max {:.2f}ms".format(
+        np.percentile(all_times, 50), np.percentile(all_times, 90), np.max(all_times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+@file: bench_clip.py
+@brief: 台形補正を毎回cv2.warpPerspectiveで行う場合と、キャッシュした座標表でcv2.remapを行う場合の処理時間を比較する。
+        余白を付けた画像から切り取る場合と、余白を付けずに座標をずらして切り取る場合も比較する
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=. python benchmark/bench_clip.py
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from capture.PerspectiveMaps import PerspectiveMaps
+
+
+# test_Camera.pyと同じ切り取り範囲(余白100pxを付けた画像の座標)
+PADDING = 100
+RANGES = {
+    "number": ({"l_top": [18, 599], "l_btm": [226, 797], "r_top": [232, 468], "r_btm": [488, 590]}, (420, 297)),
+    "block_bingo": ({"l_top": [248, 390], "l_btm": [1216, 767], "r_top": [739, 160], "r_btm": [1348, 255]},
+                    (640, 640)),
+}
+
+
+def measure(func, repeat):
+    """
+    funcをrepeat回実行し、1回あたりの処理時間[ms]の配列を返す
+    """
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times[i] = (time.perf_counter() - start) * 1000
+    return times
+
+
+def warp(img, src_pts, output_size):
+    # 変更前のCamera.clipと同じ処理
+    h, w = output_size
+    return cv2.warpPerspective(img, PerspectiveMaps.transform(src_pts, output_size), (w, h))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image', default='./img/sample_camera_area.jpg')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    frame = cv2.imread(args.image)
+    white = (255, 255, 255)
+
+    def pad():
+        return cv2.copyMakeBorder(frame, PADDING, PADDING, PADDING, PADDING, cv2.BORDER_CONSTANT, value=white)
+    img = pad()
+
+    pad_time = np.median(measure(pad, args.repeat))
+    print("余白を付ける処理: {:.3f}ms/枚\n".format(pad_time))
+    print("{:<12} {:>10} {:>10} {:>10} {:>10} {:>8} {:>10}".format(
+        "range", "warp[ms]", "remap[ms]", "offset[ms]", "maps[ms]", "speedup", "identical"))
+    for (name, (img_range, output_size)) in RANGES.items():
+        src_pts = [img_range["l_top"], img_range["r_top"], img_range["l_btm"], img_range["r_btm"]]
+        # 座標表の作成(初回のみ)
+        PerspectiveMaps.clear()
+        start = time.perf_counter()
+        maps = PerspectiveMaps.get(src_pts, output_size)
+        create_time = (time.perf_counter() - start) * 1000
+
+        offset = (PADDING, PADDING)
+        expected = warp(img, src_pts, output_size)
+        identical = ((maps.warp(img) == expected).all() and
+                     (PerspectiveMaps.get(src_pts, output_size, offset).warp(frame, white) == expected).all())
+        # warp: 余白付きの画像をcv2.warpPerspectiveで切り取る(変更前のCamera.clip)
+        # remap: 余白付きの画像をキャッシュした座標表で切り取る
+        # offset: 余白のない画像を、余白の分だけずらした座標表で切り取る(余白を付ける処理が不要)
+        warp_time = np.median(measure(lambda: warp(img, src_pts, output_size), args.repeat))
+        remap_time = np.median(measure(lambda: PerspectiveMaps.get(src_pts, output_size).warp(img), args.repeat))
+        offset_time = np.median(measure(
+            lambda: PerspectiveMaps.get(src_pts, output_size, offset).warp(frame, white), args.repeat))
+        print("{:<12} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>7.1f}x {:>10}".format(
+            name, warp_time, remap_time, offset_time, create_time, (pad_time + warp_time) / offset_time,
+            str(identical)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+@file: bench_frame_quality.py
+@brief: キャプチャした画像の品質判定(capture/FrameQualityGate.py)の処理時間を、縮小する横幅ごとに測る
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=. python benchmark/bench_frame_quality.py
+"""
+import argparse
+import glob
+import time
+
+import cv2
+import numpy as np
+
+from capture.FrameQualityGate import FrameQualityGate
+
+
+def measure(func, repeat):
+    """
+    funcをrepeat回実行し、1回あたりの処理時間[ms]の配列を返す
+    """
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times[i] = (time.perf_counter() - start) * 1000
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', default='./detection_block/data/snapshot_*.jpg')
+    parser.add_argument('--widths', type=int, nargs='+', default=[160, 320, 640, 1280],
+                        help='判定する時に縮小する横幅(FrameQualityGateの既定値は320)')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    imgs = [cv2.imread(path) for path in sorted(glob.glob(args.images))]
+    if not imgs:
+        print("画像({})がありません".format(args.images))
+        return
+
+    print("{}枚 x {}回".format(len(imgs), args.repeat))
+    print("{:>8} {:>10} {:>10} {:>10} {:>12}".format("width", "p50[ms]", "p90[ms]", "max[ms]", "sharpness"))
+    for width in args.widths:
+        gate = FrameQualityGate(width=width)
+        times = np.concatenate([measure(lambda: gate.measure(img), args.repeat) for img in imgs])
+        # 鮮明さは縮小する横幅で変わるため、閾値(min_sharpness)は横幅ごとに決め直す必要がある
+        sharpness = np.median([gate.measure(img)["sharpness"] for img in imgs])
+        print("{:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>12.0f}".format(
+            width, np.percentile(times, 50), np.percentile(times, 90), times.max(), sharpness))
+
+
+if __name__ == '__main__':
+    main()
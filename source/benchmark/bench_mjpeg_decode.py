@@ -0,0 +1,53 @@
+"""
+@file: bench_mjpeg_decode.py
+@brief: 映像配信のJPEGを等倍で復号する場合と、cv2.IMREAD_REDUCED_COLOR_*で縮小しながら復号する場合の処理時間を比較する
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=. python benchmark/bench_mjpeg_decode.py
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from capture.MjpegStreamReader import MjpegStreamReader
+
+
+def measure(func, repeat):
+    """
+    funcをrepeat回実行し、1回あたりの処理時間[ms]の配列を返す
+    """
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times[i] = (time.perf_counter() - start) * 1000
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image', default='./img/sample_camera_area.jpg')
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        jpeg = f.read()
+    print("{}: {} bytes\n".format(args.image, len(jpeg)))
+    print("{:<8} {:>12} {:>12} {:>14} {:>8}".format("reduce", "size", "decode[ms]", "resize[ms]", "speedup"))
+    for reduce in sorted(MjpegStreamReader.DECODE_FLAGS):
+        img = MjpegStreamReader.decode(jpeg, reduce)
+        (h, w) = img.shape[:2]
+        decode_time = np.median(measure(lambda: MjpegStreamReader.decode(jpeg, reduce), args.repeat))
+        if reduce == 1:
+            full_time = decode_time
+        # 等倍で復号してから縮小する場合(縮小しながら復号しない場合)と比較する
+        resize_time = np.median(measure(
+            lambda: cv2.resize(MjpegStreamReader.decode(jpeg), (w, h), interpolation=cv2.INTER_AREA), args.repeat))
+        print("{:<8} {:>12} {:>12.3f} {:>14.3f} {:>7.2f}x".format(
+            reduce, "{}x{}".format(w, h), decode_time, resize_time, full_time / decode_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+@file: bench_number_quantization.py
+@brief: 数字カードの学習済みモデルをfloat16・int8に量子化した場合の、ファイルの大きさ、メモリ、
+        読み込み時間(初回)、推論時間、推論中のメモリ確保量の最大と、float32との認識結果の違いを測る
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=.:detection_number python benchmark/bench_number_quantization.py
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from detection_number.NumpyDetectionNumber import NumpyDetectionNumber, NumpyMLP
+
+# 数字が分かっている画像(画像のパス, 数字)
+LABELED_IMAGES = ([("detection_number/training_scripts/original/{}.jpg".format(number), number)
+                   for number in range(1, 9)] +
+                  [("detection_number/imgs/sample_number.jpg", 3),
+                   ("detection_number/imgs/shisou1/result_snapshot_20190727_135817.jpg", 3),
+                   ("detection_number/imgs/shisou1/result_snapshot_20190727_135959.jpg", 7),
+                   ("detection_number/imgs/shisou1/result_snapshot_20190727_140002.jpg", 7)])
+
+
+def preprocess(detector, path):
+    # 前処理はモデルの型に関係なく同じ
+    detector.set_img(cv2.imread(path))
+    detector._preprocessing()
+    return detector.preprocess_img
+
+
+def measure_load(path, cache, repeat):
+    # ファイルの読み込みから初回の推論までの時間(ファイルはOSのキャッシュに載った状態)
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        model = NumpyMLP.load(path, cache)
+        model(np.zeros((1, 784), dtype=np.float32))
+        times[i] = (time.perf_counter() - start) * 1000
+    return (model, times)
+
+
+def measure_peak(func):
+    # funcを実行する間に確保したメモリの最大[KB](tracemallocはNumPyの配列の確保も数える)
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='detection_number/my_model.npz', help='chainerで保存した学習済みモデル')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    if not os.path.exists(args.model):
+        print("学習済みモデル({})がありません".format(args.model))
+        return
+
+    detector = NumpyDetectionNumber(model_path=args.model)
+    inputs = np.concatenate([preprocess(detector, path) for (path, _) in LABELED_IMAGES])
+    labels = np.array([number for (_, number) in LABELED_IMAGES])
+    expected = NumpyMLP.load(args.model)(inputs)
+    print("{:<8} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10} {:>8} {:>8} {:>10}".format(
+        "dtype", "cache", "file[KB]", "memory[KB]", "peak[KB]", "load[ms]", "infer[ms]", "正解数", "一致数",
+        "スコアの差"))
+    with tempfile.TemporaryDirectory() as directory:
+        for dtype in NumpyMLP.DTYPES:
+            path = os.path.join(directory, "{}.npz".format(dtype))
+            NumpyMLP.export(args.model, path, dtype)
+            # float32はcacheを指定しても同じため、指定しない場合だけ測る
+            for cache in ((False,) if dtype == 'float32' else (False, True)):
+                (model, load_times) = measure_load(path, cache, args.repeat)
+                infer_times = np.empty(args.repeat)
+                for i in range(args.repeat):
+                    start = time.perf_counter()
+                    model(inputs[:1])
+                    infer_times[i] = (time.perf_counter() - start) * 1000
+                peak = measure_peak(lambda: model(inputs[:1]))
+                scores = model(inputs)
+                numbers = np.argmax(scores, axis=1) + 1
+                print("{:<8} {:>6} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.2f} {:>10.2f} {:>5}/{:<2} {:>5}/{:<2} {:>10.4f}"
+                      .format(dtype, str(cache), os.path.getsize(path) / 1024, model.nbytes / 1024, peak,
+                              np.percentile(load_times, 50), np.percentile(infer_times, 50),
+                              int((numbers == labels).sum()), len(labels),
+                              int((numbers == np.argmax(expected, axis=1) + 1).sum()), len(labels),
+                              float(np.abs(scores - expected).max())))
+    print("\nmemory: 重み・バイアス・スケールのメモリ  peak: 1枚の推論中に確保したメモリの最大")
+    print("一致数: float32と同じ数字を認識した画像の数  スコアの差: float32とのスコアの差の最大")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+@file: bench_parallel_classification.py
+@brief: ブロックの色識別(BlockRecognizer.classify_frame)を、スレッド数を変えて並列に行った場合の処理時間を比較する
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=. python benchmark/bench_parallel_classification.py --workers 1 2 4 8
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from benchmark import corpus
+from detection_block.BlockRecognizer import BlockRecognizer
+
+
+def measure(func, repeat):
+    """
+    funcをrepeat回実行し、1回あたりの処理時間[ms]の配列を返す
+    """
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times[i] = (time.perf_counter() - start) * 1000
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=corpus.DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--chunk-size', type=int, default=6)
+    parser.add_argument('--method', choices=BlockRecognizer.METHODS, default='histogram')
+    parser.add_argument('--cv-threads', type=int, default=None,
+                        help='OpenCV内部のスレッド数(cv2.setNumThreads)。1にするとスレッドプールだけの効果を計測できる')
+    args = parser.parse_args()
+
+    if args.cv_threads is not None:
+        cv2.setNumThreads(args.cv_threads)
+    print("CPU数: {}, OpenCVのスレッド数: {}".format(os.cpu_count(), cv2.getNumThreads()))
+    print("{:<16} {:>8} {:>12} {:>8} {:>10}".format("image", "workers", "median[ms]", "speedup", "identical"))
+    for entry in corpus.load_corpus(args.corpus):
+        img = corpus.read_image(entry)
+        if img is None:
+            print("{:<16} 画像（{}）を開けません".format(entry["name"], entry["image"]))
+            continue
+        img = corpus.clip(entry, img)
+        coordinates = corpus.circles_coordinates(entry)
+        keys = list(coordinates.keys())
+
+        # 並列化しない場合を基準にする
+        serial = BlockRecognizer(1, True, method=args.method)
+        expected = serial.classify_frame(img, coordinates, keys)
+        base = np.median(measure(lambda: serial.classify_frame(img, coordinates, keys), args.repeat))
+        print("{:<16} {:>8} {:>12.3f} {:>7.1f}x {:>10}".format(entry["name"], "serial", base, 1.0, "True"))
+
+        for workers in args.workers:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                recognizer = BlockRecognizer(1, True, method=args.method, executor=executor,
+                                             chunk_size=args.chunk_size)
+                result = recognizer.classify_frame(img, coordinates, keys)
+                identical = all(result[key].color == expected[key].color for key in keys)
+                median = np.median(measure(lambda: recognizer.classify_frame(img, coordinates, keys), args.repeat))
+            print("{:<16} {:>8} {:>12.3f} {:>7.1f}x {:>10}".format(
+                entry["name"], workers, median, base / median, str(identical)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+@file: bench_recognition.py
+@brief: corpus.jsonの全画像について、ブロックビンゴエリアの切り取りからブロックの色識別までを行い、
+        処理ごとの処理時間の分布・メモリ確保量と、色ごとの混同行列を識別方法の設定ごとに出力する
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=. python benchmark/bench_recognition.py
+    $ PYTHONPATH=. python benchmark/bench_recognition.py --method lookup_table --json result.json
+"""
+import argparse
+import itertools
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmark import corpus
+from detection_block.BlockRecognizer import BlockRecognizer
+from detection_block.HistogramBank import HistogramBank
+
+
+COLORS = HistogramBank.SAMPLE_COLORS
+PERCENTILES = (50, 90, 99)
+# classify_frameは切り取った画像からの識別全体(BlockRecognizer.recognizeから識別結果の変換を除いたもの)。
+# white_balance, preprocess, classifyはその内訳
+STAGES = ('clip', 'white_balance', 'preprocess', 'classify', 'classify_frame')
+
+
+def create_stages(recognizer, entry, raw):
+    """
+    1枚の画像に対する処理を、(処理の名前, 関数)のリストとして返す
+
+    各関数は、それまでの処理の結果の辞書を受け取る。
+    white_balance, preprocess, classifyはBlockRecognizer.classify_frameと同じ手順で行う。
+    """
+    coordinates = corpus.circles_coordinates(entry)
+    keys = list(coordinates.keys())
+    points = [coordinates[key] for key in keys]
+
+    def white_balance(results):
+        if recognizer.white_balance is None:
+            return results['clip']
+        return recognizer.white_balance.apply(results['clip'], recognizer.white_points(coordinates))[0]
+
+    return [
+        ('clip', lambda results: corpus.clip(entry, raw)),
+        ('white_balance', white_balance),
+        ('preprocess',
+         lambda results: recognizer.extractor.preprocess(results['white_balance'], points, roi=recognizer.roi)),
+        ('classify', lambda results: recognizer.classify_circles(results['preprocess'], coordinates, keys)),
+        ('classify_frame', lambda results: recognizer.classify_frame(results['clip'], coordinates, keys)),
+    ]
+
+
+def measure_times(stages):
+    """
+    各処理を1回ずつ実行し、処理ごとの処理時間[ms]を返す
+    """
+    times = {}
+    results = {}
+    for (name, func) in stages:
+        start = time.perf_counter()
+        results[name] = func(results)
+        times[name] = (time.perf_counter() - start) * 1000
+    return times
+
+
+def measure_allocations(stages):
+    """
+    各処理を1回ずつ実行し、処理ごとのメモリ確保量の最大値[KiB]を返す
+
+    tracemallocで追跡できる確保(PythonのオブジェクトとNumPyの配列)のみを数える。
+    処理ごとに追跡を開始し直すため、それ以前の処理で確保したメモリは数えない。
+    """
+    allocations = {}
+    results = {}
+    for (name, func) in stages:
+        tracemalloc.start()
+        try:
+            results[name] = func(results)
+            allocations[name] = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+    return allocations
+
+
+def confusion_matrix(recognizer, entry, clipped):
+    """
+    1枚の画像について、色ごとの混同行列を返す。行が正解の色、列が識別した色(並びはCOLORSの順)
+    """
+    labels = corpus.labels(entry)
+    matrix = np.zeros((len(COLORS), len(COLORS)), dtype=np.int64)
+    if len(labels) == 0:
+        return matrix
+    coordinates = corpus.circles_coordinates(entry)
+    # ブロックサークルにブロックがない画像ではrecognizeの結果を作れないため、classify_frameの結果を使う
+    classifications = recognizer.classify_frame(clipped, coordinates, list(labels.keys()))
+    for (key, color) in labels.items():
+        matrix[COLORS.index(color), COLORS.index(classifications[key].color)] += 1
+    return matrix
+
+
+def evaluate(recognizer, entries, repeat):
+    """
+    1つの設定について、全画像の処理時間・メモリ確保量・混同行列を求める
+    """
+    times = {name: [] for name in STAGES}
+    allocations = {name: 0.0 for name in STAGES}
+    matrix = np.zeros((len(COLORS), len(COLORS)), dtype=np.int64)
+    errors = []
+    for (entry, raw) in entries:
+        stages = create_stages(recognizer, entry, raw)
+        # 初回の実行(サンプル画像の読み込みなど)は計測に含めない
+        measure_times(stages)
+        for _ in range(repeat):
+            for (name, value) in measure_times(stages).items():
+                times[name].append(value)
+        for (name, value) in measure_allocations(stages).items():
+            allocations[name] = max(allocations[name], value)
+
+        entry_matrix = confusion_matrix(recognizer, entry, corpus.clip(entry, raw))
+        matrix += entry_matrix
+        if entry_matrix.trace() != entry_matrix.sum():
+            errors.append((entry["name"], int(entry_matrix.sum() - entry_matrix.trace())))
+
+    return {
+        'latency': {name: dict(zip(['p{}'.format(p) for p in PERCENTILES],
+                                   np.percentile(values, PERCENTILES).tolist()))
+                    for (name, values) in times.items()},
+        'allocation_kib': allocations,
+        'confusion_matrix': matrix.tolist(),
+        'accuracy': float(matrix.trace() / max(matrix.sum(), 1)),
+        'errors': errors,
+    }
+
+
+def print_result(config, result):
+    """
+    1つの設定の結果を表示する
+    """
+    print("== {} ==".format(", ".join("{}={}".format(key, value) for (key, value) in config.items())))
+    header = "".join("{:>10}".format("p{}[ms]".format(p)) for p in PERCENTILES)
+    print("{:<14}{}{:>12}".format("stage", header, "alloc[KiB]"))
+    for name in STAGES:
+        latency = result['latency'][name]
+        values = "".join("{:>10.3f}".format(latency['p{}'.format(p)]) for p in PERCENTILES)
+        print("{:<14}{}{:>12.1f}".format(name, values, result['allocation_kib'][name]))
+
+    print("混同行列(行: 正解, 列: 識別結果)  正解率: {:.3f}".format(result['accuracy']))
+    print("{:<8}".format("") + "".join("{:>8}".format(color.name) for color in COLORS))
+    for (color, row) in zip(COLORS, result['confusion_matrix']):
+        print("{:<8}".format(color.name) + "".join("{:>8}".format(value) for value in row))
+    for (name, count) in result['errors']:
+        print("  {}: {}個のサークルを誤識別".format(name, count))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=corpus.DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--method', choices=BlockRecognizer.METHODS, nargs='+', default=list(BlockRecognizer.METHODS))
+    parser.add_argument('--json', default=None, help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+
+    entries = []
+    for entry in corpus.load_corpus(args.corpus):
+        raw = corpus.read_image(entry)
+        if raw is None:
+            print("画像（{}）を開けません".format(entry["image"]))
+            continue
+        entries.append((entry, raw))
+    print("画像数: {}, 繰り返し回数: {}\n".format(len(entries), args.repeat))
+
+    results = []
+    for (method, roi, white_balance) in itertools.product(args.method, (True, False), (True, False)):
+        config = {'method': method, 'roi': roi, 'white_balance': white_balance}
+        recognizer = BlockRecognizer(1, True, method=method, roi=roi, white_balance=white_balance)
+        result = evaluate(recognizer, entries, args.repeat)
+        print_result(config, result)
+        results.append(dict(config, **result))
+
+    if args.json is not None:
+        with open(args.json, mode='w') as fp:
+            json.dump({'corpus': args.corpus, 'repeat': args.repeat, 'results': results}, fp, indent=4)
+
+
+if __name__ == '__main__':
+    main()
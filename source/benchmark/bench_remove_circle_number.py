@@ -0,0 +1,58 @@
+"""
+@file: bench_remove_circle_number.py
+@brief: ブロックサークルの数字の削除を画像全体で行う場合と、各サークルの周辺だけで行う場合の処理時間を比較する
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=. python benchmark/bench_remove_circle_number.py
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmark import corpus
+from detection_block.BlockRecognizer import BlockExtractor
+
+
+def measure(func, repeat):
+    """
+    funcをrepeat回実行し、1回あたりの処理時間[ms]の配列を返す
+    """
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times[i] = (time.perf_counter() - start) * 1000
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=corpus.DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    extractor = BlockExtractor()
+    print("{:<16} {:>12} {:>12} {:>8} {:>10}".format("image", "full[ms]", "roi[ms]", "speedup", "identical"))
+    for entry in corpus.load_corpus(args.corpus):
+        img = corpus.read_image(entry)
+        if img is None:
+            print("{:<16} 画像（{}）を開けません".format(entry["name"], entry["image"]))
+            continue
+        img = corpus.clip(entry, img)
+        points = list(corpus.circles_coordinates(entry).values())
+
+        # 切り取る範囲の画素が一致するかを確かめる
+        full = extractor.preprocess(img, points, roi=False)
+        roi = extractor.preprocess(img, points)
+        identical = all((extractor.trim(full, point) == extractor.trim(roi, point)).all() for point in points)
+
+        full_times = measure(lambda: extractor.preprocess(img, points, roi=False), args.repeat)
+        roi_times = measure(lambda: extractor.preprocess(img, points), args.repeat)
+        print("{:<16} {:>12.3f} {:>12.3f} {:>7.1f}x {:>10}".format(
+            entry["name"], np.median(full_times), np.median(roi_times),
+            np.median(full_times) / np.median(roi_times), str(identical)))
+
+
+if __name__ == '__main__':
+    main()
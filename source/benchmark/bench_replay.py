@@ -0,0 +1,182 @@
+"""
+@file: bench_replay.py
+@brief: 録画したスナップショットをCameraの取得元(capture/FrameSource.py)として、できるだけ速く再生し、
+        キャプチャから認識までのスループットをオフラインで測る
+
+sourceディレクトリで実行する(pipelineはCameraSystemを読み込むため、detection_numberとblock_bingoもPYTHONPATHに加える)
+    $ PYTHONPATH=. python benchmark/bench_replay.py block number
+    $ PYTHONPATH=.:detection_number:block_bingo python benchmark/bench_replay.py pipeline
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+
+import numpy as np
+
+from benchmark import corpus
+from Camera import Camera
+from capture.DebugImageWriter import DebugImageWriter
+from capture.FrameSource import DirectorySource, ImageFileSource
+from detection_block.BlockRecognizer import BlockRecognizer
+
+
+# CameraSystemと同じく、余白100pxを付けた画像で切り取る座標を指定する
+PADDING = 100
+# test_Camera.pyと同じ数字カードの切り取り範囲(余白100pxを付けた画像の座標)
+NUMBER_IMG_RANGE = {"l_top": [18, 599], "l_btm": [226, 797], "r_top": [232, 468], "r_btm": [488, 590]}
+
+
+def percentiles(times):
+    return "p50 {:7.2f}ms  p90 {:7.2f}ms".format(np.percentile(times, 50), np.percentile(times, 90))
+
+
+def padded_range(img_range, padding=PADDING):
+    """
+    余白なしの画像の座標を、余白を付けた画像の座標にする
+    """
+    return {key: [x + padding, y + padding] for (key, (x, y)) in img_range.items()}
+
+
+def replay(camera, frames, stages):
+    """
+    取得元の画像をframes枚キャプチャし、段階ごとの処理時間[ms]と全体のスループット[枚/秒]を返す
+
+    Parameters
+    ----------
+    stages: list
+        (段階の名前, 関数)のリスト。関数は前の段階の戻り値を受け取る(最初の段階はNone)
+    """
+    times = {name: np.empty(frames) for (name, _) in [("capture", None)] + stages}
+    start = time.perf_counter()
+    for i in range(frames):
+        t = time.perf_counter()
+        camera.capture(padding=PADDING)
+        times["capture"][i] = (time.perf_counter() - t) * 1000
+        value = None
+        for (name, stage) in stages:
+            t = time.perf_counter()
+            value = stage(value)
+            times[name][i] = (time.perf_counter() - t) * 1000
+    return (times, frames / (time.perf_counter() - start))
+
+
+def replay_camera(source):
+    # 再生する画像はデバッグ用に保存しない
+    return Camera(source=source, debug_writer=DebugImageWriter(enabled=False))
+
+
+def bench_block(args):
+    entries = {os.path.normpath(entry["image"]): entry for entry in corpus.load_corpus(args.corpus)
+               if "block_bingo_img_range" in entry}
+    source = DirectorySource(args.block_dir, patterns=["snapshot_*.jpg"], loop=True, preload=args.preload)
+    camera = replay_camera(source)
+    recognizer = BlockRecognizer(5, True)
+    keys = recognizer.BLOCK_CIRCLES + [key for (key, _) in recognizer.CROSS_CIRCLES]
+    errors = []
+
+    def clip(_):
+        entry = entries[os.path.normpath(source.path)]
+        camera.block_bingo_img_range = padded_range(entry["block_bingo_img_range"])
+        return (entry, camera.get_block_bingo_img(is_debug=False))
+
+    def classify(value):
+        (entry, img) = value
+        classifications = recognizer.classify_frame(img, corpus.circles_coordinates(entry), keys)
+        labels = corpus.labels(entry)
+        errors.append(sum(classifications[key].color != color for (key, color) in labels.items()))
+
+    print("block: {} ({}枚, preload={})".format(args.block_dir, len(source), args.preload))
+    (times, throughput) = replay(camera, args.frames, [("clip", clip), ("classify", classify)])
+    print_result(times, throughput)
+    print("  誤認識: {}サークル/{}枚".format(sum(errors), len(errors)))
+
+
+def bench_number(args):
+    source = DirectorySource(args.number_dir, patterns=["snapshot_*.jpg"], loop=True, preload=args.preload)
+    camera = replay_camera(source)
+    camera.number_img_range = NUMBER_IMG_RANGE
+    # CameraSystemと同じく、ずらして切り取った複数の画像をまとめて認識する
+    stages = [("clip", lambda _: camera.get_number_imgs(is_debug=False))]
+    try:
+        if args.number_engine == 'chainer':
+            from detection_number.DetectionNumber import DetectionNumber
+        else:
+            from detection_number.NumpyDetectionNumber import NumpyDetectionNumber as DetectionNumber
+        detection_number = DetectionNumber(model_path=args.number_model)
+    except (ImportError, OSError) as error:
+        # 学習済みモデルや依存ライブラリがない場合は、切り取りまでを測る
+        print("数字の認識は測りません({}: {})".format(type(error).__name__, error))
+    else:
+        def detect(imgs):
+            return detection_number.get_detect_number_batch(imgs)
+        stages.append(("detect", detect))
+
+    print("number: {} ({}枚, preload={}, engine={})".format(args.number_dir, len(source), args.preload,
+                                                           args.number_engine))
+    (times, throughput) = replay(camera, args.frames, stages)
+    print_result(times, throughput)
+
+
+def bench_pipeline(args):
+    from CameraSystem import CameraSystem
+
+    entries = [entry for entry in corpus.load_corpus(args.corpus)
+               if "block_bingo_img_range" in entry and any(name != "WHITE" for name in entry["labels"].values())]
+    print("pipeline: CameraSystemのブロック認識から運搬経路の計算まで(ボーナスサークル{}、{}コース)".format(
+        args.bonus, "L" if args.left else "R"))
+    for entry in entries:
+        # 同じスナップショットを繰り返しキャプチャする(多数決に使う画像も同じになる)
+        with contextlib.redirect_stdout(io.StringIO()):
+            system = CameraSystem(url=entry["image"])
+            system.camera  # カメラの準備(別スレッド)が終わるまで待つ
+        system.camera.source = ImageFileSource(entry["image"])
+        system.camera.debug_writer.enabled = False
+        system.camera.block_bingo_img_range = padded_range(entry["block_bingo_img_range"])
+        system.camera.block_bingo_circle_coordinates = corpus.circles_coordinates(entry)
+        system.camera.capture(padding=PADDING)
+        times = np.empty(args.repeat)
+        commands = None
+        try:
+            for i in range(args.repeat):
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    commands = system._path_planning(args.bonus, args.left)
+                times[i] = (time.perf_counter() - start) * 1000
+        except Exception as error:
+            print("  {:<18} 失敗 ({}: {})".format(entry["name"], type(error).__name__, error))
+            continue
+        print("  {:<18} {}  コマンド{}個".format(entry["name"], percentiles(times), len(commands)))
+
+
+def print_result(times, throughput):
+    for (name, values) in times.items():
+        print("  {:<10} {}".format(name, percentiles(values)))
+    print("  スループット: {:.1f}枚/秒".format(throughput))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('targets', nargs='*', choices=['block', 'number', 'pipeline'], default=['block', 'number'])
+    parser.add_argument('--corpus', default=corpus.DEFAULT_CORPUS)
+    parser.add_argument('--block-dir', default='detection_block/data')
+    parser.add_argument('--number-dir', default='detection_number/imgs/shisou1')
+    parser.add_argument('--number-model', default='./detection_number/my_model.npz')
+    parser.add_argument('--number-engine', choices=['numpy', 'chainer'], default='numpy',
+                        help='数字の認識に使う推論の実装(CameraSystemはnumpy)')
+    parser.add_argument('--frames', type=int, default=60, help='キャプチャする画像の数(スナップショットは繰り返し再生する)')
+    parser.add_argument('--preload', action='store_true', help='画像の読み込み時間を含めない')
+    parser.add_argument('--repeat', type=int, default=3, help='pipelineの繰り返し回数')
+    parser.add_argument('--bonus', type=int, default=5, help='pipelineのボーナスサークル番号')
+    parser.add_argument('--right', dest='left', action='store_false', help='pipelineをRコースで計算する')
+    args = parser.parse_args()
+
+    benches = {'block': bench_block, 'number': bench_number, 'pipeline': bench_pipeline}
+    for target in args.targets:
+        benches[target](args)
+        print()
+
+
+if __name__ == '__main__':
+    main()
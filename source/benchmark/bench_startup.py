@@ -0,0 +1,136 @@
+"""
+@file: bench_startup.py
+@brief: CameraSystemを起動してから最初の質問を表示するまでの時間と、各モジュールの読み込み時間を測る
+
+起動するたびに新しいPythonのプロセスで測る(読み込み済みのモジュールの影響を受けないように)。
+2回目以降はファイルがOSのキャッシュに載るため、初回より速くなる点に注意する。
+
+sourceディレクトリで実行する
+    $ PYTHONPATH=.:detection_number:block_bingo python benchmark/bench_startup.py
+"""
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# 最初の質問(input)を表示した時点で、各段階の時刻を出力して終了する
+FIRST_PROMPT_CODE = """
+import builtins, json, os, sys, time
+start = time.perf_counter()
+from CameraSystem import CameraSystem
+imported = time.perf_counter()
+system = CameraSystem(url=sys.argv[1])
+created = time.perf_counter()
+
+def first_prompt(prompt=""):
+    prompted = time.perf_counter()
+    system.camera  # カメラの準備(別スレッド)が終わるまで待つ
+    ready = time.perf_counter()
+    sys.__stdout__.write("STARTUP " + json.dumps({
+        "import": imported - start, "init": created - imported, "prompt": prompted - start,
+        "camera": ready - start}) + "\\n")
+    sys.__stdout__.flush()
+    os._exit(0)
+
+builtins.input = first_prompt
+system.start()
+"""
+
+# 読み込み時間を測るモジュール(CameraSystemが最初の質問までに読み込むものと、別スレッドや使う時に読み込むもの)
+MODULES = ["CameraSystem", "Camera", "detection_number.NumpyDetectionNumber", "detection_block.BlockRecognizer",
+           "block_bingo.BlockBingoSolver", "bluetooth.Bluetooth", "decision_points.MoveGetCirclePoint",
+           "detection_number.DetectionNumber"]
+
+
+def run_python(args, timeout=120):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([".", "detection_number", "block_bingo"]))
+    return subprocess.run([sys.executable] + args, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, timeout=timeout)
+
+
+def measure_first_prompt(url):
+    """
+    プロセスを起動してから最初の質問を表示するまでの時間などを測る(単位：ms)
+    """
+    start = time.perf_counter()
+    result = run_python(["-c", FIRST_PROMPT_CODE, url])
+    elapsed = time.perf_counter() - start
+    lines = [line for line in result.stdout.splitlines() if line.startswith("STARTUP ")]
+    if not lines:
+        raise RuntimeError("最初の質問を表示できませんでした\n" + result.stderr)
+    times = {key: value * 1000 for (key, value) in json.loads(lines[-1][len("STARTUP "):]).items()}
+    times["process"] = elapsed * 1000
+    return times
+
+
+def measure_import(module):
+    """
+    python -X importtimeでモジュールを読み込み、全体の時間と、パッケージごとの時間(単位：ms)を返す
+    """
+    result = run_python(["-X", "importtime", "-c", "import " + module])
+    if result.returncode != 0:
+        return (None, {})
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        (self_time, cumulative, name) = line[len("import time:"):].split("|")
+        if self_time.strip().isdigit():  # 見出しの行は読み飛ばす
+            rows.append((int(self_time) / 1000, int(cumulative) / 1000, name))
+    # importtimeは読み込みが終わった順に出力するため、moduleの行の直前に、moduleから読み込んだモジュールが並ぶ
+    # (それより前のインデントのない行までは、インタプリタの起動時に読み込んだモジュール)
+    end = max(i for (i, row) in enumerate(rows) if row[2].strip() == module)
+    indent = len(rows[end][2]) - len(rows[end][2].lstrip())
+    begin = end
+    while begin > 0 and len(rows[begin - 1][2]) - len(rows[begin - 1][2].lstrip()) > indent:
+        begin -= 1
+    total = rows[end][1]
+    packages = collections.Counter()
+    for (self_time, _, name) in rows[begin:end + 1]:
+        # パッケージごとに、各モジュール自身の読み込み時間を合計する
+        packages[name.strip().split(".")[0]] += self_time
+    return (total, packages)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='./img/sample_camera_area.jpg', help='CameraSystemに渡す映像配信URL・画像')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='モジュールごとに表示するパッケージの数')
+    parser.add_argument('--json', help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+
+    print("最初の質問まで({}回、中央値)".format(args.repeat))
+    runs = [measure_first_prompt(args.url) for _ in range(args.repeat)]
+    startup = {key: float(np.median([run[key] for run in runs])) for key in runs[0]}
+    for (key, label) in [("process", "プロセスの起動から最初の質問まで"), ("import", "import CameraSystem"),
+                         ("init", "CameraSystem()"), ("prompt", "import CameraSystemから最初の質問まで"),
+                         ("camera", "import CameraSystemからカメラの準備が終わるまで(別スレッド)")]:
+        print("  {:<44} {:>8.1f}ms".format(label, startup[key]))
+
+    print("\nモジュールの読み込み時間({}回、中央値)".format(args.repeat))
+    imports = {}
+    for module in MODULES:
+        measured = [measure_import(module) for _ in range(args.repeat)]
+        if measured[0][0] is None:
+            print("  {:<40} 読み込めません".format(module))
+            continue
+        packages = collections.Counter({name: float(np.median([m[1][name] for m in measured]))
+                                        for name in measured[0][1]})
+        imports[module] = {"total": float(np.median([m[0] for m in measured])),
+                           "packages": dict(packages.most_common(args.top))}
+        print("  {:<40} {:>8.1f}ms  ({})".format(module, imports[module]["total"], ", ".join(
+            "{} {:.1f}".format(name, value) for (name, value) in packages.most_common(args.top))))
+
+    if args.json:
+        with open(args.json, mode='w') as fp:
+            json.dump({"startup": startup, "imports": imports}, fp, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
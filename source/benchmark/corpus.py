@@ -0,0 +1,63 @@
+"""
+@file: corpus.py
+@brief: ベンチマークで使う画像と正解データ(detection_block/data/corpus.json)を読み込む
+
+corpus.jsonの各画像は以下の項目を持つ
+    name: 画像の名前
+    image: 画像のパス(sourceディレクトリからの相対パス)
+    block_bingo_img_range: カメラ画像からブロックビンゴエリアを切り取る座標(余白なし)。
+                           ない場合はimageを切り取り済みの画像(640x640)として扱う
+    circles_coordinates: 切り取った画像における各サークルの座標
+    labels: 各サークル上のブロックの色(ブロックがない場合はWHITE)
+"""
+import json
+
+import cv2
+
+from Camera import Camera
+from block_bingo.BlockBingoCoordinate import Color
+
+
+DEFAULT_CORPUS = 'detection_block/data/corpus.json'
+BLOCK_BINGO_IMG_SIZE = (640, 640)
+
+
+def load_corpus(path=DEFAULT_CORPUS):
+    """
+    corpus.jsonを読み込み、画像ごとの辞書のリストを返す
+    """
+    with open(path, mode='r') as fp:
+        return json.load(fp)["images"]
+
+
+def read_image(entry):
+    """
+    画像を読み込む。読み込めない場合はNoneを返す
+    """
+    return cv2.imread(entry["image"])
+
+
+def clip(entry, img):
+    """
+    カメラ画像からブロックビンゴエリアを切り取る。切り取り済みの画像の場合はそのまま返す
+    """
+    img_range = entry.get("block_bingo_img_range")
+    if img_range is None:
+        return img
+    return Camera.clip(img, output_size=BLOCK_BINGO_IMG_SIZE,
+                       l_top=img_range["l_top"], l_btm=img_range["l_btm"],
+                       r_btm=img_range["r_btm"], r_top=img_range["r_top"])
+
+
+def circles_coordinates(entry):
+    """
+    各サークルの座標を、BlockRecognizerに渡せる形式(キーと(x, y)の辞書)で返す
+    """
+    return {key: tuple(point) for (key, point) in entry["circles_coordinates"].items()}
+
+
+def labels(entry):
+    """
+    各サークルの正解の色を返す。正解データがない場合は空の辞書を返す
+    """
+    return {key: Color[name] for (key, name) in entry.get("labels", {}).items()}
@@ -0,0 +1,168 @@
+"""
+@file: DebugImageWriter.py
+@brief: デバッグ用の画像を別スレッドでファイルに保存する
+"""
+import atexit
+import collections
+import os
+import threading
+import weakref
+
+import cv2
+import numpy as np
+
+
+class DebugImageWriter:
+    """
+    デバッグ用の画像の保存を、呼び出し元を待たせずに別スレッドで行うクラス。
+
+    保存待ちの画像は最大max_queue_size枚まで保持し、それを超えた場合は古い画像から捨てる。
+    enabledをFalseにすると何も保存しない(本番では保存しない)。
+
+    画像の形式
+        png: PNG(圧縮レベルはpng_compression。0が最速)
+        jpg: JPEG(画質はjpeg_quality)。PNGより速い
+        npy: NumPyの配列をそのまま保存する。圧縮しないため最も速い
+    """
+    FORMATS = ('png', 'jpg', 'npy')
+
+    # 保存用のスレッドを開始したインスタンス(終了時に保存待ちの画像を保存してからスレッドを終了する)
+    _writers = weakref.WeakSet()
+
+    def __init__(self, enabled=True, image_format='png', max_queue_size=4, jpeg_quality=90, png_compression=1):
+        """
+        Parameters
+        ----------
+        enabled: bool
+            Falseの場合は画像を保存しない
+        image_format: str
+            保存する形式。FORMATSのいずれか(ファイルの拡張子はこの形式に置き換える)
+        max_queue_size: int
+            保存待ちにできる画像の数
+        jpeg_quality: int
+            JPEGの画質(0~100)
+        png_compression: int
+            PNGの圧縮レベル(0~9)
+        """
+        if image_format not in self.FORMATS:
+            raise ValueError('Unknown image format: {}'.format(image_format))
+        self.enabled = enabled
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+        self.png_compression = png_compression
+        self.queue = collections.deque(maxlen=max_queue_size)  # 保存待ちの(パス, 画像)
+        self.written_count = 0  # 保存した画像の数
+        self.dropped_count = 0  # 保存待ちが一杯で捨てた画像の数
+        self.failed_count = 0  # 保存に失敗した画像の数
+        self._writing = False  # 保存中の画像があるかどうか
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def write(self, path, img, copy=False):
+        """
+        画像を保存待ちに加える。保存は別スレッドで行う
+
+        Parameters
+        ----------
+        path: str
+            保存先のパス(拡張子はimage_formatに置き換える)
+        img: numpy.ndarray
+            保存する画像
+        copy: bool
+            Trueの場合は画像を複製してから保存待ちに加える(保存前に画像を書き換える場合に使う)
+
+        Returns
+        -------
+        queued: bool
+            保存待ちに加えた場合はTrue。enabledがFalseの場合や、終了後はFalse
+        """
+        if not self.enabled or img is None:
+            return False
+        if copy:
+            img = img.copy()
+        with self._condition:
+            if self._closed:
+                return False
+            if len(self.queue) == self.queue.maxlen:
+                # 一番古い画像は、deque(maxlen)により自動で捨てられる
+                self.dropped_count += 1
+            self.queue.append((self.file_name(path), img))
+            self._start()
+            self._condition.notify_all()
+        return True
+
+    def file_name(self, path):
+        """
+        保存先のパスの拡張子をimage_formatに置き換える
+        """
+        return os.path.splitext(path)[0] + '.' + self.image_format
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="DebugImageWriter", daemon=True)
+            self._thread.start()
+            self._writers.add(self)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self.queue) > 0 or self._closed)
+                if len(self.queue) == 0:
+                    return
+                (path, img) = self.queue.popleft()
+                self._writing = True
+            try:
+                saved = self.save(path, img)
+            except (OSError, cv2.error):
+                saved = False
+            with self._condition:
+                self._writing = False
+                if saved:
+                    self.written_count += 1
+                else:
+                    self.failed_count += 1
+                    print("デバッグ用の画像（{}）を保存できませんでした".format(path))
+                self._condition.notify_all()
+
+    def save(self, path, img):
+        """
+        画像をimage_formatの形式で保存する(呼び出したスレッドで保存する)
+        """
+        if self.image_format == 'npy':
+            np.save(path, img)
+            return True
+        if self.image_format == 'jpg':
+            return cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return cv2.imwrite(path, img, [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression])
+
+    def flush(self, timeout=None):
+        """
+        保存待ちの画像をすべて保存するまで待つ
+
+        Returns
+        -------
+        flushed: bool
+            timeout秒以内にすべて保存した場合はTrue
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.queue) == 0 and not self._writing, timeout)
+
+    def close(self, timeout=None):
+        """
+        保存待ちの画像をすべて保存してから、保存用のスレッドを終了する
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @classmethod
+    def _close_all(cls):
+        # NOTE: 保存中(cv2.imwriteの実行中)にインタプリタが終了するとプロセスが異常終了するため、終了前に待つ
+        for writer in list(cls._writers):
+            writer.close()
+
+
+atexit.register(DebugImageWriter._close_all)
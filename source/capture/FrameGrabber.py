@@ -0,0 +1,170 @@
+"""
+@file: FrameGrabber.py
+@brief: カメラの映像配信に接続し続け、バックグラウンドで最新の画像を受信し続ける
+"""
+import collections
+import threading
+import time
+
+import cv2
+
+
+class FrameGrabber:
+    """
+    映像配信(mjpg-streamer)への接続を保ったまま、別スレッドで画像を受信し続けるクラス。
+
+    受信した画像は、受信時刻(time.monotonic)と組にして小さなリングバッファに保持する。
+    接続が切れた場合や画像を受信できなかった場合は、reconnect_interval秒後に自動で接続し直す。
+
+    使い方
+        grabber = FrameGrabber("http://raspberrypi.local/?action=stream").start()
+        img = grabber.latest_frame(timeout=1.0)
+        grabber.stop()
+    """
+    is_live = True  # 映像配信かどうか（FrameSource.is_liveと同じ）
+
+    def __init__(self, url, buffer_size=4, reconnect_interval=1.0, open_capture=None):
+        """
+        Parameters
+        ----------
+        url: str
+            映像配信URL
+        buffer_size: int
+            保持する画像の数
+        reconnect_interval: float
+            接続し直すまでの待ち時間(秒)
+        open_capture: callable
+            URLを受け取り、cv2.VideoCaptureと同じread/isOpened/releaseを持つオブジェクトを返す関数。
+            Noneの場合はcv2.VideoCaptureで接続する
+        """
+        self.url = url
+        self.reconnect_interval = reconnect_interval
+        self.open_capture = self.open_video_capture if open_capture is None else open_capture
+        self.frames = collections.deque(maxlen=buffer_size)  # (受信時刻, 画像)のリスト
+        self.frame_count = 0  # 受信した画像の総数
+        self.reconnect_count = 0  # 接続し直した回数
+        self.is_connected = False
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def open_video_capture(url):
+        """
+        cv2.VideoCaptureで映像配信に接続する
+        """
+        cap = cv2.VideoCapture(url)
+        # カメラFPSを30FPSに設定
+        cap.set(cv2.CAP_PROP_FPS, 30)
+        # カメラ画像の横幅を1280に設定
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        # カメラ画像の縦幅を720に設定
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        return cap
+
+    def start(self):
+        """
+        画像の受信を開始する。既に開始している場合は何もしない
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="FrameGrabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        画像の受信を終了し、接続を閉じる
+        """
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        cap = None
+        try:
+            while not self._stop_event.is_set():
+                if cap is None:
+                    cap = self.open_capture(self.url)
+                    if not cap.isOpened():
+                        cap = self._disconnect(cap)
+                        continue
+                    self.is_connected = True
+
+                ret, img = cap.read()
+                if not ret or img is None:
+                    cap = self._disconnect(cap)
+                    continue
+
+                with self._condition:
+                    self.frames.append((time.monotonic(), img))
+                    self.frame_count += 1
+                    self._condition.notify_all()
+        finally:
+            if cap is not None:
+                cap.release()
+            self.is_connected = False
+
+    def _disconnect(self, cap):
+        # 接続を閉じ、少し待ってから接続し直す
+        cap.release()
+        self.is_connected = False
+        self.reconnect_count += 1
+        self._stop_event.wait(self.reconnect_interval)
+        return None
+
+    def latest_frame(self, after=None, timeout=None):
+        """
+        最新の画像を返す
+
+        Parameters
+        ----------
+        after: float
+            この時刻(time.monotonic)より後に受信した画像を返す。Noneの場合は受信時刻を問わない
+        timeout: float
+            条件に合う画像を受信するまで待つ時間(秒)。Noneの場合は待たない
+
+        Returns
+        -------
+        img: numpy.ndarray
+            最新の画像。条件に合う画像がない場合はNone
+        """
+        frame = self.latest(after, timeout)
+        return None if frame is None else frame[1]
+
+    def latest(self, after=None, timeout=None):
+        """
+        latest_frameと同じ条件で、最新の(受信時刻, 画像)を返す
+        """
+        def available():
+            return len(self.frames) > 0 and (after is None or self.frames[-1][0] > after)
+
+        with self._condition:
+            if not available() and timeout is not None:
+                self._condition.wait_for(lambda: available() or self._stop_event.is_set(), timeout)
+            if not available():
+                return None
+            return self.frames[-1]
+
+    def frames_since(self, t):
+        """
+        時刻t(time.monotonic)より後に受信した画像を、(受信時刻, 画像)のリストとして古い順に返す
+
+        リングバッファに残っている画像だけを返すため、最大でbuffer_size枚になる。
+        """
+        with self._condition:
+            return [(timestamp, img) for (timestamp, img) in self.frames if timestamp > t]
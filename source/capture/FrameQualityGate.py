@@ -0,0 +1,94 @@
+"""
+@file: FrameQualityGate.py
+@brief: キャプチャした画像がぼやけていないか、明るすぎ・暗すぎないか、復号が途中で切れていないかを調べる
+"""
+import cv2
+import numpy as np
+
+
+class FrameQualityGate:
+    """
+    縮小した画像で、認識に使えるかどうかを1ms程度で調べるクラス。
+
+    - 鮮明さ: ラプラシアンの分散(ぼやけると小さくなる)
+    - 明るさ: 輝度の平均と、白飛び・黒つぶれした画素の割合
+    - 復号の途切れ: JPEGの受信が途中で切れると、復号できた所から下は同じ行が続くため、画像の下端で同じ行が続く割合
+
+    閾値はdetection_block/data/snapshot_*.jpg(1280x720を横幅320に縮小した時の鮮明さが2500程度)と、
+    それをぼかしたもの(ガウシアンの標準偏差3pxで300程度)から決めた。
+
+    使い方
+        gate = FrameQualityGate()
+        metrics = gate.measure(img)
+        problems = gate.problems(metrics)  # 空のリストなら認識に使える
+    """
+
+    def __init__(self, width=320, min_sharpness=500, min_brightness=40, max_brightness=215,
+                 max_clipped=0.25, max_repeated_rows=0.04):
+        """
+        Parameters
+        ----------
+        width: int
+            調べる時に縮小する横幅(縦横比は変えない)
+        min_sharpness: float
+            鮮明さ(縮小した画像のラプラシアンの分散)の下限
+        min_brightness, max_brightness: float
+            輝度の平均の下限と上限
+        max_clipped: float
+            白飛び(250以上)または黒つぶれ(5以下)した画素の割合の上限
+        max_repeated_rows: float
+            画像の下端で同じ行が続く割合(高さに対する割合)の上限
+        """
+        self.width = width
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped = max_clipped
+        self.max_repeated_rows = max_repeated_rows
+
+    def measure(self, img):
+        """
+        画像の品質を測る
+
+        Returns
+        -------
+        metrics: dict
+            sharpness(鮮明さ), brightness(輝度の平均), clipped(白飛び・黒つぶれの割合),
+            repeated_rows(下端で同じ行が続く割合)
+        """
+        # NOTE: INTER_AREAより速いINTER_LINEARで縮小する(閾値もINTER_LINEARで縮小した画像で決めた)
+        size = (self.width, max(1, round(img.shape[0] * self.width / img.shape[1])))
+        gray = cv2.cvtColor(cv2.resize(img, size, interpolation=cv2.INTER_LINEAR), cv2.COLOR_BGR2GRAY)
+        (_, stddev) = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+        hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+        # 下の行と同じ(差が1以下)行が、画像の下端から何行続くか
+        same_rows = (np.abs(np.diff(gray.astype(np.int16), axis=0)) <= 1).all(axis=1)
+        different = np.flatnonzero(~same_rows)
+        repeated = len(same_rows) - 1 - different[-1] if len(different) else len(same_rows)
+        return {"sharpness": float(stddev[0, 0] ** 2),
+                "brightness": float(np.dot(hist, np.arange(256))),
+                "clipped": float(hist[:6].sum() + hist[250:].sum()),
+                "repeated_rows": repeated / gray.shape[0]}
+
+    def problems(self, metrics):
+        """
+        measureの結果から、認識に使えない理由のリストを返す。認識に使える場合は空のリスト
+        """
+        problems = []
+        if metrics["repeated_rows"] > self.max_repeated_rows:
+            problems.append("画像が途中で切れています")
+        if metrics["brightness"] < self.min_brightness:
+            problems.append("暗すぎます")
+        elif metrics["brightness"] > self.max_brightness:
+            problems.append("明るすぎます")
+        if metrics["clipped"] > self.max_clipped:
+            problems.append("白飛び・黒つぶれが多すぎます")
+        if metrics["sharpness"] < self.min_sharpness:
+            problems.append("ぼやけています")
+        return problems
+
+    def is_usable(self, img):
+        """
+        画像が認識に使えるかどうかを返す
+        """
+        return not self.problems(self.measure(img))
@@ -0,0 +1,288 @@
+"""
+@file: FrameSource.py
+@brief: Cameraがキャプチャする画像の取得元(映像配信、画像ファイル、画像のディレクトリ、動画ファイル)
+"""
+import glob
+import os
+import time
+
+import cv2
+
+from capture.FrameGrabber import FrameGrabber
+
+
+class FrameSource:
+    """
+    Camera.captureに画像を渡す取得元の基底クラス。
+
+    latest(after, timeout)で(取得時刻, 画像)を返す。取得時刻はtime.monotonicの値で、画像がない場合はNoneを返す。
+    バックグラウンドで受信し続けるFrameGrabberとMjpegStreamReaderも同じlatestを持つ。
+
+    is_liveがTrueの取得元は映像配信で、Camera.start_grabberでバックグラウンドの受信に切り替えられる。
+    録画した画像(ReplaySource)は、呼び出すたびに次の画像を待たずに返すため、認識処理の速度をオフラインで測れる。
+    """
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+    VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.mjpeg', '.mjpg')
+    is_live = False  # 映像配信かどうか
+
+    @staticmethod
+    def open(target, **kwargs):
+        """
+        URLやパスに合う取得元を作る
+
+        Parameters
+        ----------
+        target: str
+            映像配信URL、画像ファイル、画像のディレクトリ、動画ファイルのいずれか
+        kwargs:
+            取得元のクラスに渡す引数(ディレクトリと動画ファイルのloop, fpsなど)
+        """
+        if os.path.isdir(target):
+            return DirectorySource(target, **kwargs)
+        extension = os.path.splitext(target)[1].lower()
+        if os.path.isfile(target) and extension in FrameSource.IMAGE_EXTENSIONS:
+            return ImageFileSource(target)
+        if os.path.isfile(target) and extension in FrameSource.VIDEO_EXTENSIONS:
+            return VideoFileSource(target, **kwargs)
+        return StreamSource(target)
+
+    @staticmethod
+    def read_image(path):
+        """
+        画像ファイルを、映像配信と同じくcv2.VideoCapture(FFmpeg)で読み込む
+
+        cv2.imreadとはJPEGの色差の補間が異なり、画素値が変わるため、映像配信をキャプチャした場合と同じ画像になるようにする。
+        cv2.VideoCaptureで読み込めない場合はcv2.imreadで読み込む
+        """
+        cap = cv2.VideoCapture(path)
+        try:
+            (ret, img) = cap.read() if cap.isOpened() else (False, None)
+        finally:
+            cap.release()
+        if not ret or img is None:
+            return cv2.imread(path)
+        return img
+
+    def start(self):
+        return self
+
+    def stop(self, timeout=None):
+        pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def latest(self, after=None, timeout=None):
+        """
+        (取得時刻, 画像)を返す。画像を取得できない場合はNone
+
+        Parameters
+        ----------
+        after: float
+            この時刻(time.monotonic)より後に取得した画像を返す
+        timeout: float
+            画像を取得するまで待つ時間(秒)
+        """
+        raise NotImplementedError()
+
+    def latest_frame(self, after=None, timeout=None):
+        """
+        latestと同じ条件で、画像だけを返す
+        """
+        frame = self.latest(after, timeout)
+        return None if frame is None else frame[1]
+
+
+class StreamSource(FrameSource):
+    """
+    映像配信からキャプチャのたびに接続して取得する取得元
+
+    接続した直後の画像は古いものが残っていることがあるため、2枚読み込んで後の画像を使う
+    (2枚目を読み込めない場合は1枚目を使う)
+    """
+    is_live = True
+
+    def __init__(self, url):
+        self.url = url
+
+    def latest(self, after=None, timeout=None):
+        cap = FrameGrabber.open_video_capture(self.url)
+        try:
+            if not cap.isOpened():
+                return None
+            (ret, img) = cap.read()
+            (ret_next, img_next) = cap.read()
+        finally:
+            cap.release()
+        if ret_next and img_next is not None:
+            (ret, img) = (ret_next, img_next)
+        if not ret or img is None:
+            return None
+        return (time.monotonic(), img)
+
+
+class ImageFileSource(FrameSource):
+    """
+    1枚の画像ファイルを取得元とする(何度キャプチャしても同じ画像を返す)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.img = None
+
+    def latest(self, after=None, timeout=None):
+        if self.img is None:
+            self.img = self.read_image(self.path)
+            if self.img is None:
+                return None
+        return (time.monotonic(), self.img)
+
+
+class ReplaySource(FrameSource):
+    """
+    録画した画像を順番に返す取得元の基底クラス。
+
+    fpsがNoneの場合は、latestを呼び出すたびに次の画像を待たずに返す(できるだけ速く再生する)。
+    fpsを指定した場合は、最初に取得してからの経過時間に合う画像を返す(映像配信と同じく、処理が遅いと画像を読み飛ばす)。
+    最後の画像の後は、loopがTrueの場合は最初に戻り、Falseの場合はNoneを返す。
+    """
+    def __init__(self, loop=False, fps=None):
+        self.loop = loop
+        self.fps = fps
+        self.index = -1  # 最後に返した画像の番号(繰り返し再生した場合は、折り返さずに数える)
+        self.start_time = None  # fpsを指定した場合の再生開始時刻
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def read(self, index):
+        """
+        index番目の画像を読み込む。読み込めない場合はNone
+        """
+        raise NotImplementedError()
+
+    def rewind(self):
+        """
+        最初の画像から再生し直す
+        """
+        self.index = -1
+        self.start_time = None
+
+    def next_index(self, after=None, timeout=None):
+        if self.fps is None:
+            return self.index + 1
+        now = time.monotonic()
+        if self.start_time is None:
+            self.start_time = now
+            return 0
+        index = int((now - self.start_time) * self.fps)
+        if index <= self.index and after is not None and timeout is not None:
+            # 前回と同じ画像になる場合は、次の画像の時刻まで待つ
+            wait = min((self.index + 1) / self.fps - (now - self.start_time), timeout)
+            if wait > 0:
+                time.sleep(wait)
+            index = int((time.monotonic() - self.start_time) * self.fps)
+        return index
+
+    def latest(self, after=None, timeout=None):
+        index = self.next_index(after, timeout)
+        length = len(self)
+        if length == 0:
+            return None
+        if index >= length and not self.loop:
+            return None
+        img = self.read(index % length)
+        if img is None:
+            return None
+        self.index = index
+        return (time.monotonic(), img)
+
+
+class DirectorySource(ReplaySource):
+    """
+    ディレクトリ内の画像ファイルを、ファイル名の順に返す取得元(スナップショットの再生)
+    """
+    def __init__(self, directory, patterns=None, loop=False, fps=None, preload=False):
+        """
+        Parameters
+        ----------
+        directory: str
+            画像のディレクトリ(サブディレクトリは含めない)
+        patterns: list
+            ファイル名のパターン(例: ["snapshot_*.jpg"])。Noneの場合はすべての画像ファイル
+        loop: bool
+            最後の画像の後に最初に戻るかどうか
+        fps: float
+            1秒あたりの画像の数。Noneの場合はできるだけ速く再生する
+        preload: bool
+            Trueの場合は最初にすべての画像を読み込んでおく(画像の読み込み時間を含めずに処理時間を測る場合に使う)
+        """
+        super().__init__(loop, fps)
+        self.directory = directory
+        if patterns is None:
+            paths = [path for path in glob.glob(os.path.join(directory, '*'))
+                     if os.path.splitext(path)[1].lower() in self.IMAGE_EXTENSIONS]
+        else:
+            paths = [path for pattern in patterns for path in glob.glob(os.path.join(directory, pattern))]
+        self.paths = sorted(set(paths))
+        self.images = [self.read_image(path) for path in self.paths] if preload else None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def read(self, index):
+        if self.images is not None:
+            return self.images[index]
+        return self.read_image(self.paths[index])
+
+    @property
+    def path(self):
+        """
+        最後に返した画像のパス
+        """
+        if self.index < 0:
+            return None
+        return self.paths[self.index % len(self.paths)]
+
+
+class VideoFileSource(ReplaySource):
+    """
+    動画ファイルの画像を順番に返す取得元(録画した映像の再生)
+    """
+    def __init__(self, path, loop=False, fps=None):
+        super().__init__(loop, fps)
+        self.path = path
+        self.cap = None
+        self.position = 0  # 次に読み込む画像の番号
+        self.length = None
+
+    def __len__(self):
+        if self.length is None:
+            cap = cv2.VideoCapture(self.path)
+            self.length = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+            cap.release()
+        return self.length
+
+    def read(self, index):
+        if self.cap is None or index < self.position:
+            # 先頭に戻る場合は開き直す
+            self.stop()
+            self.cap = cv2.VideoCapture(self.path)
+            self.position = 0
+        while self.position < index:
+            # 読み飛ばす画像は復号しない
+            if not self.cap.grab():
+                return None
+            self.position += 1
+        (ret, img) = self.cap.read()
+        if not ret:
+            return None
+        self.position += 1
+        return img
+
+    def stop(self, timeout=None):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
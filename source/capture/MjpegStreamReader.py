@@ -0,0 +1,325 @@
+"""
+@file: MjpegStreamReader.py
+@brief: mjpg-streamerのMJPEG配信(multipart/x-mixed-replace)を直接受信し、最新のJPEGだけを保持する
+"""
+import http.client
+import threading
+import time
+import urllib.request
+
+import cv2
+import numpy as np
+
+
+class MjpegStreamReader:
+    """
+    MJPEG配信を自前で解析し、別スレッドで最新のJPEGを受信し続けるクラス。
+
+    cv2.VideoCaptureと違い、受信したJPEGは復号せずに最新の1枚だけを保持し、
+    画像が必要になった時(latest, latest_frame)に初めて復号する。
+    プレビューなどで縮小した画像で十分な場合は、reduceに2, 4, 8を指定すると
+    cv2.IMREAD_REDUCED_COLOR_*で縮小しながら復号するため、等倍で復号するより速い。
+
+    FrameGrabberと同じlatest, latest_frameを持つため、CameraのFrameGrabberの代わりに使える。
+
+    使い方
+        reader = MjpegStreamReader("http://raspberrypi.local/?action=stream").start()
+        preview = reader.latest_frame(timeout=1.0, reduce=4)
+        img = reader.latest_frame()
+        reader.stop()
+    """
+    is_live = True  # 映像配信かどうか（FrameSource.is_liveと同じ）
+
+    # 縮小率とcv2.imdecodeのフラグの対応
+    DECODE_FLAGS = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }
+    MAX_HEADER_LINES = 32  # 1つのパートのヘッダの最大行数(これを超える場合は壊れた配信とみなす)
+
+    def __init__(self, url, timeout=5.0, reconnect_interval=1.0, open_stream=None):
+        """
+        Parameters
+        ----------
+        url: str
+            映像配信URL
+        timeout: float
+            接続と受信のタイムアウト(秒)
+        reconnect_interval: float
+            接続し直すまでの待ち時間(秒)
+        open_stream: callable
+            URLとタイムアウトを受け取り、HTTPレスポンス(read, readline, close, headersを持つ)を返す関数。
+            Noneの場合はurllib.request.urlopenで接続する
+        """
+        self.url = url
+        self.timeout = timeout
+        self.reconnect_interval = reconnect_interval
+        self.open_stream = urllib.request.urlopen if open_stream is None else open_stream
+        self.jpeg = None  # 最新の(受信時刻, JPEGのバイト列)
+        self.frame_count = 0  # 受信したJPEGの総数
+        self.reconnect_count = 0  # 接続し直した回数
+        self.decode_count = 0  # 復号した回数
+        self.is_connected = False
+        self._decoded = {}  # 最新のJPEGを復号した画像(キーは縮小率)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._stream = None
+        self._thread = None
+
+    def start(self):
+        """
+        受信を開始する。既に開始している場合は何もしない
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="MjpegStreamReader", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        受信を終了し、接続を閉じる
+        """
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        stream = self._stream
+        if stream is not None:
+            # 受信待ちのスレッドを起こすため、接続を閉じる
+            self._close(stream)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._stream = self.open_stream(self.url, timeout=self.timeout)
+                self.is_connected = True
+                boundary = self.parse_boundary(self._stream.headers.get('Content-Type', ''))
+                for jpeg in self.iter_jpegs(self._stream, boundary):
+                    if self._stop_event.is_set():
+                        break
+                    with self._condition:
+                        self.jpeg = (time.monotonic(), jpeg)
+                        self._decoded = {}
+                        self.frame_count += 1
+                        self._condition.notify_all()
+            except (OSError, ValueError, AttributeError, http.client.HTTPException):
+                # 接続の失敗、受信のタイムアウト、配信の形式の誤り(stopで閉じた場合のAttributeErrorを含む)、
+                # HTTPの応答の誤り(BadStatusLine、IncompleteReadなど)
+                pass
+            finally:
+                if self._stream is not None:
+                    self._close(self._stream)
+                    self._stream = None
+                self.is_connected = False
+            if not self._stop_event.is_set():
+                self.reconnect_count += 1
+                self._stop_event.wait(self.reconnect_interval)
+
+    @staticmethod
+    def _close(stream):
+        try:
+            stream.close()
+        except (OSError, AttributeError):
+            pass
+
+    @staticmethod
+    def parse_boundary(content_type):
+        """
+        Content-Typeヘッダから、パートの区切り文字列を取り出す
+
+        Examples
+        --------
+        >>> MjpegStreamReader.parse_boundary('multipart/x-mixed-replace;boundary=boundarydonotcross')
+        b'--boundarydonotcross'
+        """
+        (media_type, _, params) = content_type.partition(';')
+        if media_type.strip().lower() != 'multipart/x-mixed-replace':
+            raise ValueError('Not a MJPEG stream: {}'.format(content_type))
+        for param in params.split(';'):
+            (key, _, value) = param.strip().partition('=')
+            if key.lower() == 'boundary' and value:
+                value = value.strip('"')
+                # 区切り文字列に"--"を付けて送る配信(mjpg-streamerなど)もあるため、重複させない
+                return (value if value.startswith('--') else '--' + value).encode('latin-1')
+        raise ValueError('No boundary: {}'.format(content_type))
+
+    @classmethod
+    def iter_jpegs(cls, stream, boundary):
+        """
+        multipart/x-mixed-replaceの本文から、JPEGのバイト列を1枚ずつ取り出す
+
+        Content-Lengthヘッダがあるパートはその長さだけ読み込み、ない場合は次の区切り文字列まで読み込む。
+
+        Parameters
+        ----------
+        stream: file-like
+            本文を読み込むオブジェクト(read, readlineを持つ)
+        boundary: bytes
+            パートの区切り文字列(先頭の"--"を含む)
+        """
+        line = stream.readline()
+        while line:
+            if line.rstrip() not in (boundary, boundary + b'--'):
+                # 区切り文字列が来るまで読み飛ばす
+                line = stream.readline()
+                continue
+            if line.rstrip() == boundary + b'--':
+                return
+            headers = cls.read_headers(stream)
+            length = headers.get('content-length')
+            if length is not None:
+                data = cls.read_exactly(stream, int(length))
+                line = stream.readline()
+            else:
+                (data, line) = cls.read_until_boundary(stream, boundary)
+            if data is None:
+                return
+            if headers.get('content-type', 'image/jpeg').lower() == 'image/jpeg':
+                yield data
+
+    @classmethod
+    def read_headers(cls, stream):
+        """
+        パートのヘッダを空行まで読み込み、小文字のヘッダ名をキーとする辞書として返す
+        """
+        headers = {}
+        for _ in range(cls.MAX_HEADER_LINES):
+            line = stream.readline()
+            if not line:
+                return headers
+            line = line.strip()
+            if not line:
+                return headers
+            (key, _, value) = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        raise ValueError('Too many header lines')
+
+    @staticmethod
+    def read_exactly(stream, length):
+        """
+        length バイトを読み込む。途中で接続が切れた場合はNoneを返す
+        """
+        chunks = []
+        remaining = length
+        while remaining > 0:
+            chunk = stream.read(remaining)
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    @staticmethod
+    def read_until_boundary(stream, boundary):
+        """
+        次の区切り文字列の直前までを読み込み、(データ, 区切り文字列の行)を返す
+
+        区切り文字列の前の改行はデータに含めない。途中で接続が切れた場合はデータをNoneにする。
+        """
+        lines = []
+        while True:
+            line = stream.readline()
+            if not line:
+                return (None, line)
+            if line.startswith(boundary) and line.rstrip() in (boundary, boundary + b'--'):
+                break
+            lines.append(line)
+        data = b''.join(lines)
+        if data.endswith(b'\r\n'):
+            data = data[:-2]
+        elif data.endswith(b'\n'):
+            data = data[:-1]
+        return (data, line)
+
+    @classmethod
+    def decode(cls, jpeg, reduce=1):
+        """
+        JPEGのバイト列を復号する
+
+        Parameters
+        ----------
+        jpeg: bytes
+            JPEGのバイト列
+        reduce: int
+            縮小率(1, 2, 4, 8)。1の場合は等倍で復号する
+
+        Returns
+        -------
+        img: numpy.ndarray
+            復号した画像(BGR)。復号できない場合はNone
+        """
+        if reduce not in cls.DECODE_FLAGS:
+            raise ValueError('reduce must be one of {}'.format(sorted(cls.DECODE_FLAGS)))
+        return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cls.DECODE_FLAGS[reduce])
+
+    def latest_jpeg(self, after=None, timeout=None):
+        """
+        最新の(受信時刻, JPEGのバイト列)を、復号せずに返す
+
+        Parameters
+        ----------
+        after: float
+            この時刻(time.monotonic)より後に受信したJPEGを返す。Noneの場合は受信時刻を問わない
+        timeout: float
+            条件に合うJPEGを受信するまで待つ時間(秒)。Noneの場合は待たない
+        """
+        def available():
+            return self.jpeg is not None and (after is None or self.jpeg[0] > after)
+
+        with self._condition:
+            if not available() and timeout is not None:
+                self._condition.wait_for(lambda: available() or self._stop_event.is_set(), timeout)
+            if not available():
+                return None
+            return self.jpeg
+
+    def latest(self, after=None, timeout=None, reduce=1):
+        """
+        latest_jpegと同じ条件で、最新の(受信時刻, 画像)を返す
+
+        同じJPEGを同じ縮小率で何度も要求された場合は、最初に復号した画像を返す。
+        """
+        frame = self.latest_jpeg(after, timeout)
+        if frame is None:
+            return None
+        (timestamp, jpeg) = frame
+        with self._condition:
+            if self.jpeg is frame and reduce in self._decoded:
+                return (timestamp, self._decoded[reduce])
+        # 復号には時間がかかるため、ロックの外で行う(その間も受信は続ける)
+        img = self.decode(jpeg, reduce)
+        if img is None:
+            return None
+        with self._condition:
+            self.decode_count += 1
+            if self.jpeg is frame:
+                self._decoded[reduce] = img
+        return (timestamp, img)
+
+    def latest_frame(self, after=None, timeout=None, reduce=1):
+        """
+        最新の画像を返す。条件はlatest_jpegと同じ
+
+        Returns
+        -------
+        img: numpy.ndarray
+            最新の画像。条件に合う画像がない場合はNone
+        """
+        frame = self.latest(after, timeout, reduce)
+        return None if frame is None else frame[1]
@@ -0,0 +1,149 @@
+"""
+@file: PerspectiveMaps.py
+@brief: 台形補正(cv2.warpPerspective)と同じ結果になるcv2.remap用の座標表を作り、切り取る座標ごとにキャッシュする
+"""
+import collections
+import threading
+
+import cv2
+import numpy as np
+
+
+class PerspectiveMaps:
+    """
+    台形補正の座標表(cv2.remapのmap1, map2)を保持するクラス。
+
+    切り取る4点の座標は設定ファイルから読み込み、実行中に変わらないため、
+    座標表を一度だけ作っておけば、以降の台形補正は表を引くだけになる。
+    座標表はcv2.warpPerspectiveの内部と同じ固定小数点(1/32画素)で作るため、結果は画素単位で一致する。
+
+    切り取る座標を余白付きの画像で指定した場合は、余白の大きさ(offset)だけ座標表を平行移動し、
+    余白のない画像から直接切り取る(余白の部分はwarpのborder_valueになる)。
+    """
+    INTER_BITS = 5  # cv2.warpPerspectiveの補間位置の精度(1/32画素)
+    INTER_TAB_SIZE = 1 << INTER_BITS
+    MAX_CACHE_SIZE = 8  # キャッシュする座標表の数
+
+    # プロセス内で共有する座標表(キーは変換行列と出力サイズ、平行移動量)
+    _cache = collections.OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, matrix, output_size, offset=(0, 0)):
+        """
+        Parameters
+        ----------
+        matrix: numpy.ndarray
+            入力画像から出力画像への変換行列(3x3)
+        output_size: tuple
+            出力画像のサイズ。[高さ、横幅]の順
+        offset: tuple
+            変換行列の座標系における、入力画像の左上の座標。[X, Y]の順
+        """
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.output_size = tuple(output_size)
+        self.offset = tuple(offset)
+        (self.map1, self.map2) = self.create_maps(self.matrix, self.output_size)
+        if self.offset != (0, 0):
+            # 補間位置(小数部分)は変えずに、整数部分だけを平行移動する
+            map1 = self.map1.astype(np.int32) - np.array(self.offset, dtype=np.int32)
+            self.map1 = np.clip(map1, -32768, 32767).astype(np.int16)
+
+    @staticmethod
+    def transform(src_pts, output_size):
+        """
+        4点の座標(左上、右上、左下、右下の順)を出力画像の四隅に移す変換行列を求める
+        """
+        h, w = output_size
+        src_pts = np.array(src_pts, dtype=np.float32)
+        dst_pts = np.array([[0, 0], [w, 0], [0, h], [w, h]], dtype=np.float32)
+        return cv2.getPerspectiveTransform(src_pts, dst_pts)
+
+    @classmethod
+    def get(cls, src_pts, output_size, offset=(0, 0)):
+        """
+        4点の座標と出力サイズに対応する座標表を返す。初回のみ座標表を作る
+
+        Parameters
+        ----------
+        src_pts: list
+            切り取る4点の座標。[左上、右上、左下、右下]の順
+        output_size: tuple
+            出力画像のサイズ。[高さ、横幅]の順
+        offset: tuple
+            src_ptsの座標系における、入力画像の左上の座標(余白付きの画像で指定した場合は余白の大きさ)
+        """
+        return cls.from_matrix(cls.transform(src_pts, output_size), output_size, offset)
+
+    @classmethod
+    def from_matrix(cls, matrix, output_size, offset=(0, 0)):
+        """
+        変換行列と出力サイズ、平行移動量に対応する座標表を返す。初回のみ座標表を作る
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        key = (matrix.tobytes(), tuple(output_size), tuple(offset))
+        with cls._lock:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+                return cls._cache[key]
+        # 座標表の作成には時間がかかるため、ロックの外で作る
+        maps = cls(matrix, output_size, offset)
+        with cls._lock:
+            cls._cache[key] = maps
+            while len(cls._cache) > cls.MAX_CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        return maps
+
+    @classmethod
+    def clear(cls):
+        """
+        キャッシュした座標表を破棄する
+        """
+        with cls._lock:
+            cls._cache.clear()
+
+    @classmethod
+    def create_maps(cls, matrix, output_size):
+        """
+        出力画像の各画素に対応する入力画像の座標を、cv2.warpPerspectiveと同じ手順で求める
+
+        Returns
+        -------
+        map1: numpy.ndarray
+            入力画像の座標の整数部分。形状は(高さ, 横幅, 2)でint16
+        map2: numpy.ndarray
+            入力画像の座標の小数部分(補間表の番号)。形状は(高さ, 横幅)でuint16
+        """
+        h, w = output_size
+        inverse = cv2.invert(matrix)[1]
+        x = np.arange(w, dtype=np.float64)[np.newaxis, :]
+        y = np.arange(h, dtype=np.float64)[:, np.newaxis]
+
+        denominator = inverse[2, 0] * x + (inverse[2, 1] * y + inverse[2, 2])
+        scale = np.zeros_like(denominator)
+        np.divide(cls.INTER_TAB_SIZE, denominator, out=scale, where=denominator != 0)
+        limit = np.iinfo(np.int32)
+        fx = np.clip((inverse[0, 0] * x + (inverse[0, 1] * y + inverse[0, 2])) * scale, limit.min, limit.max)
+        fy = np.clip((inverse[1, 0] * x + (inverse[1, 1] * y + inverse[1, 2])) * scale, limit.min, limit.max)
+        ix = np.rint(fx).astype(np.int64)
+        iy = np.rint(fy).astype(np.int64)
+
+        map1 = np.empty((h, w, 2), dtype=np.int16)
+        map1[..., 0] = np.clip(ix >> cls.INTER_BITS, -32768, 32767)
+        map1[..., 1] = np.clip(iy >> cls.INTER_BITS, -32768, 32767)
+        mask = cls.INTER_TAB_SIZE - 1
+        map2 = ((iy & mask) * cls.INTER_TAB_SIZE + (ix & mask)).astype(np.uint16)
+        return (map1, map2)
+
+    def warp(self, img, border_value=0):
+        """
+        座標表を使って台形補正する(cv2.warpPerspective(img, matrix, (横幅, 高さ))と同じ結果になる)
+
+        Parameters
+        ----------
+        img: numpy.ndarray
+            入力画像
+        border_value: int or tuple
+            入力画像の外側の画素値(余白の色)
+        """
+        return cv2.remap(img, self.map1, self.map2, cv2.INTER_LINEAR,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=border_value)
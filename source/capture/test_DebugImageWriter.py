@@ -0,0 +1,106 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from DebugImageWriter import DebugImageWriter
+
+
+@pytest.fixture()
+def img():
+    return np.random.RandomState(0).randint(0, 256, (20, 30, 3)).astype(np.uint8)
+
+
+@pytest.mark.parametrize('image_format', DebugImageWriter.FORMATS)
+def test_write(tmp_path, img, image_format):
+    writer = DebugImageWriter(image_format=image_format)
+    assert writer.write(str(tmp_path / 'debug.png'), img)
+    assert writer.flush(timeout=5.0)
+    writer.close()
+
+    path = str(tmp_path / ('debug.' + image_format))
+    assert os.path.exists(path)
+    assert writer.written_count == 1
+    if image_format == 'npy':
+        assert (np.load(path) == img).all()
+    elif image_format == 'png':
+        assert (cv2.imread(path) == img).all()
+    else:
+        assert cv2.imread(path).shape == img.shape
+
+
+def test_disabled(tmp_path, img):
+    writer = DebugImageWriter(enabled=False)
+    assert not writer.write(str(tmp_path / 'debug.png'), img)
+    assert writer.flush(timeout=1.0)
+    assert not os.path.exists(str(tmp_path / 'debug.png'))
+    assert writer._thread is None
+
+
+def test_drop_oldest(tmp_path, img):
+    event = threading.Event()
+
+    class BlockingWriter(DebugImageWriter):
+        def save(self, path, img):
+            # テストが合図するまで保存を終えない
+            event.wait()
+            return super().save(path, img)
+
+    writer = BlockingWriter(max_queue_size=2)
+    try:
+        writer.write(str(tmp_path / '0.png'), img)
+        # 1枚目の保存が始まるのを待つ
+        with writer._condition:
+            writer._condition.wait_for(lambda: writer._writing, 5.0)
+        for i in range(1, 5):
+            writer.write(str(tmp_path / '{}.png'.format(i)), img)
+        # 保存待ちは2枚までで、古い画像から捨てる
+        assert [os.path.basename(path) for (path, _) in writer.queue] == ['3.png', '4.png']
+        assert writer.dropped_count == 2
+    finally:
+        event.set()
+    assert writer.flush(timeout=5.0)
+    writer.close()
+    assert sorted(os.listdir(str(tmp_path))) == ['0.png', '3.png', '4.png']
+
+
+def test_copy(tmp_path, img):
+    event = threading.Event()
+
+    class BlockingWriter(DebugImageWriter):
+        def save(self, path, img):
+            event.wait()
+            return super().save(path, img)
+
+    writer = BlockingWriter(image_format='npy')
+    expected = img.copy()
+    writer.write(str(tmp_path / 'debug'), img, copy=True)
+    # 保存待ちの間に元の画像を書き換えても、保存される画像は変わらない
+    img[:] = 0
+    event.set()
+    writer.close()
+    assert (np.load(str(tmp_path / 'debug.npy')) == expected).all()
+
+
+def test_close_writes_remaining_images(tmp_path, img):
+    writer = DebugImageWriter(image_format='npy', max_queue_size=10)
+    for i in range(5):
+        writer.write(str(tmp_path / str(i)), img)
+    writer.close(timeout=5.0)
+    assert writer.written_count == 5
+    # 終了後は保存しない
+    assert not writer.write(str(tmp_path / 'closed'), img)
+
+
+def test_failed_to_write(tmp_path, img):
+    writer = DebugImageWriter()
+    writer.write(str(tmp_path / 'not_exists' / 'debug.png'), img)
+    writer.close(timeout=5.0)
+    assert writer.failed_count == 1
+
+
+def test_raise_unknown_format():
+    with pytest.raises(ValueError):
+        DebugImageWriter(image_format='bmp')
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import numpy as np
+
+from FrameGrabber import FrameGrabber
+
+
+class FakeCapture:
+    """
+    cv2.VideoCaptureの代わりに、決まった数の画像を返すクラス
+    """
+    def __init__(self, frames, opened=True):
+        self.frames = list(frames)
+        self.opened = opened
+        self.released = False
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        # 実際の映像配信と同じように、一定間隔で画像を返す
+        time.sleep(0.001)
+        if len(self.frames) == 0:
+            return (False, None)
+        return (True, self.frames.pop(0))
+
+    def release(self):
+        self.released = True
+
+
+def create_frames(start, stop):
+    return [np.full((4, 4, 3), i, dtype=np.uint8) for i in range(start, stop)]
+
+
+def wait_until(condition, timeout=2.0):
+    limit = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < limit
+        time.sleep(0.001)
+
+
+def test_latest_frame():
+    captures = [FakeCapture(create_frames(0, 10))]
+    grabber = FrameGrabber('dummy', buffer_size=3, open_capture=lambda url: captures.pop(0) if captures else
+                           FakeCapture([], opened=False), reconnect_interval=0.01)
+    with grabber:
+        wait_until(lambda: grabber.frame_count == 10)
+        assert grabber.latest_frame()[0, 0, 0] == 9
+        # 保持するのは最新のbuffer_size枚だけ
+        assert [img[0, 0, 0] for (_, img) in grabber.frames_since(0)] == [7, 8, 9]
+    assert not grabber.is_running
+
+
+def test_frames_since():
+    grabber = FrameGrabber('dummy', buffer_size=10, open_capture=lambda url: FakeCapture(create_frames(0, 5)),
+                           reconnect_interval=10)
+    with grabber:
+        wait_until(lambda: grabber.frame_count == 5)
+        frames = grabber.frames_since(0)
+        (timestamp, _) = frames[2]
+        assert [img[0, 0, 0] for (_, img) in grabber.frames_since(timestamp)] == [3, 4]
+        assert grabber.frames_since(time.monotonic()) == []
+
+
+def test_latest_frame_waits_for_new_frame():
+    event = threading.Event()
+
+    class SlowCapture(FakeCapture):
+        def read(self):
+            # 2枚目以降は、テストが合図するまで受信しない
+            if len(self.frames) < 3:
+                event.wait()
+            return super().read()
+
+    grabber = FrameGrabber('dummy', open_capture=lambda url: SlowCapture(create_frames(0, 3)), reconnect_interval=10)
+    with grabber:
+        try:
+            wait_until(lambda: grabber.frame_count == 1)
+            (timestamp, img) = grabber.latest()
+            # 新しい画像がない場合はNoneを返す
+            assert grabber.latest_frame(after=timestamp, timeout=0.01) is None
+        finally:
+            event.set()
+        assert grabber.latest_frame(after=timestamp, timeout=1.0) is not None
+
+
+def test_reconnect():
+    opened = []
+
+    def open_capture(url):
+        opened.append(url)
+        # 1回目は接続に失敗し、2回目以降は2枚ずつ受信して切断される
+        if len(opened) == 1:
+            return FakeCapture([], opened=False)
+        return FakeCapture(create_frames(0, 2))
+
+    grabber = FrameGrabber('dummy', open_capture=open_capture, reconnect_interval=0.001)
+    with grabber:
+        wait_until(lambda: grabber.frame_count >= 4)
+    assert grabber.reconnect_count >= 2
+    assert opened[0] == 'dummy'
+
+
+def test_reconnect_with_video_capture():
+    # 静止画は1枚読み込むと終わりになるため、接続し直して読み込み続ける
+    grabber = FrameGrabber('./img/sample_camera_area.jpg', reconnect_interval=0.001)
+    with grabber:
+        img = grabber.latest_frame(timeout=2.0)
+        assert img is not None and img.shape == (720, 1280, 3)
+        wait_until(lambda: grabber.frame_count >= 2)
+    assert grabber.reconnect_count >= 1
+
+
+def test_latest_frame_without_frames():
+    grabber = FrameGrabber('dummy', open_capture=lambda url: FakeCapture([], opened=False), reconnect_interval=0.01)
+    assert grabber.latest_frame() is None
+    with grabber:
+        assert grabber.latest_frame(timeout=0.05) is None
+    assert grabber.frames_since(0) == []
@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+import pytest
+
+from FrameQualityGate import FrameQualityGate
+
+
+@pytest.fixture()
+def img():
+    return cv2.imread('./detection_block/data/snapshot_20190727_140216.jpg')
+
+
+def truncate(img, ratio):
+    # JPEGの受信が途中で切れた画像
+    jpeg = cv2.imencode('.jpg', img)[1].tobytes()
+    return cv2.imdecode(np.frombuffer(jpeg[:int(len(jpeg) * ratio)], dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+@pytest.mark.parametrize('path', [
+    './detection_block/data/snapshot_20190727_140216.jpg',
+    './detection_block/data/snapshot_20190727_140838.jpg',
+    './img/sample_camera_area.jpg',
+    './img/sample_camera_area_with_block.jpg',
+])
+def test_usable(path):
+    gate = FrameQualityGate()
+    metrics = gate.measure(cv2.imread(path))
+    assert gate.problems(metrics) == []
+    assert metrics["repeated_rows"] == 0
+
+
+@pytest.mark.parametrize('degrade, problem', [
+    (lambda img: cv2.GaussianBlur(img, (0, 0), 3), "ぼやけています"),
+    (lambda img: cv2.convertScaleAbs(img, alpha=2.5, beta=60), "明るすぎます"),
+    (lambda img: cv2.convertScaleAbs(img, alpha=2.5, beta=60), "白飛び・黒つぶれが多すぎます"),
+    (lambda img: cv2.convertScaleAbs(img, alpha=0.2), "暗すぎます"),
+    (lambda img: truncate(img, 0.7), "画像が途中で切れています"),
+    (lambda img: np.full_like(img, 128), "ぼやけています"),
+])
+def test_low_quality(img, degrade, problem):
+    gate = FrameQualityGate()
+    assert problem in gate.problems(gate.measure(degrade(img)))
+    assert not gate.is_usable(degrade(img))
+
+
+def test_measure_keeps_image(img):
+    # 処理時間はbenchmark/bench_frame_quality.pyで測る
+    gate = FrameQualityGate()
+    original = img.copy()
+    metrics = gate.measure(img)
+    assert (img == original).all()
+    assert set(metrics.keys()) == {"sharpness", "brightness", "clipped", "repeated_rows"}
+    assert metrics == gate.measure(img)
+
+
+def test_measure_resized(img):
+    # 縮小してから測るため、入力の大きさが違っても同じ横幅に縮小すれば結果はほぼ同じ
+    gate = FrameQualityGate()
+    metrics = gate.measure(img)
+    half = gate.measure(cv2.resize(img, (img.shape[1] // 2, img.shape[0] // 2), interpolation=cv2.INTER_AREA))
+    assert half["brightness"] == pytest.approx(metrics["brightness"], abs=1)
+    assert gate.problems(half) == gate.problems(metrics) == []
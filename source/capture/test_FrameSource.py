@@ -0,0 +1,126 @@
+import time
+
+import cv2
+import numpy as np
+
+from FrameSource import FrameSource, StreamSource, ImageFileSource, DirectorySource, VideoFileSource
+
+
+def create_images(directory, count, extension='.png'):
+    # 何枚目の画像か分かるように、画素値を変えた画像を保存する
+    paths = []
+    for i in range(count):
+        path = str(directory / 'snapshot_{:02d}{}'.format(i, extension))
+        cv2.imwrite(path, np.full((8, 8, 3), 10 * i, dtype=np.uint8))
+        paths.append(path)
+    return paths
+
+
+def create_video(path, count):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 10, (32, 32))
+    for i in range(count):
+        writer.write(np.full((32, 32, 3), 20 * i, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+
+def values(source, count):
+    frames = [source.latest_frame() for _ in range(count)]
+    return [None if img is None else int(round(img.mean())) for img in frames]
+
+
+def test_open(tmp_path):
+    paths = create_images(tmp_path, 1)
+    assert isinstance(FrameSource.open(str(tmp_path)), DirectorySource)
+    assert isinstance(FrameSource.open(paths[0]), ImageFileSource)
+    assert isinstance(FrameSource.open(create_video(tmp_path / 'video.avi', 2)), VideoFileSource)
+    source = FrameSource.open("http://raspberrypi.local/?action=stream")
+    assert isinstance(source, StreamSource)
+    assert source.is_live
+
+
+def test_image_file():
+    source = ImageFileSource('./img/sample_camera_area.jpg')
+    (first_time, first) = source.latest()
+    (second_time, second) = source.latest(after=first_time)
+    assert second_time > first_time
+    # 映像配信をcv2.VideoCaptureでキャプチャした場合と同じ画像になる
+    (_, expected) = cv2.VideoCapture('./img/sample_camera_area.jpg').read()
+    assert (first == expected).all()
+    assert second is first
+    assert not source.is_live
+
+
+def test_image_file_not_found():
+    assert ImageFileSource('./img/not_exists.png').latest() is None
+
+
+def test_directory(tmp_path):
+    create_images(tmp_path, 3)
+    (tmp_path / 'notes.txt').write_text('画像以外のファイルは読み飛ばす')
+    source = DirectorySource(str(tmp_path))
+    assert len(source) == 3
+    assert values(source, 4) == [0, 10, 20, None]
+    assert source.path.endswith('snapshot_02.png')
+
+
+def test_directory_with_patterns(tmp_path):
+    create_images(tmp_path, 2, '.png')
+    create_images(tmp_path, 3, '.jpg')
+    source = DirectorySource(str(tmp_path), patterns=['*.png'], loop=True, preload=True)
+    assert values(source, 5) == [0, 10, 0, 10, 0]
+    assert source.path.endswith('snapshot_00.png')
+    source.rewind()
+    assert source.path is None
+
+
+def test_directory_realtime(tmp_path):
+    create_images(tmp_path, 100)
+    source = DirectorySource(str(tmp_path), fps=100)
+    (start, _) = source.latest()
+    time.sleep(0.05)
+    # 経過時間に合う画像を返す(途中の画像は読み飛ばす)
+    source.latest()
+    assert source.index >= 5
+    # 次の画像の時刻まで待つ
+    index = source.index
+    source.latest(after=start, timeout=1.0)
+    assert source.index > index
+
+
+def test_video(tmp_path):
+    path = create_video(tmp_path / 'video.avi', 5)
+    source = VideoFileSource(path)
+    assert len(source) == 5
+    frames = [source.latest_frame() for _ in range(6)]
+    assert all(img.shape == (32, 32, 3) for img in frames[:5])
+    assert [int(round(img.mean() / 20)) for img in frames[:5]] == [0, 1, 2, 3, 4]
+    assert frames[5] is None
+    source.stop()
+
+
+def test_video_loop(tmp_path):
+    path = create_video(tmp_path / 'video.avi', 3)
+    with VideoFileSource(path, loop=True) as source:
+        frames = [source.latest_frame() for _ in range(7)]
+    assert [int(round(img.mean() / 20)) for img in frames] == [0, 1, 2, 0, 1, 2, 0]
+    assert source.cap is None
+
+
+def test_read_image_without_video_capture(tmp_path):
+    # cv2.VideoCaptureは"%"を連番のパターンとみなすため、cv2.imreadで読み込む
+    path = str(tmp_path / '100%.png')
+    cv2.imwrite(path, np.full((8, 8, 3), 50, dtype=np.uint8))
+    assert FrameSource.read_image(path).mean() == 50
+
+
+def test_stream_not_connected():
+    assert StreamSource('./img/not_exists.png').latest() is None
+
+
+
+def test_stream_discards_first_frame(tmp_path):
+    # 接続した直後の古い画像(1枚目)を読み捨てて、2枚目を返す
+    assert values(StreamSource(create_video(tmp_path / 'video.avi', 3)), 2) == [20, 20]
+    # 1枚しか読み込めない場合は、その画像を返す
+    assert values(StreamSource(create_video(tmp_path / 'single.avi', 1)), 1) == [0]
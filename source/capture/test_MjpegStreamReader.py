@@ -0,0 +1,195 @@
+import http.server
+import io
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from MjpegStreamReader import MjpegStreamReader
+
+
+BOUNDARY = 'boundarydonotcross'
+
+
+def create_jpegs(count, size=(720, 1280)):
+    # 何枚目の画像か分かるように、画素値を変えたJPEGを作る
+    return [cv2.imencode('.jpg', np.full(size + (3,), 20 * i, dtype=np.uint8))[1].tobytes() for i in range(count)]
+
+
+def create_stream(jpegs, content_length=True, boundary=BOUNDARY):
+    body = b''
+    for jpeg in jpegs:
+        body += '--{}\r\nContent-Type: image/jpeg\r\n'.format(boundary).encode()
+        if content_length:
+            body += 'Content-Length: {}\r\n'.format(len(jpeg)).encode()
+        body += b'X-Timestamp: 0.0\r\n\r\n' + jpeg + b'\r\n'
+    return body
+
+
+class MjpegServer:
+    """
+    mjpg-streamerの代わりに、JPEGを繰り返し配信するHTTPサーバ
+    """
+    def __init__(self, jpegs, interval=0.005, content_length=True, max_frames=None, malformed=0):
+        self.jpegs = jpegs
+        self.interval = interval
+        self.content_length = content_length
+        self.max_frames = max_frames  # 1回の接続で配信する画像の数(Noneの場合は切断されるまで配信する)
+        self.malformed = malformed  # HTTPの形式が誤った応答を返す接続の数(最初の接続から)
+        self.connections = 0
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.connections += 1
+                if server.connections <= server.malformed:
+                    # ステータス行のない応答(http.client.BadStatusLineになる)
+                    self.wfile.write(b'garbage\r\n\r\n')
+                    self.wfile.flush()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace;boundary=' + BOUNDARY)
+                self.end_headers()
+                sent = 0
+                try:
+                    while server.max_frames is None or sent < server.max_frames:
+                        jpeg = server.jpegs[sent % len(server.jpegs)]
+                        self.wfile.write(create_stream([jpeg], server.content_length))
+                        self.wfile.flush()
+                        sent += 1
+                        time.sleep(server.interval)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}/?action=stream'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.mark.parametrize('content_length', [True, False])
+def test_iter_jpegs(content_length):
+    jpegs = create_jpegs(3, size=(8, 8))
+    stream = io.BytesIO(create_stream(jpegs, content_length) + '--{}--\r\n'.format(BOUNDARY).encode())
+    assert list(MjpegStreamReader.iter_jpegs(stream, b'--' + BOUNDARY.encode())) == jpegs
+
+
+def test_iter_jpegs_stops_at_truncated_part():
+    jpegs = create_jpegs(2, size=(8, 8))
+    stream = io.BytesIO(create_stream(jpegs)[:-10])
+    assert list(MjpegStreamReader.iter_jpegs(stream, b'--' + BOUNDARY.encode())) == jpegs[:1]
+
+
+@pytest.mark.parametrize('content_type, expected', [
+    ('multipart/x-mixed-replace;boundary=boundarydonotcross', b'--boundarydonotcross'),
+    ('multipart/x-mixed-replace; boundary="--frame"', b'--frame'),
+])
+def test_parse_boundary(content_type, expected):
+    assert MjpegStreamReader.parse_boundary(content_type) == expected
+
+
+@pytest.mark.parametrize('content_type', ['image/jpeg', 'multipart/x-mixed-replace'])
+def test_parse_boundary_raise(content_type):
+    with pytest.raises(ValueError):
+        MjpegStreamReader.parse_boundary(content_type)
+
+
+@pytest.mark.parametrize('content_length', [True, False])
+def test_latest_frame(content_length):
+    jpeg = open('./img/sample_camera_area.jpg', 'rb').read()
+    expected = cv2.imread('./img/sample_camera_area.jpg')
+    with MjpegServer([jpeg], content_length=content_length) as server:
+        with MjpegStreamReader(server.url, reconnect_interval=0.01) as reader:
+            img = reader.latest_frame(timeout=5.0)
+            # cv2.VideoCaptureを使わずに受信しても、ファイルから読み込んだ画像と同じになる
+            assert (img == expected).all()
+
+
+@pytest.mark.parametrize('reduce', [2, 4, 8])
+def test_latest_frame_reduced(reduce):
+    jpeg = open('./img/sample_camera_area.jpg', 'rb').read()
+    with MjpegServer([jpeg]) as server:
+        with MjpegStreamReader(server.url) as reader:
+            img = reader.latest_frame(timeout=5.0, reduce=reduce)
+            assert img.shape == (720 // reduce, 1280 // reduce, 3)
+
+
+def test_decode_on_demand():
+    with MjpegServer(create_jpegs(5), interval=0.002) as server:
+        with MjpegStreamReader(server.url) as reader:
+            (timestamp, _) = reader.latest_jpeg(timeout=5.0)
+            assert reader.latest_jpeg(after=timestamp, timeout=5.0) is not None
+            # 受信しただけでは復号しない
+            assert reader.frame_count >= 2
+            assert reader.decode_count == 0
+            # 最新の画像だけを復号する
+            (timestamp, img) = reader.latest(timeout=5.0)
+            assert reader.latest_jpeg()[0] >= timestamp
+            assert reader.decode_count == 1
+
+
+def test_decoded_frame_is_reused():
+    reader = MjpegStreamReader('dummy')
+    reader.jpeg = (1.0, create_jpegs(1)[0])
+    (_, img) = reader.latest()
+    assert reader.latest()[1] is img
+    # 縮小率が違う場合は復号し直す
+    assert reader.latest(reduce=2)[1].shape == (360, 640, 3)
+    assert reader.decode_count == 2
+
+
+def test_latest_waits_for_new_frame():
+    with MjpegServer(create_jpegs(3), interval=0.05) as server:
+        with MjpegStreamReader(server.url) as reader:
+            (first, _) = reader.latest(timeout=5.0)
+            assert reader.latest(after=time.monotonic()) is None
+            (second, _) = reader.latest(after=first, timeout=5.0)
+            assert second > first
+
+
+def test_reconnect():
+    # 1回の接続で2枚ずつ配信して切断するサーバに、接続し直して受信し続ける
+    with MjpegServer(create_jpegs(2), max_frames=2) as server:
+        with MjpegStreamReader(server.url, reconnect_interval=0.01) as reader:
+            limit = time.monotonic() + 5.0
+            while reader.frame_count < 6:
+                assert time.monotonic() < limit
+                time.sleep(0.005)
+        assert server.connections >= 3
+        assert reader.reconnect_count >= 2
+    assert not reader.is_running
+
+
+def test_reconnect_after_malformed_response():
+    # HTTPの形式が誤った応答(http.client.HTTPException)の後も、接続し直して受信し続ける
+    with MjpegServer(create_jpegs(2), malformed=2) as server:
+        with MjpegStreamReader(server.url, reconnect_interval=0.01) as reader:
+            assert reader.latest_frame(timeout=5.0) is not None
+            assert reader.is_running
+        assert server.connections >= 3
+        assert reader.reconnect_count >= 2
+
+
+def test_without_server():
+    reader = MjpegStreamReader('http://127.0.0.1:1/?action=stream', timeout=0.1, reconnect_interval=0.01)
+    with reader:
+        assert reader.latest_frame(timeout=0.1) is None
+    assert not reader.is_running
+
+
+def test_raise_unknown_reduce():
+    with pytest.raises(ValueError):
+        MjpegStreamReader.decode(create_jpegs(1)[0], reduce=3)
@@ -0,0 +1,59 @@
+import cv2
+import pytest
+
+from PerspectiveMaps import PerspectiveMaps
+
+
+@pytest.fixture()
+def img():
+    return cv2.imread('./img/sample_camera_area.jpg')
+
+
+@pytest.mark.parametrize('src_pts, output_size', [
+    # ブロックビンゴエリア
+    ([[148, 290], [639, 60], [1116, 667], [1248, 155]], (640, 640)),
+    # 数字カード
+    ([[-82, 499], [132, 368], [126, 697], [388, 490]], (420, 297)),
+    # 画像の外を含む範囲(Camera.clipの既定値)
+    ([[-30, 460], [400, 450], [190, 620], [200, 360]], (420, 297)),
+])
+def test_same_as_warp_perspective(img, src_pts, output_size):
+    h, w = output_size
+    matrix = PerspectiveMaps.transform(src_pts, output_size)
+    expected = cv2.warpPerspective(img, matrix, (w, h))
+    actual = PerspectiveMaps.get(src_pts, output_size).warp(img)
+    assert actual.shape == expected.shape
+    assert (actual == expected).all()
+
+
+def test_cache():
+    PerspectiveMaps.clear()
+    src_pts = [[148, 290], [639, 60], [1116, 667], [1248, 155]]
+    maps = PerspectiveMaps.get(src_pts, (640, 640))
+    assert PerspectiveMaps.get([tuple(point) for point in src_pts], (640, 640)) is maps
+    # 出力サイズが違う場合は別の座標表を作る
+    assert PerspectiveMaps.get(src_pts, (320, 320)) is not maps
+
+
+def test_cache_size_is_limited():
+    PerspectiveMaps.clear()
+    first = PerspectiveMaps.get([[0, 0], [10, 0], [0, 10], [10, 10]], (8, 8))
+    for i in range(1, PerspectiveMaps.MAX_CACHE_SIZE + 1):
+        PerspectiveMaps.get([[0, 0], [10 + i, 0], [0, 10], [10, 10]], (8, 8))
+    assert len(PerspectiveMaps._cache) == PerspectiveMaps.MAX_CACHE_SIZE
+    # 最も古い座標表は破棄される
+    assert PerspectiveMaps.get([[0, 0], [10, 0], [0, 10], [10, 10]], (8, 8)) is not first
+
+
+@pytest.mark.parametrize('src_pts', [
+    [[248, 390], [739, 160], [1216, 767], [1348, 255]],
+    # 余白の部分を含む範囲
+    [[50, 40], [700, 60], [60, 900], [1450, 880]],
+])
+def test_offset_same_as_padded_image(img, src_pts):
+    padding = 100
+    padded = cv2.copyMakeBorder(img, padding, padding, padding, padding, cv2.BORDER_CONSTANT, value=(255, 255, 255))
+    expected = PerspectiveMaps.get(src_pts, (640, 640)).warp(padded)
+    # 余白を付けずに、余白の分だけ座標をずらして切り取る
+    actual = PerspectiveMaps.get(src_pts, (640, 640), offset=(padding, padding)).warp(img, (255, 255, 255))
+    assert (actual == expected).all()
@@ -0,0 +1,286 @@
+"""
+@file: BingoAreaDetector.py
+@brief: キャプチャした画像からブロックビンゴエリアの四隅を自動で検出する(PointListで4点をクリックする代わり)
+"""
+import cv2
+import numpy as np
+
+from decision_points.PointList import PointList
+
+
+class BingoAreaDetector:
+    """
+    ブロックビンゴエリアの3x3のマス(黒い線で囲まれた白い四角形)を輪郭から見つけ、
+    マスを格子状につなげて求めた射影変換から、エリアの四隅の座標を求めるクラス。
+
+    1. 縮小した画像で、彩度が低く周囲より明るい画素(白い床)の輪郭を求め、凸包が四角形になるものをマスの候補とする。
+       マスの中のサークルやブロックで輪郭が欠けても、凸包と辺の直線の交点で四角形の頂点を求める。
+    2. 候補を1つずつ起点にして、隣のマスがある位置を射影変換で予測し、予測と重なる候補をつなげていく。
+       1マスつなげるたびに、つなげたすべてのマスの頂点から射影変換を求め直す(遠近で大きさが変わっても追従できる)。
+    3. つなげたマスが最も多い格子について、交点サークル(色の付いた画素)が格子の交点に最も多く重なる3x3の範囲を選び、
+       交点サークルの外側(margin)までをエリアの四隅とする。
+
+    検出できたマスと交点サークルの割合を信頼度(0から1)とする。
+    信頼度がmin_confidenceより低い場合は検出に失敗したとみなし、手動で4点を指定する。
+
+    使い方
+        detector = BingoAreaDetector()
+        result = detector.detect(img, is_left=True)
+        if result is not None and result[1] >= detector.min_confidence:
+            (named_points, confidence) = result
+    """
+    GRID_SIZE = 3  # ブロックビンゴエリアのマスの数(縦横)
+    # マスの輪郭(白い床の端)と、格子の線(黒い線の中心)の間隔(マスの大きさに対する割合)
+    CELL_INSET = 0.09
+    # 四角形のマスの頂点の順番と、格子の座標の対応
+    UNIT_CELL = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float64)
+    INSET_CELL = UNIT_CELL + CELL_INSET * np.array([[1, 1], [-1, 1], [-1, -1], [1, -1]])
+    NEIGHBORS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+    def __init__(self, scale=0.5, margin=0.27, min_confidence=0.6):
+        """
+        Parameters
+        ----------
+        scale: float
+            検出に使う画像の縮小率(1280x720の画像は0.5で十分)
+        margin: float
+            四隅の交点サークルの中心から、エリアの角までの距離(マスの大きさに対する割合)。
+            手動で指定する場合と同じく、交点サークルの外側を角にする
+        min_confidence: float
+            検出に成功したとみなす信頼度の下限
+        """
+        self.scale = scale
+        self.margin = margin
+        self.min_confidence = min_confidence
+
+    def detect(self, img, is_left=True):
+        """
+        ブロックビンゴエリアの四隅を検出する
+
+        Parameters
+        ----------
+        img: numpy.ndarray
+            キャプチャした画像(BGR、余白なし)
+        is_left: bool
+            TrueならLコース(角の名前の付け方がコースで異なる)
+
+        Returns
+        -------
+        result: tuple
+            (named_points, confidence)。named_pointsはPointList.named_pointsと同じ辞書(座標は[x, y]の配列)。
+            マスを見つけられない場合はNone
+        """
+        small = cv2.resize(img, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        cells = self.find_cells(hsv)
+        lattice = None
+        grown = set()
+        for (seed, (_, _, solidity)) in enumerate(cells):
+            # 既にほかの格子につながったマスや、サークルで大きく欠けたマスは起点にしない
+            if seed in grown or solidity < 0.8:
+                continue
+            (candidate, used) = self.grow_lattice(cells, seed)
+            grown |= used
+            if lattice is None or len(candidate) > len(lattice):
+                lattice = candidate
+            if len(lattice) == self.GRID_SIZE ** 2:
+                break
+        if lattice is None or len(lattice) < 2:
+            return None
+        matrix = self.fit_lattice(lattice)
+        colored = cv2.integral((hsv[..., 1] >= 60).astype(np.uint8))
+        ((i, j), n_circles) = self.select_window(lattice, matrix, colored)
+        n_cells = sum((i + di, j + dj) in lattice
+                      for di in range(self.GRID_SIZE) for dj in range(self.GRID_SIZE))
+        size = self.GRID_SIZE + self.margin
+        corners = np.array([[i - self.margin, j - self.margin], [i + size, j - self.margin],
+                            [i - self.margin, j + size], [i + size, j + size]], dtype=np.float64)
+        points = cv2.perspectiveTransform(corners[None], matrix)[0] / self.scale
+        named_points = PointList.name_points(points, is_left)
+        if len({tuple(point) for point in named_points.values()}) != 4:
+            # 同じ角に2つの名前が付く(エリアが大きく傾いている)場合は、正しく切り取れない
+            return None
+        confidence = (n_cells + n_circles) / (self.GRID_SIZE ** 2 + (self.GRID_SIZE + 1) ** 2)
+        named_points = {key: np.round(point).astype(int) for (key, point) in named_points.items()}
+        return (named_points, confidence)
+
+    @classmethod
+    def find_cells(cls, hsv):
+        """
+        マスの候補を探す
+
+        Returns
+        -------
+        cells: list
+            (四角形の頂点(4x2), 凸包の面積, 輪郭と凸包の面積比)のリスト
+        """
+        (s, v) = (hsv[..., 1], hsv[..., 2])
+        # 照明のむらがあっても白い床を取り出せるように、周囲の明るさと比べる
+        background = cv2.blur(v, (31, 31))
+        white = (s < 50) & (v.astype(np.int16) > background.astype(np.int16) - 25)
+        white = cv2.morphologyEx(white.astype(np.uint8) * 255, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        (contours, hierarchy) = cv2.findContours(white, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_NONE)[-2:]
+        cells = []
+        for (i, contour) in enumerate(contours):
+            # 外側の輪郭だけを使う(穴の輪郭は黒い線やサークル)
+            if hierarchy[0][i][3] != -1 or len(contour) < 20:
+                continue
+            hull = cv2.convexHull(contour)
+            hull_area = cv2.contourArea(hull)
+            if hull_area < 100:
+                continue
+            quad = cv2.approxPolyDP(hull, 0.06 * cv2.arcLength(hull, True), True)
+            if len(quad) != 4:
+                continue
+            quad = cls.refine_quad(contour, quad.reshape(4, 2).astype(np.float64))
+            cells.append((quad, hull_area, cv2.contourArea(contour) / hull_area))
+        return cells
+
+    @staticmethod
+    def refine_quad(contour, quad):
+        """
+        四角形の各辺に沿った輪郭の点に直線を当てはめ、隣の辺の直線との交点を頂点にする
+
+        交点サークルで角が欠けたマスでも、頂点が格子の交点の近くになる。直線を当てはめられない場合はquadをそのまま返す
+        """
+        points = contour.reshape(-1, 2).astype(np.float32)
+        lines = []
+        for k in range(4):
+            (start, end) = (quad[k], quad[(k + 1) % 4])
+            length = np.linalg.norm(end - start)
+            if length < 1:
+                return quad
+            direction = (end - start) / length
+            normal = np.array([-direction[1], direction[0]])
+            along = (points - start) @ direction
+            distance = np.abs((points - start) @ normal)
+            # 角の近くはサークルで欠けているため、辺の中ほどの点だけを使う
+            selected = points[(along > 0.15 * length) & (along < 0.85 * length) & (distance < max(2.0, 0.04 * length))]
+            if len(selected) < 5:
+                return quad
+            (vx, vy, x0, y0) = cv2.fitLine(selected, cv2.DIST_HUBER, 0, 0.01, 0.01).ravel()
+            lines.append(np.cross([x0, y0, 1.0], [x0 + vx, y0 + vy, 1.0]))
+        refined = []
+        for k in range(4):
+            point = np.cross(lines[k - 1], lines[k])
+            if abs(point[2]) < 1e-9:
+                return quad
+            refined.append(point[:2] / point[2])
+        refined = np.array(refined)
+        if np.linalg.norm(refined - quad, axis=1).max() > 0.25 * np.sqrt(cv2.contourArea(quad.astype(np.float32))):
+            return quad
+        return refined
+
+    @classmethod
+    def fit_lattice(cls, lattice):
+        """
+        格子の座標から画像の座標への射影変換を、つなげたすべてのマスの頂点から求める
+        """
+        src = np.concatenate([np.array(position) + cls.INSET_CELL for position in lattice])
+        dst = np.concatenate(list(lattice.values()))
+        if len(lattice) == 1:
+            return cv2.getPerspectiveTransform(src.astype(np.float32), dst.astype(np.float32)).astype(np.float64)
+        return cv2.findHomography(src, dst, 0)[0]
+
+    @staticmethod
+    def quad_area(quad):
+        (x, y) = (quad[:, 0], quad[:, 1])
+        return 0.5 * abs(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y))
+
+    def grow_lattice(self, cells, seed):
+        """
+        seed番目の候補を起点に、隣のマスを1つずつつなげる
+
+        Returns
+        -------
+        lattice: dict
+            格子の座標(i, j)をキー、マスの頂点(格子の座標の順に並べ替えたもの)を値とする辞書
+        used: set
+            つなげた候補の番号
+        """
+        centers = np.array([quad.mean(axis=0) for (quad, _, _) in cells])
+        areas = np.array([area for (_, area, _) in cells])
+        lattice = {(0, 0): cells[seed][0]}
+        used = {seed}
+        matrix = self.fit_lattice(lattice)
+        while len(lattice) < self.GRID_SIZE ** 2:
+            best = None
+            for position in self.frontier(lattice):
+                predicted = cv2.perspectiveTransform((np.array(position, dtype=np.float64) + self.INSET_CELL)[None], matrix)[0]
+                size = np.sqrt(max(self.quad_area(predicted), 1e-6))
+                distances = np.linalg.norm(centers - predicted.mean(axis=0), axis=1) / size
+                for k in np.argsort(distances)[:3]:
+                    # 中心が近く、面積が同じくらいの候補(サークルの内側などの小さな四角形を除く)
+                    if k in used or distances[k] > 0.25 or not 0.5 < areas[k] / size ** 2 < 1.6:
+                        continue
+                    quad = cells[k][0]
+                    order = [int(np.argmin(np.linalg.norm(quad - vertex, axis=1))) for vertex in predicted]
+                    if len(set(order)) != 4:
+                        continue
+                    error = np.linalg.norm(quad[order] - predicted, axis=1).max() / size
+                    if error <= 0.35 and (best is None or error < best[0]):
+                        best = (error, position, k, quad[order])
+                    break
+            if best is None:
+                break
+            (_, position, k, quad) = best
+            lattice[position] = quad
+            used.add(k)
+            matrix = self.fit_lattice(lattice)
+        return (lattice, used)
+
+    def frontier(self, lattice):
+        """
+        つなげたマスの隣で、格子がGRID_SIZExGRID_SIZEに収まる座標
+        """
+        positions = set()
+        for (i, j) in lattice:
+            for (di, dj) in self.NEIGHBORS:
+                position = (i + di, j + dj)
+                if position in lattice:
+                    continue
+                columns = [p[0] for p in lattice] + [position[0]]
+                rows = [p[1] for p in lattice] + [position[1]]
+                if max(columns) - min(columns) < self.GRID_SIZE and max(rows) - min(rows) < self.GRID_SIZE:
+                    positions.add(position)
+        return sorted(positions)
+
+    def select_window(self, lattice, matrix, colored):
+        """
+        つなげたマスを含む3x3の範囲のうち、格子の交点に交点サークルが最も多く重なるものを選ぶ
+
+        Returns
+        -------
+        result: tuple
+            (範囲の左上の格子の座標, 交点サークルが重なった交点の数)
+        """
+        columns = [i for (i, _) in lattice]
+        rows = [j for (_, j) in lattice]
+        best = None
+        for i in range(max(columns) - self.GRID_SIZE + 1, min(columns) + 1):
+            for j in range(max(rows) - self.GRID_SIZE + 1, min(rows) + 1):
+                count = self.count_circles(matrix, colored, i, j)
+                if best is None or count > best[1]:
+                    best = ((i, j), count)
+        return best
+
+    def count_circles(self, matrix, colored, i, j):
+        """
+        格子の座標(i, j)から始まる範囲の交点のうち、色の付いた画素が多いもの(交点サークル)を数える
+        """
+        n = self.GRID_SIZE + 1
+        points = np.array([[i + di, j + dj] for di in range(n) for dj in range(n)], dtype=np.float64)
+        centers = cv2.perspectiveTransform(points[None], matrix)[0]
+        # 交点サークルの半径はマスの約1割
+        edges = cv2.perspectiveTransform((points + 0.1)[None], matrix)[0]
+        radii = np.maximum(np.linalg.norm(edges - centers, axis=1) / np.sqrt(2), 2)
+        (height, width) = (colored.shape[0] - 1, colored.shape[1] - 1)
+        count = 0
+        for ((x, y), r) in zip(centers, radii):
+            (x0, x1, y0, y1) = (int(x - r), int(x + r) + 1, int(y - r), int(y + r) + 1)
+            if x0 < 0 or y0 < 0 or x1 > width or y1 > height:
+                continue
+            total = colored[y1, x1] - colored[y0, x1] - colored[y1, x0] + colored[y0, x0]
+            if total > 0.15 * (x1 - x0) * (y1 - y0):
+                count += 1
+        return count
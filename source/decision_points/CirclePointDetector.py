@@ -0,0 +1,195 @@
+"""
+@file: CirclePointDetector.py
+@brief: 切り取ったブロックビンゴエリアの画像から、交点サークルとブロックサークルの中心を自動で求める
+        (GetCirclePoint, MoveGetCirclePointで手動で指定する代わり)
+"""
+import cv2
+import numpy as np
+
+
+class CirclePointDetector:
+    """
+    交点サークル(4x4)とブロックサークル(8個)が格子状に並ぶことを使って、各サークルの中心を求めるクラス。
+
+    1. 色の付いた画素のかたまり(サークルの輪)のうち、大きさの合うものを、標準の配置(切り取った画像の四隅から
+       marginだけ内側に交点サークルが並ぶ配置)で予測した位置に対応付け、格子から画像への射影変換を求める。
+    2. 射影変換で予測した位置の周りで、サークルの輪の輪郭に円を当てはめ、中心をサブピクセルの精度で求める。
+       ブロックが重なって輪が欠けていても、見えている輪郭の点から円を求める。
+    3. 当てはめた中心から射影変換を求め直し、予測から外れた中心や、円を当てはめられなかったサークルは
+       射影変換で予測した位置にする。
+
+    円を当てはめられたサークルの割合を信頼度(0から1)とする。
+
+    使い方
+        detector = CirclePointDetector()
+        result = detector.detect(block_bingo_img)
+        if result is not None and result[1] >= detector.min_confidence:
+            (named_points, confidence) = result
+    """
+    # サークルのキーと、格子の座標(交点サークルの間隔を1とする)。キーの付け方はGetCirclePoint.named_pointsと同じ
+    LATTICE = dict(
+        [('c{}{}'.format(x, y), (x, y)) for y in range(4) for x in range(4)] +
+        [('b{}'.format(i + 1), (x + 0.5, y + 0.5))
+         for (i, (x, y)) in enumerate([(0, 0), (1, 0), (2, 0), (0, 1), (2, 1), (0, 2), (1, 2), (2, 2)])])
+    # サークルの輪の外側の半径(交点サークルの間隔に対する割合)
+    CROSS_CIRCLE_RADIUS = 0.14
+    BLOCK_CIRCLE_RADIUS = 0.31
+
+    def __init__(self, margin=0.27, min_confidence=0.6):
+        """
+        Parameters
+        ----------
+        margin: float
+            切り取った画像の端から、端の交点サークルの中心までの距離の標準値(交点サークルの間隔に対する割合)。
+            BingoAreaDetectorのmarginと同じ値にする
+        min_confidence: float
+            検出に成功したとみなす信頼度の下限
+        """
+        self.margin = margin
+        self.min_confidence = min_confidence
+        self.keys = list(self.LATTICE)
+        self.lattice = np.array([self.LATTICE[key] for key in self.keys], dtype=np.float64)
+        self.radii = np.array([self.CROSS_CIRCLE_RADIUS if key.startswith('c') else self.BLOCK_CIRCLE_RADIUS
+                               for key in self.keys])
+
+    def detect(self, img):
+        """
+        各サークルの中心を求める
+
+        Parameters
+        ----------
+        img: numpy.ndarray
+            切り取ったブロックビンゴエリアの画像(BGR)
+
+        Returns
+        -------
+        result: tuple
+            (named_points, confidence)。named_pointsはGetCirclePoint.named_pointsと同じ辞書(座標は[x, y]の整数のリスト)。
+            サークルの並びを見つけられない場合はNone
+        """
+        result = self.locate(img)
+        if result is None:
+            return None
+        (centers, refined) = result
+        named_points = {key: [int(round(x)), int(round(y))] for (key, (x, y)) in centers.items()}
+        return (named_points, len(refined) / len(self.keys))
+
+    def locate(self, img):
+        """
+        各サークルの中心をサブピクセルの精度で求める
+
+        Returns
+        -------
+        result: tuple
+            (centers, refined)。centersはキーと中心の座標(float)の辞書、refinedは円を当てはめられたサークルのキーの集合。
+            サークルの並びを見つけられない場合はNone
+        """
+        (height, width) = img.shape[:2]
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        mask = ((hsv[..., 1] >= 80) & (hsv[..., 2] >= 50)).astype(np.uint8)
+        # 輪の外側の輪郭の点をまとめて取り出しておき、サークルごとに予測した位置の周りの点を使う
+        contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[-2]
+        if not contours:
+            return None
+        points = np.concatenate([contour.reshape(-1, 2) for contour in contours]).astype(np.float64)
+        # x座標の順に並べておき、サークルごとに予測した位置の周りの点を二分探索で取り出す
+        points = points[np.argsort(points[:, 0], kind='stable')]
+
+        step = min(width, height) / (3 + 2 * self.margin)
+        matrix = np.array([[width / (3 + 2 * self.margin), 0, self.margin * width / (3 + 2 * self.margin)],
+                           [0, height / (3 + 2 * self.margin), self.margin * height / (3 + 2 * self.margin)],
+                           [0, 0, 1]], dtype=np.float64)
+        matrix = self.match_blobs(mask, matrix, step)
+        if matrix is None:
+            return None
+        predicted = cv2.perspectiveTransform(self.lattice[None], matrix)[0]
+        fitted = [self.fit_ring(points, center, radius * step) for (center, radius) in zip(predicted, self.radii)]
+        # 円を当てはめた中心で射影変換を求め直す
+        found = [i for (i, center) in enumerate(fitted) if center is not None]
+        if len(found) < 6:
+            return None
+        (matrix, _) = cv2.findHomography(self.lattice[found], np.array([fitted[i] for i in found]),
+                                         cv2.RANSAC, 0.05 * step)
+        if matrix is None:
+            return None
+        predicted = cv2.perspectiveTransform(self.lattice[None], matrix)[0]
+        centers = {}
+        refined = set()
+        for (i, key) in enumerate(self.keys):
+            # 予測から外れた中心は、ほかのサークルやブロックの輪郭に当てはめたものとみなし、
+            # 求め直した射影変換で予測した位置の周りでもう一度当てはめる
+            if fitted[i] is None or np.linalg.norm(fitted[i] - predicted[i]) >= 0.05 * step:
+                fitted[i] = self.fit_ring(points, predicted[i], self.radii[i] * step)
+            if fitted[i] is not None and np.linalg.norm(fitted[i] - predicted[i]) < 0.05 * step:
+                centers[key] = fitted[i]
+                refined.add(key)
+            else:
+                centers[key] = predicted[i]
+        return (centers, refined)
+
+    def match_blobs(self, mask, matrix, step):
+        """
+        色の付いた画素のかたまりのうち、標準の配置で予測した位置に近く、大きさの合うものから射影変換を求める
+        """
+        (_, _, stats, centroids) = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        (stats, centroids) = (stats[1:], centroids[1:])
+        if len(stats) == 0:
+            return None
+        predicted = cv2.perspectiveTransform(self.lattice[None], matrix)[0]
+        (src, dst) = ([], [])
+        for (point, center, radius) in zip(self.lattice, predicted, self.radii * step):
+            distances = np.linalg.norm(centroids - center, axis=1)
+            i = int(np.argmin(distances))
+            (w, h) = stats[i, cv2.CC_STAT_WIDTH], stats[i, cv2.CC_STAT_HEIGHT]
+            # ブロックが重なると大きさが変わるため、縦横比と大きさは緩く確かめる
+            if distances[i] < 0.3 * step and 0.5 < w / max(h, 1) < 2 and abs(max(w, h) / 2 - radius) < 0.4 * radius:
+                src.append(point)
+                dst.append(centroids[i])
+        if len(src) < 6:
+            return None
+        return cv2.findHomography(np.array(src), np.array(dst), cv2.RANSAC, 0.05 * step)[0]
+
+    @staticmethod
+    def fit_circle(points):
+        """
+        点の集まりに最小二乗法で円を当てはめ、(中心, 半径)を返す
+        """
+        # 数値誤差を小さくするため、重心を原点にしてから正規方程式を解く
+        mean = points.mean(axis=0)
+        (x, y) = (points - mean).T
+        a = np.array([[x @ x, x @ y, x.sum()], [x @ y, y @ y, y.sum()], [x.sum(), y.sum(), len(x)]])
+        z = x * x + y * y
+        (c0, c1, c2) = np.linalg.solve(a, [x @ z, y @ z, z.sum()])
+        center = np.array([c0 / 2, c1 / 2])
+        return (center + mean, np.sqrt(max(c2 + center @ center, 0.0)))
+
+    def fit_ring(self, points, center, radius):
+        """
+        予測した中心の周りで、サークルの輪の輪郭に円を当てはめ、中心を返す。当てはめられない場合はNone
+        """
+        # pointsはx座標の順に並んでいる。予測した位置の周りの点だけを取り出してから、距離を求める
+        (start, stop) = np.searchsorted(points[:, 0], [center[0] - 1.3 * radius, center[0] + 1.3 * radius])
+        near = points[start:stop]
+        near = near[np.abs(near[:, 1] - center[1]) < 1.3 * radius]
+        distances = np.hypot(near[:, 0] - center[0], near[:, 1] - center[1])
+        selected = near[(distances > 0.6 * radius) & (distances < 1.3 * radius)]
+        if len(selected) < 10:
+            return None
+        fitted_center = center
+        fitted_radius = radius
+        for _ in range(2):
+            (fitted_center, fitted_radius) = self.fit_circle(selected)
+            residuals = np.abs(np.hypot(selected[:, 0] - fitted_center[0], selected[:, 1] - fitted_center[1])
+                               - fitted_radius)
+            # 円から離れた点(ブロックの輪郭など)を除いて当てはめ直す
+            inliers = residuals < max(1.5, 0.1 * fitted_radius)
+            if inliers.sum() < 10:
+                return None
+            selected = selected[inliers]
+        # 輪郭の点が円周の半分以上にわたっていること
+        angles = np.arctan2(selected[:, 1] - fitted_center[1], selected[:, 0] - fitted_center[0])
+        coverage = np.count_nonzero(np.bincount(((angles + np.pi) * (16 / (2 * np.pi))).astype(int) % 16, minlength=16)) / 16
+        if coverage < 0.5 or abs(fitted_radius - radius) > 0.35 * radius \
+                or np.linalg.norm(fitted_center - center) > 0.5 * radius:
+            return None
+        return fitted_center
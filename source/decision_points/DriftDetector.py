@@ -0,0 +1,155 @@
+"""
+@file: DriftDetector.py
+@brief: 設定ファイルの座標を指定した時の画像と、キャプチャした画像を比べて、カメラが動いたか(座標がずれたか)を調べる
+"""
+import base64
+
+import cv2
+import numpy as np
+
+
+class DriftDetector:
+    """
+    座標を指定した時の画像(基準の画像)の特徴点(ORB)を保存しておき、キャプチャした画像の特徴点と対応付けて
+    基準の画像からキャプチャした画像への射影変換を求めるクラス。
+
+    特徴点は、切り取る領域(数字カード、ブロックビンゴエリア)を少し広げた範囲の床から取り出す。
+    床は平面のため、カメラが動いても1つの射影変換で座標を移せる。
+
+    使い方
+        detector = DriftDetector()
+        reference = detector.describe(img, regions)  # 座標を指定した時に保存する(JSONに書き込める辞書)
+        result = detector.estimate(reference, new_img)
+        if result is not None:
+            (matrix, inliers) = result
+            shift = detector.shift(matrix, points)  # 座標がずれた大きさ
+    """
+
+    def __init__(self, scale=0.5, n_features=500, region_margin=0.5, min_inliers=30, tolerance=3.0):
+        """
+        Parameters
+        ----------
+        scale: float
+            特徴点を取り出す画像の縮小率
+        n_features: int
+            取り出す特徴点の最大数
+        region_margin: float
+            特徴点を取り出す範囲を、切り取る領域からどれだけ広げるか(領域の大きさに対する割合)
+        min_inliers: int
+            射影変換を求められたとみなす、対応付けられた特徴点の数の下限
+        tolerance: float
+            カメラが動いていないとみなす、座標のずれの上限(単位：px)
+        """
+        self.scale = scale
+        self.n_features = n_features
+        self.region_margin = region_margin
+        self.min_inliers = min_inliers
+        self.tolerance = tolerance
+        # カメラの位置がずれても写る大きさはほとんど変わらないため、ピラミッドの段数を減らす(座標の精度が上がる)
+        self.orb = cv2.ORB_create(nfeatures=n_features, nlevels=3)
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+
+    def describe(self, img, regions=None):
+        """
+        基準の画像の特徴点を求める
+
+        Parameters
+        ----------
+        img: numpy.ndarray
+            座標を指定した時の画像(余白なし)
+        regions: list
+            切り取る領域の四隅の座標のリスト(余白なしの画像の座標)。Noneの場合は画像全体から特徴点を取り出す
+
+        Returns
+        -------
+        reference: dict
+            画像の大きさ、特徴点の座標(float32)と特徴量(uint8)をbase64にしたもの。設定ファイルにそのまま保存できる
+        """
+        (keypoints, descriptors) = self.detect_features(img, regions)
+        return {"size": list(img.shape[:2]),
+                "keypoints": base64.b64encode(keypoints.astype(np.float32).tobytes()).decode('ascii'),
+                "descriptors": base64.b64encode(descriptors.tobytes()).decode('ascii')}
+
+    def estimate(self, reference, img):
+        """
+        基準の画像からキャプチャした画像への射影変換を求める
+
+        Parameters
+        ----------
+        reference: dict
+            describeで求めた基準の画像の特徴点
+        img: numpy.ndarray
+            キャプチャした画像(余白なし)
+
+        Returns
+        -------
+        result: tuple
+            (射影変換の行列, 対応付けられた特徴点の数)。画像の大きさが違う場合や、対応付けられた特徴点が少ない場合はNone
+        """
+        if list(img.shape[:2]) != list(reference["size"]):
+            return None
+        ref_keypoints = np.frombuffer(base64.b64decode(reference["keypoints"]), dtype=np.float32).reshape(-1, 2)
+        ref_descriptors = np.frombuffer(base64.b64decode(reference["descriptors"]), dtype=np.uint8).reshape(-1, 32)
+        # カメラが動くと切り取る領域もずれるため、キャプチャした画像は全体から特徴点を取り出す
+        (keypoints, descriptors) = self.detect_features(img)
+        if len(ref_keypoints) < self.min_inliers or len(keypoints) < self.min_inliers:
+            return None
+        matches = self.matcher.match(ref_descriptors, descriptors)
+        if len(matches) < self.min_inliers:
+            return None
+        src = ref_keypoints[[match.queryIdx for match in matches]]
+        dst = keypoints[[match.trainIdx for match in matches]]
+        (matrix, mask) = cv2.findHomography(src, dst, cv2.RANSAC, 1.5 / self.scale)
+        if matrix is None or mask.sum() < self.min_inliers:
+            return None
+        inliers = mask.ravel().astype(bool)
+        return (self.refine(matrix, src[inliers], dst[inliers]), int(inliers.sum()))
+
+    @staticmethod
+    def refine(matrix, src, dst):
+        """
+        対応付けられた特徴点だけで射影変換を求め直す
+        特徴点が一直線上に並んでいる場合など、求め直せない場合はmatrix(RANSACで求めた射影変換)をそのまま返す
+        """
+        (refined, _) = cv2.findHomography(src, dst, 0)
+        if refined is None or not np.isfinite(refined).all():
+            return matrix
+        return refined
+
+    def detect_features(self, img, regions=None):
+        """
+        縮小した画像から特徴点を取り出し、(元の画像での座標, 特徴量)を返す
+        """
+        gray = cv2.cvtColor(cv2.resize(img, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_BGR2GRAY)
+        mask = None
+        if regions is not None:
+            mask = np.zeros(gray.shape, dtype=np.uint8)
+            for region in regions:
+                points = np.array(region, dtype=np.float64) * self.scale
+                center = points.mean(axis=0)
+                points = center + (points - center) * (1 + self.region_margin)
+                cv2.fillConvexPoly(mask, cv2.convexHull(np.round(points).astype(np.int32)), 255)
+        (keypoints, descriptors) = self.orb.detectAndCompute(gray, mask)
+        if descriptors is None:
+            return (np.empty((0, 2), dtype=np.float32), np.empty((0, 32), dtype=np.uint8))
+        return (np.array([keypoint.pt for keypoint in keypoints], dtype=np.float32) / self.scale, descriptors)
+
+    @staticmethod
+    def shift(matrix, points):
+        """
+        座標を射影変換で移した時に、最も大きく動く座標の移動量(単位：px)を返す
+        """
+        points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        moved = cv2.perspectiveTransform(points[None], matrix)[0]
+        return float(np.linalg.norm(moved - points, axis=1).max())
+
+    @staticmethod
+    def transform(matrix, named_points, offset=0):
+        """
+        四隅の座標の辞書を射影変換で移す。offsetは座標を指定した画像の余白(単位：px)
+        """
+        keys = list(named_points)
+        points = np.array([named_points[key] for key in keys], dtype=np.float64) - offset
+        moved = cv2.perspectiveTransform(points[None], matrix)[0] + offset
+        return {key: np.round(point).astype(int) for (key, point) in zip(keys, moved)}
@@ -39,7 +39,11 @@ class MoveGetCirclePoint:
         # self.canvas.pack()
 
     def convert_img(self, img='./../img/block_bingo_img_dummy.png'):
-        img = Image.open(img)
+        if isinstance(img, str):
+            img = Image.open(img)
+        else:
+            # OpenCVの画像（BGR）はファイルに保存せずにそのまま表示する
+            img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
         self.image_tk = ImageTk.PhotoImage(img)
         self.canvas.create_image(0, 0, image=self.image_tk, anchor=tk.NW)  # ImageTk画像配置
         self.canvas.pack()
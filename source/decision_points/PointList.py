@@ -22,21 +22,30 @@ class PointList:
         return False
 
     def trans(self):
-        sum_list = np.sum(self.ptlist, axis=1)
-        x_list = self.ptlist[:, 0]
-        y_list = self.ptlist[:, 1]
-        if self.is_left:  # TrueならLコース
-            self.named_points["r_btm"] = self.ptlist[np.argmax(x_list)]
-            self.named_points["r_top"] = self.ptlist[np.argmin(y_list)]
-            self.named_points["l_top"] = self.ptlist[np.argmin(x_list)]
-            self.named_points["l_btm"] = self.ptlist[np.argmax(y_list)]
-        else:  # FalseならRコース
-            self.named_points["r_btm"] = self.ptlist[np.argmax(y_list)]
-            self.named_points["r_top"] = self.ptlist[np.argmax(x_list)]
-            self.named_points["l_btm"] = self.ptlist[np.argmin(x_list)]
-            self.named_points["l_top"] = self.ptlist[np.argmin(y_list)]
+        self.named_points = self.name_points(self.ptlist, self.is_left)
         print(self.named_points)
 
+    @staticmethod
+    def name_points(points, is_left=True):
+        """
+        4点の座標に、ブロックビンゴエリアの角の名前(l_top, l_btm, r_top, r_btm)を付ける
+        (手動で指定した座標にも、BingoAreaDetectorで検出した座標にも使う)
+        """
+        x_list = points[:, 0]
+        y_list = points[:, 1]
+        named_points = {}
+        if is_left:  # TrueならLコース
+            named_points["r_btm"] = points[np.argmax(x_list)]
+            named_points["r_top"] = points[np.argmin(y_list)]
+            named_points["l_top"] = points[np.argmin(x_list)]
+            named_points["l_btm"] = points[np.argmax(y_list)]
+        else:  # FalseならRコース
+            named_points["r_btm"] = points[np.argmax(y_list)]
+            named_points["r_top"] = points[np.argmax(x_list)]
+            named_points["l_btm"] = points[np.argmin(x_list)]
+            named_points["l_top"] = points[np.argmin(y_list)]
+        return {key: named_points[key] for key in ("l_top", "l_btm", "r_top", "r_btm")}
+
     @staticmethod
     def add_point(event, x, y, flag, params):
         wname, img, ptlist = params
@@ -0,0 +1,100 @@
+import json
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from BingoAreaDetector import BingoAreaDetector
+from PointList import PointList
+
+
+def load_snapshots():
+    # 手動で切り取る座標を指定したカメラ画像
+    with open('./detection_block/data/corpus.json', mode='r') as fp:
+        return [entry for entry in json.load(fp)["images"] if "block_bingo_img_range" in entry]
+
+
+def transform(img_range, output_size=(640, 640)):
+    (h, w) = output_size
+    src = np.array([img_range[key] for key in ("l_top", "r_top", "l_btm", "r_btm")], dtype=np.float32)
+    dst = np.array([[0, 0], [w, 0], [0, h], [w, h]], dtype=np.float32)
+    return cv2.getPerspectiveTransform(src, dst)
+
+
+@pytest.mark.parametrize('entry', load_snapshots(), ids=lambda entry: entry["name"])
+def test_detect_snapshot(entry):
+    detector = BingoAreaDetector()
+    (named_points, confidence) = detector.detect(cv2.imread(entry["image"]))
+    assert confidence >= detector.min_confidence
+    # 手動で指定した座標で切り取った画像の交点サークルを、検出した座標で切り取った画像に移す
+    cross_circles = {key: point for (key, point) in entry["circles_coordinates"].items() if key.startswith('c')}
+    points = np.array(list(cross_circles.values()), dtype=np.float64)
+    manual_to_img = np.linalg.inv(transform(entry["block_bingo_img_range"]))
+    clipped = cv2.perspectiveTransform(points[None], transform(named_points) @ manual_to_img)[0]
+    # 検出した座標で切り取ると、交点サークルは四隅から余白(margin)の分だけ内側に等間隔で並ぶ
+    step = 640 / (3 + 2 * detector.margin)
+    for (key, point) in zip(cross_circles, clipped):
+        expected = (np.array([int(key[1]), int(key[2])]) + detector.margin) * step
+        assert np.linalg.norm(point - expected) < 30, key
+
+
+def test_detect_sample():
+    detector = BingoAreaDetector()
+    (named_points, confidence) = detector.detect(cv2.imread('./img/sample_camera_area.jpg'))
+    assert confidence >= detector.min_confidence
+    # test_Camera.pyで手動で指定した座標(余白100pxを除いたもの)の近く
+    # (r_btmは手動で指定した座標が交点サークルの内側に寄っているため比べない)
+    manual = {"l_top": [148, 290], "l_btm": [1116, 667], "r_top": [639, 60]}
+    for key in manual:
+        assert np.linalg.norm(named_points[key] - manual[key]) < 60, key
+
+
+def test_detect_with_blocks():
+    detector = BingoAreaDetector()
+    (_, confidence) = detector.detect(cv2.imread('./img/sample_camera_area_with_block.jpg'))
+    assert confidence >= detector.min_confidence
+
+
+def test_detect_right_course():
+    img = cv2.imread('./img/sample_camera_area.jpg')
+    (left, _) = BingoAreaDetector().detect(img, is_left=True)
+    (right, _) = BingoAreaDetector().detect(img, is_left=False)
+    # 同じ四隅に、Rコースの名前を付ける
+    assert {tuple(point) for point in left.values()} == {tuple(point) for point in right.values()}
+    assert (right["l_top"] == left["r_top"]).all()
+    assert (right["r_btm"] == left["l_btm"]).all()
+
+
+@pytest.mark.parametrize('img', [
+    np.full((720, 1280, 3), 255, dtype=np.uint8),
+    np.random.RandomState(0).randint(0, 256, (720, 1280, 3)).astype(np.uint8),
+    cv2.imread('./img/sample_number.png'),
+])
+def test_detect_without_bingo_area(img):
+    assert BingoAreaDetector().detect(img) is None
+
+
+def test_detect_time():
+    detector = BingoAreaDetector()
+    img = cv2.imread('./img/sample_camera_area_with_block.jpg')
+    times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        detector.detect(img)
+        times.append(time.perf_counter() - start)
+    assert min(times) < 0.1
+
+
+def test_name_points():
+    points = np.array([[100, 300], [600, 50], [1100, 650], [1250, 150]])
+    left = PointList.name_points(points, is_left=True)
+    assert left["l_top"].tolist() == [100, 300]
+    assert left["r_top"].tolist() == [600, 50]
+    assert left["l_btm"].tolist() == [1100, 650]
+    assert left["r_btm"].tolist() == [1250, 150]
+    right = PointList.name_points(points, is_left=False)
+    assert right["l_btm"].tolist() == [100, 300]
+    assert right["l_top"].tolist() == [600, 50]
+    assert right["r_btm"].tolist() == [1100, 650]
+    assert right["r_top"].tolist() == [1250, 150]
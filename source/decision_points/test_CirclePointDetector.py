@@ -0,0 +1,87 @@
+import json
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from CirclePointDetector import CirclePointDetector
+
+
+def load_corpus():
+    # 各サークルの座標を手動で指定した画像
+    with open('./detection_block/data/corpus.json', mode='r') as fp:
+        return json.load(fp)["images"]
+
+
+def clip(entry):
+    img = cv2.imread(entry["image"])
+    if "block_bingo_img_range" not in entry:
+        return img
+    src = np.array([entry["block_bingo_img_range"][key] for key in ("l_top", "r_top", "l_btm", "r_btm")],
+                   dtype=np.float32)
+    dst = np.array([[0, 0], [640, 0], [0, 640], [640, 640]], dtype=np.float32)
+    return cv2.warpPerspective(img, cv2.getPerspectiveTransform(src, dst), (640, 640))
+
+
+@pytest.mark.parametrize('entry', load_corpus(), ids=lambda entry: entry["name"])
+def test_detect_corpus(entry):
+    detector = CirclePointDetector()
+    (named_points, confidence) = detector.detect(clip(entry))
+    assert confidence >= detector.min_confidence
+    assert set(named_points) == set(entry["circles_coordinates"])
+    # 手動で指定した座標の近く（ブロックが置かれた画像でも）
+    errors = [np.linalg.norm(np.subtract(named_points[key], point))
+              for (key, point) in entry["circles_coordinates"].items()]
+    assert np.mean(errors) < 6
+    assert max(errors) < 15
+
+
+def test_detect_sample():
+    (named_points, _) = CirclePointDetector().detect(cv2.imread('./img/sample_bingo.png'))
+    # BlockRecognizerで画像を切り取るため、座標は整数
+    assert all(isinstance(value, int) for point in named_points.values() for value in point)
+    # 交点サークルとブロックサークルの並び
+    assert named_points["c00"][0] < named_points["c10"][0] < named_points["c20"][0] < named_points["c30"][0]
+    assert named_points["c00"][1] < named_points["c01"][1] < named_points["c02"][1] < named_points["c03"][1]
+    assert named_points["c00"][0] < named_points["b1"][0] < named_points["c11"][0]
+    assert named_points["c00"][1] < named_points["b1"][1] < named_points["c11"][1]
+
+
+def test_locate_subpixel():
+    # 半径と中心が分かっている輪を描いた画像
+    img = np.full((640, 640, 3), 255, dtype=np.uint8)
+    detector = CirclePointDetector()
+    step = 640 / (3 + 2 * detector.margin)
+    expected = {}
+    for (key, (x, y)) in detector.LATTICE.items():
+        center = (np.array([x, y]) + detector.margin) * step + [0.3, -0.4]
+        radius = (detector.CROSS_CIRCLE_RADIUS if key.startswith('c') else detector.BLOCK_CIRCLE_RADIUS) * step
+        # 1/16ピクセル単位で描く
+        cv2.circle(img, tuple(int(v) for v in np.round(center * 16)), int(radius * 0.85 * 16), (0, 0, 255),
+                   int(radius * 0.3), lineType=cv2.LINE_AA, shift=4)
+        expected[key] = center
+    (centers, refined) = detector.locate(img)
+    assert refined == set(detector.LATTICE)
+    for (key, center) in centers.items():
+        assert np.linalg.norm(center - expected[key]) < 0.5, key
+
+
+@pytest.mark.parametrize('img', [
+    np.full((640, 640, 3), 255, dtype=np.uint8),
+    np.random.RandomState(0).randint(0, 256, (640, 640, 3)).astype(np.uint8),
+    cv2.resize(cv2.imread('./img/sample_number.png'), (640, 640)),
+])
+def test_detect_without_circles(img):
+    assert CirclePointDetector().detect(img) is None
+
+
+def test_detect_time():
+    detector = CirclePointDetector()
+    img = clip(load_corpus()[0])
+    times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        detector.detect(img)
+        times.append(time.perf_counter() - start)
+    assert min(times) < 0.05
@@ -0,0 +1,82 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from DriftDetector import DriftDetector
+
+
+# sample_camera_area.jpgのブロックビンゴエリアの四隅（test_Camera.pyで手動で指定した座標から余白100pxを除いたもの）
+REGION = [[148, 290], [639, 60], [1248, 155], [1116, 667]]
+
+
+@pytest.fixture()
+def img():
+    return cv2.imread('./img/sample_camera_area.jpg')
+
+
+def warp(img, matrix):
+    return cv2.warpPerspective(img, matrix.astype(np.float64), (img.shape[1], img.shape[0]))
+
+
+def test_describe_json(img):
+    detector = DriftDetector()
+    reference = detector.describe(img, [REGION])
+    # 設定ファイルに保存して読み込んでも使える
+    reference = json.loads(json.dumps(reference))
+    (matrix, inliers) = detector.estimate(reference, img)
+    assert inliers >= detector.min_inliers
+    assert detector.shift(matrix, REGION) < 0.5
+
+
+@pytest.mark.parametrize('matrix', [
+    np.array([[1, 0, 6], [0, 1, -4], [0, 0, 1]]),
+    np.array([[np.cos(0.02), -np.sin(0.02), 30], [np.sin(0.02), np.cos(0.02), 15], [0, 0, 1]]),
+    np.array([[1, 0.01, -40], [0, 1, 25], [1e-5, 0, 1]]),
+])
+def test_estimate_moved_camera(img, matrix):
+    detector = DriftDetector()
+    reference = detector.describe(img, [REGION])
+    (estimated, _) = detector.estimate(reference, warp(img, matrix))
+    assert detector.shift(estimated, REGION) > detector.tolerance
+    # 補正した座標は、実際に動いた先の近く
+    points = np.array(REGION, dtype=np.float64)
+    expected = cv2.perspectiveTransform(points[None], matrix)[0]
+    corrected = detector.transform(estimated, dict(enumerate(REGION)))
+    assert np.abs(np.array(list(corrected.values())) - expected).max() < 5
+
+
+def test_estimate_other_scene(img):
+    detector = DriftDetector()
+    reference = detector.describe(img, [REGION])
+    # 何も写っていない画像や、大きさの違う画像
+    assert detector.estimate(reference, np.full_like(img, 255)) is None
+    assert detector.estimate(reference, cv2.resize(img, (640, 360))) is None
+
+
+@pytest.mark.parametrize('src', [
+    np.array([[i, 2 * i] for i in range(40)], dtype=np.float32),  # 一直線上に並ぶ
+    np.full((40, 2), 100, dtype=np.float32),  # すべて同じ座標
+])
+def test_refine_degenerate_points(src):
+    # 求め直せない場合は、RANSACで求めた射影変換を使う
+    matrix = np.array([[1, 0, 5], [0, 1, -3], [0, 0, 1]], dtype=np.float64)
+    refined = DriftDetector.refine(matrix, src, src + [5, -3])
+    assert refined is matrix
+    assert DriftDetector.shift(refined, REGION) == pytest.approx(np.hypot(5, 3))
+
+
+def test_refine_inliers():
+    matrix = np.eye(3)
+    src = np.array([[0, 0], [100, 0], [100, 100], [0, 100], [50, 30]], dtype=np.float32)
+    refined = DriftDetector.refine(matrix, src, src + [5, -3])
+    assert refined == pytest.approx(np.array([[1, 0, 5], [0, 1, -3], [0, 0, 1]]), abs=1e-6)
+
+
+def test_transform_with_padding():
+    named_points = {"l_top": [110, 120], "r_btm": [300, 400]}
+    matrix = np.array([[1, 0, 5], [0, 1, -3], [0, 0, 1]], dtype=np.float64)
+    moved = DriftDetector.transform(matrix, named_points, offset=100)
+    assert moved["l_top"].tolist() == [115, 117]
+    assert moved["r_btm"].tolist() == [305, 397]
@@ -1,11 +1,77 @@
 from block_bingo.BlockBingoCoordinate import CrossCirclesCoordinate, BlockCirclesCoordinate
 from block_bingo.BlockBingoCoordinate import Color
+from detection_block.HistogramBank import HistogramBank
+from detection_block.HsvLookupTable import HsvLookupTable
+from detection_block.WhiteBalance import WhiteBalance
+from collections import Counter
+import time
 import cv2
 import numpy as np
-import glob
+
+class ColorClassification:
+    """
+    1つのブロック画像の色識別結果を表すクラス
+    """
+    def __init__(self, color, similarity, runner_up, runner_up_similarity):
+        """
+        Parameters
+        ----------
+        color: Color
+            類似度が最も高い色
+        similarity: float
+            colorの類似度
+        runner_up: Color
+            類似度が2番目に高い色
+        runner_up_similarity: float
+            runner_upの類似度
+        """
+        self.color = color
+        self.similarity = similarity
+        self.runner_up = runner_up
+        self.runner_up_similarity = runner_up_similarity
+        self.margin = similarity - runner_up_similarity  # 1位と2位の類似度の差
+
+    @classmethod
+    def from_similarity(cls, similarity, colors=HistogramBank.SAMPLE_COLORS):
+        """
+        色ごとの類似度から識別結果を作る
+
+        Parameters
+        ----------
+        similarity: numpy.ndarray
+            色ごとの類似度
+        colors: tuple
+            similarityの各要素に対応する色
+        """
+        # 類似度が同じ場合は前にある色を優先する
+        order = np.argsort(-similarity, kind='stable')
+        (first, second) = order[:2]
+        return cls(colors[first], float(similarity[first]), colors[second], float(similarity[second]))
+
+    def is_ambiguous(self, min_margin):
+        """
+        1位と2位の類似度の差がmin_marginより小さい場合に、識別結果があいまいであると判定する
+        """
+        return self.margin < min_margin
+
+    def __repr__(self):
+        return "ColorClassification({}: {:.3f}, {}: {:.3f})".format(
+            self.color.name, self.similarity, self.runner_up.name, self.runner_up_similarity)
+
 
 class BlockRecognizer:
-    def __init__(self, bonus, is_left):
+    # ブロックサークルのキー
+    BLOCK_CIRCLES = ['b' + str(i + 1) for i in range(0, 8)]
+    # 交点サークルのキーと、CrossCirclesCoordinateにおける座標
+    CROSS_CIRCLES = [('c' + row + col, (int(col), int(row))) for col in "0123" for row in "0123"]
+    # 初期配置でブロックが置かれていない交点サークルのキー(照明の補正で白い部分として使う)
+    EMPTY_CROSS_CIRCLES = [key for (key, coordinate) in CROSS_CIRCLES if coordinate not in CrossCirclesCoordinate().open]
+
+    # 色識別の方法
+    METHODS = ('histogram', 'lookup_table')
+
+    def __init__(self, bonus, is_left, sample_dir='detection_block/img', min_margin=0.01, method='histogram',
+                 roi=True, executor=None, chunk_size=6, white_balance=False):
         """
         Parameters
         ----------
@@ -13,10 +79,45 @@ class BlockRecognizer:
             ボーナスサークルの番号
         is_left: bool
             コース情報
+        sample_dir: str
+            色識別に用いるサンプル画像のディレクトリ
+        min_margin: float
+            1位と2位の色の類似度の差がこれより小さいサークルを、識別結果があいまいなサークルとする
+        method: str
+            色識別の方法。'histogram'はサンプル画像とのヒストグラム比較、
+            'lookup_table'はHSV値から色を引く表による画素ごとの多数決
+        roi: bool
+            Trueの場合、数字やノイズの削除を各サークルの周辺だけで行う(識別結果は画像全体で行う場合と同じ)
+        executor: concurrent.futures.Executor
+            サークルの識別を並列に行うためのExecutor(ThreadPoolExecutorなど)。Noneの場合は並列化しない
+        chunk_size: int
+            executorの1つのタスクで識別するサークルの数
+        white_balance: bool
+            Trueの場合、ブロックの置かれていない交点サークルと中央のマスの白から照明の色・明るさを推定し、
+            サンプル画像を撮影した環境に合わせて補正してから識別する
+            (記録した画像では誤認識が直るサークルと増えるサークルがあるため、既定では補正しない)
         """
+        if method not in self.METHODS:
+            raise ValueError('Unknown color detection method: {}'.format(method))
         self.extractor = BlockExtractor()
         self.bonus = bonus
         self.is_left = is_left
+        self.min_margin = min_margin
+        self.classifications = {}  # 直前に識別した画像における、サークルごとの識別結果
+        self.ambiguous_circles = []  # 直前のrecognizeで識別結果があいまいだった(recognize_streamでは多数決が定まらなかった)サークルのキー
+        self.votes = {}  # 直前のrecognize_streamにおける、サークルごとの色の得票数
+        self.frame_count = 0  # 直前のrecognize_streamで識別に使った画像の数
+        self.method = method
+        self.roi = roi
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.gains = np.ones(3)  # 直前の画像の照明の補正に使ったBGRのゲイン
+        # サンプル画像のヒストグラム(プロセス内で一度だけ計算される)
+        self.bank = HistogramBank.load(sample_dir)
+        # HSV値から色を引く表(プロセス内で一度だけ作られる)
+        self.lookup_table = HsvLookupTable.load(sample_dir) if method == 'lookup_table' else None
+        # 照明の補正に使うサンプル画像の白(プロセス内で一度だけ求められる)
+        self.white_balance = WhiteBalance.load(sample_dir) if white_balance else None
 
     def create_color_dict(self, files, value):
         color_dict = {}
@@ -26,31 +127,33 @@ class BlockRecognizer:
         return color_dict
 
     def open_sample_block_files(self):
-        white = self.create_color_dict(glob.glob('detection_block/img/white/*.png'), Color.WHITE)
-        black = self.create_color_dict(glob.glob('detection_block/img/black/*.png'), Color.BLACK)
-        blue = self.create_color_dict(glob.glob('detection_block/img/blue/*.png'), Color.BLUE)
-        green = self.create_color_dict(glob.glob('detection_block/img/green/*.png'), Color.GREEN)
-        red = self.create_color_dict(glob.glob('detection_block/img/red/*.png'), Color.RED)
-        yellow = self.create_color_dict(glob.glob('detection_block/img/yellow/*.png'), Color.YELLOW)
-
-        files = [white, black, blue, green, red, yellow]
-        for file in files:
-            if len(file) == 0:
-                raise ValueError('Cannot open image for calculating histogram')
-
-        return files
+        return [self.create_color_dict(files, color) for (color, files) in self.bank.find_sample_files()]
 
     def calculate_histogram(self, img):
-        # HSV色空間に変換する
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        # 色相(Hue)のヒストグラムを求める
-        h = cv2.calcHist([img], [0], None, [256], [0, 256])
-        # 彩度(Saturation)のヒストグラムを求める
-        s = cv2.calcHist([img], [1], None, [256], [0, 256])
-        # 明度(Value)のヒストグラムを求める
-        v = cv2.calcHist([img], [2], None, [256], [0, 256])
-        return (h, s, v)
+        return HistogramBank.calculate_histogram(img)
+
+    def calculate_histograms(self, imgs):
+        """
+        複数の画像の色相・彩度・明度のヒストグラムをまとめて求める
+        :param imgs: BGR画像のリスト
+        :return: ヒストグラム。形状は(画像数, チャンネル数, ビン数)
+        """
+        return self.calculate_hsv_histograms(self.extractor.to_hsv(imgs))
 
+    def calculate_hsv_histograms(self, hsv_imgs):
+        """
+        複数のHSV画像の色相・彩度・明度のヒストグラムをまとめて求める
+        :param hsv_imgs: HSV画像のリスト(HSV画像全体のビューでよい)
+        :return: ヒストグラム。形状は(画像数, チャンネル数, ビン数)
+        """
+        # 全画像の画素を1列に並べる
+        hsv = np.concatenate([img.reshape(-1, 3) for img in hsv_imgs])
+        # 画素がどの画像のどのチャンネルのものかをビンの番号に含めて、一度に数える
+        sizes = [img.shape[0] * img.shape[1] for img in hsv_imgs]
+        channels = np.repeat(np.arange(len(hsv_imgs)) * 3, sizes)[:, np.newaxis] + np.arange(3)
+        bins = channels * 256 + hsv
+        histograms = np.bincount(bins.ravel(), minlength=len(hsv_imgs) * 3 * 256)
+        return histograms.reshape(len(hsv_imgs), 3, 256).astype(np.float64)
 
     def compare_histogram(self, subject, comparer):
         """
@@ -70,27 +173,93 @@ class BlockRecognizer:
 
         return similarity / len(subject)
 
+    def compare_histograms(self, subjects):
+        """
+        複数の画像と全サンプル画像の類似度を行列演算でまとめて計算する
+        (compare_histogramと同じくcv2.HISTCMP_BHATTACHARYYAの距離を用いる)
+        :param subjects: 入力画像のヒストグラム。形状は(画像数, チャンネル数, ビン数)
+        :return: 類似度。形状は(画像数, サンプル画像数)
+        """
+        (sqrt_comparers, comparer_sums) = self.bank.reference_matrix()
+        subjects = subjects.transpose(1, 0, 2)
+        # チャンネルごとにBhattacharyya係数を行列積で求める。形状は(チャンネル数, 画像数, サンプル画像数)
+        coefficient = np.matmul(np.sqrt(subjects), sqrt_comparers)
+        scale = subjects.sum(axis=2, keepdims=True) * comparer_sums
+        scale = np.divide(1, np.sqrt(scale), out=np.ones_like(scale), where=np.abs(scale) > np.finfo(np.float32).eps)
+        distance = np.sqrt(np.maximum(1 - coefficient * scale, 0))
+        return (1 - distance).mean(axis=0)
 
     def detect_color(self, img):
-        # 引数のブロック画像のヒストグラムを求める
-        subject = self.calculate_histogram(img)
-        # ヒストグラムを比較するサンプル画像ファイルのパスを取得する
-        paths = self.open_sample_block_files()
-        # 類似度を格納する辞書を用意する
-        similarity = {}
-        for path in paths:
-            # 類似度を初期化しておく
-            color = list(path.values())[0]
-            similarity[color] = 0
-            for file in path.keys():
-                # サンプル画像ファイルを開く
-                sample = cv2.imread(file)
-                # サンプル画像のヒストグラムを求める
-                comparer = self.calculate_histogram(sample)
-                # ブロック画像とサンプル画像をヒストグラム類似度で比較する
-                similarity[color] = max(similarity[color], self.compare_histogram(subject, comparer))
-        # 類似度が最も高い色を返す
-        return max(similarity, key=similarity.get)
+        return self.classify(img).color
+
+    def classify(self, img):
+        """
+        ブロック画像の色を識別する
+        :param img: ブロック画像
+        :return: ColorClassification
+        """
+        return self.classify_all([img])[0]
+
+    def classify_all(self, imgs):
+        """
+        複数のブロック画像の色をまとめて識別する
+        :param imgs: ブロック画像のリスト
+        :return: ColorClassificationのリスト
+        """
+        return [ColorClassification.from_similarity(row) for row in self.color_similarities(imgs)]
+
+    def color_similarities(self, imgs):
+        """
+        複数のブロック画像について、色ごとの類似度を求める
+        :param imgs: ブロック画像のリスト
+        :return: 類似度。形状は(画像数, 色数)で、色はHistogramBank.SAMPLE_COLORSの順に並ぶ
+                 (methodが'lookup_table'の場合は、色ごとの画素の得票率)
+        """
+        return self.hsv_similarities(self.extractor.to_hsv(imgs))
+
+    def hsv_similarities(self, hsv_imgs):
+        """
+        複数のHSV画像について、色ごとの類似度を求める
+        :param hsv_imgs: HSV画像のリスト(HSV画像全体のビューでよい)
+        :return: 類似度。形状は(画像数, 色数)で、色はHistogramBank.SAMPLE_COLORSの順に並ぶ
+        """
+        if self.method == 'lookup_table':
+            return self.lookup_table.hsv_similarities(hsv_imgs)
+        similarity = self.compare_histograms(self.calculate_hsv_histograms(hsv_imgs))
+        # 色ごとにサンプル画像との類似度の最大値をとる
+        similarity = np.maximum.reduceat(similarity, self.bank.group_starts(), axis=1)
+        return np.maximum(similarity, 0)
+
+    def circle_similarities(self, hsv, circles_coordinates, keys):
+        """
+        指定したサークル上のブロックについて、色ごとの類似度をまとめて求める
+
+        Parameters
+        ----------
+        hsv: numpy.ndarray
+            BlockExtractor.preprocessで前処理したブロックビンゴエリアのHSV画像
+        circles_coordinates: dict
+            ブロック・交点サークルの座標
+        keys: list
+            識別するサークルのキー
+
+        Returns
+        -------
+        similarity: numpy.ndarray
+            類似度。形状は(サークル数, 色数)で、色はHistogramBank.SAMPLE_COLORSの順に並ぶ
+        """
+        # 切り取った画像はHSV画像のビューなので、コピーや色変換は発生しない
+        crops = [self.extractor.trim(hsv, circles_coordinates[key]) for key in keys]
+        return self.hsv_similarities(crops)
+
+    def classify_circles(self, hsv, circles_coordinates, keys):
+        """
+        指定したサークル上のブロックの色をまとめて識別する
+        :param hsv: BlockExtractor.preprocessで前処理したブロックビンゴエリアのHSV画像
+        :return: サークルのキーとColorClassificationの辞書
+        """
+        similarity = self.circle_similarities(hsv, circles_coordinates, keys)
+        return {key: ColorClassification.from_similarity(row) for (key, row) in zip(keys, similarity)}
 
 
     def recognize(self, img, circles_coordinates):
@@ -112,57 +281,220 @@ class BlockRecognizer:
         cross_circle: CrossCirclesCoordinate
             交点サークル上のブロック情報
         """
-        # ブロックサークルの数字を削除する。画像の周辺のノイズも削除する。
-        img = self.extractor.remove_circle_number(img)
+        keys = self.BLOCK_CIRCLES + [key for (key, _) in self.CROSS_CIRCLES]
+        self.classifications = self.classify_frame(img, circles_coordinates, keys)
+        # 識別結果があいまいなサークルを記録しておく(撮り直しの判断に使う)
+        self.ambiguous_circles = [key for key in keys if self.classifications[key].is_ambiguous(self.min_margin)]
+        colors = {key: classification.color for (key, classification) in self.classifications.items()}
 
-        # ブロックサークル上のブロックを識別
-        color, black = self.recognize_block_circle(img, circles_coordinates)
-        block_circle = BlockCirclesCoordinate(self.is_left, self.bonus, color, black)
+        return self.to_circles_coordinate(colors)
 
-        # クロスサークル上のブロックを識別
-        cross_circle = self.recognize_cross_circle(img, circles_coordinates)
+    def recognize_stream(self, frames, circles_coordinates, min_votes=3, min_ratio=0.5, max_frames=10, timeout=3.0):
+        """
+        複数の画像で各サークル上のブロックを識別し、サークルごとの多数決でブロックを認識する。
+        全サークルの多数決が定まった時点で、残りの画像は使わずに終了する。
+
+        Parameters
+        ----------
+        frames: iterable
+            ブロックビンゴエリアの画像を順番に返すイテラブル(Noneの画像は読み飛ばす)
+        circles_coordinates: dict
+            ブロック・交点サークルの座標
+        min_votes: int
+            多数決が定まったとみなす、最多得票の色の最小の票数
+        min_ratio: float
+            多数決が定まったとみなすために、最多得票の色の票数が総票数に占める割合がこれを超える必要がある
+        max_frames: int
+            識別に使う画像の最大数
+        timeout: float
+            識別にかける最大の時間(秒)。画像が届かない(Noneしか返らない)場合も、この時間で打ち切る
+
+        Returns
+        -------
+        block_circle: BlockCirclesCoordinate
+            ブロックサークルのブロック情報
+        cross_circle: CrossCirclesCoordinate
+            交点サークル上のブロック情報
+        """
+        keys = self.BLOCK_CIRCLES + [key for (key, _) in self.CROSS_CIRCLES]
+        self.votes = {key: Counter() for key in keys}  # サークルごとの色の得票数
+        self.frame_count = 0  # 識別に使った画像の数
+        start = time.time()
+
+        for img in frames:
+            if img is not None:
+                self.frame_count += 1
+                self.classifications = self.classify_frame(img, circles_coordinates, keys)
+                # 1位と2位の差が小さい識別結果は票に数えない
+                for (key, classification) in self.classifications.items():
+                    if not classification.is_ambiguous(self.min_margin):
+                        self.votes[key][classification.color] += 1
+                if all(self.is_stable(self.votes[key], min_votes, min_ratio) for key in keys):
+                    break
+            # NOTE: 識別できた画像がなくても打ち切る(画像が届かない取得元で待ち続けないように)
+            if self.frame_count >= max_frames or time.time() - start >= timeout:
+                break
+
+        if self.frame_count == 0:
+            # 時間内に1枚も識別できなかった
+            raise ValueError('No frame for recognizing blocks')
+
+        # 多数決が定まらなかったサークルを記録しておく
+        self.ambiguous_circles = [key for key in keys if not self.is_stable(self.votes[key], min_votes, min_ratio)]
+        # 1票も入らなかったサークルは、最後の画像の識別結果を使う
+        colors = {key: self.votes[key].most_common(1)[0][0] if self.votes[key] else self.classifications[key].color
+                  for key in keys}
+
+        return self.to_circles_coordinate(colors)
+
+    @staticmethod
+    def is_stable(votes, min_votes, min_ratio):
+        """
+        多数決が定まっているかを判定する
+
+        Parameters
+        ----------
+        votes: Counter
+            色ごとの得票数
+        """
+        if not votes:
+            return False
+        (_, count) = votes.most_common(1)[0]
+        return count >= min_votes and count > sum(votes.values()) * min_ratio
+
+    def classify_frame(self, img, circles_coordinates, keys):
+        """
+        1枚の画像について、指定したサークル上のブロックの色をまとめて識別する
+
+        Parameters
+        ----------
+        img: numpy.ndarray
+            ブロックサークルの部分を切り取った画像
+        circles_coordinates: dict
+            ブロック・交点サークルの座標
+        keys: list
+            識別するサークルのキー
+
+        Returns
+        -------
+        classifications: dict
+            サークルのキーとColorClassificationの辞書
+        """
+        if self.white_balance is not None:
+            (img, self.gains) = self.white_balance.apply(img, self.white_points(circles_coordinates))
+
+        if self.executor is None:
+            return self.classify_chunk(img, None, circles_coordinates, keys)
+
+        # サークルをchunk_size個ずつに分けて並列に識別する(OpenCVの処理中はGILが解放される)
+        # 周辺だけを処理しない場合は、画像全体の前処理を先に一度だけ行う
+        hsv = None if self.roi else self.extractor.preprocess(
+            img, [circles_coordinates[key] for key in keys], roi=False)
+        chunks = [keys[i:i + self.chunk_size] for i in range(0, len(keys), self.chunk_size)]
+        results = self.executor.map(lambda chunk: self.classify_chunk(img, hsv, circles_coordinates, chunk), chunks)
+        classifications = {}
+        for result in results:
+            classifications.update(result)
+        # 並列に処理しても、識別結果の順番はkeysの順番にする
+        return {key: classifications[key] for key in keys}
+
+    def white_points(self, circles_coordinates):
+        """
+        ブロックビンゴエリアの白いはずの部分の座標を返す
+
+        ブロックの置かれていない交点サークルの中心と、ブロックサークルのない中央のマス(b4とb5の間)を使う。
+        """
+        points = [circles_coordinates[key] for key in self.EMPTY_CROSS_CIRCLES if key in circles_coordinates]
+        if 'b4' in circles_coordinates and 'b5' in circles_coordinates:
+            (left, right) = (circles_coordinates['b4'], circles_coordinates['b5'])
+            points.append(((left[0] + right[0]) // 2, (left[1] + right[1]) // 2))
+        return points
+
+    def classify_chunk(self, img, hsv, circles_coordinates, keys):
+        """
+        指定したサークル上のブロックの色をまとめて識別する(classify_frameの1つのタスク)
+
+        Parameters
+        ----------
+        img: numpy.ndarray
+            ブロックサークルの部分を切り取った画像
+        hsv: numpy.ndarray
+            前処理済みのHSV画像。Noneの場合はimgから作る
+        circles_coordinates: dict
+            ブロック・交点サークルの座標
+        keys: list
+            識別するサークルのキー
+        """
+        if hsv is None:
+            # ブロックサークルの数字や画像の周辺のノイズを削除し、HSV色空間に変換する
+            points = [circles_coordinates[key] for key in keys]
+            hsv = self.extractor.preprocess(img, points, roi=self.roi)
+
+        # 指定したサークル上の全ブロックをまとめて識別
+        return self.classify_circles(hsv, circles_coordinates, keys)
+
+    def to_circles_coordinate(self, colors):
+        """
+        サークルごとの識別結果から、BlockCirclesCoordinateとCrossCirclesCoordinateを作る
+        :param colors: サークルのキーと色の辞書
+        :return: (BlockCirclesCoordinate, CrossCirclesCoordinate)
+        """
+        color, black = self.to_block_circle_numbers(colors)
+        block_circle = BlockCirclesCoordinate(self.is_left, self.bonus, color, black)
+        cross_circle = self.to_cross_circles(colors)
 
         return block_circle, cross_circle
 
     def recognize_cross_circle(self, img, circles_coordinates):
+        keys = [key for (key, _) in self.CROSS_CIRCLES]
+        hsv = self.extractor.closed_hsv(img, [circles_coordinates[key] for key in keys])
+        classifications = self.classify_circles(hsv, circles_coordinates, keys)
+        return self.to_cross_circles({key: classifications[key].color for key in keys})
+
+    def recognize_block_circle(self, img, circles_coordinates):
+        hsv = self.extractor.closed_hsv(img, self.extract_block_circles_point(circles_coordinates))
+        # サークルごとに1回だけ識別し、黒ブロックとカラーブロックの判定に使う
+        classifications = self.classify_circles(hsv, circles_coordinates, self.BLOCK_CIRCLES)
+        return self.to_block_circle_numbers({key: classifications[key].color for key in self.BLOCK_CIRCLES})
+
+    def to_cross_circles(self, colors):
+        """
+        サークルごとの識別結果から、交点サークル上のブロック情報を作る
+        :param colors: サークルのキーと色の辞書
+        :return: CrossCirclesCoordinate
+        """
         cross_circles = CrossCirclesCoordinate()
-        for col in "0123":
-            for row in "0123":
-                key = 'c' + row + col
-                coordinate = (int(col), int(row))
-                point = circles_coordinates[key]  # 交点サークルの座標
-                crop = self.extractor.trim(img, point)  # 交点サークルの周辺を切り取る
-                color = self.detect_color(self.extractor.closing(crop))  # ブロック識別
-                cross_circles.set_block_color(coordinate, color)  # 認識結果を辞書に格納
+        for (key, coordinate) in self.CROSS_CIRCLES:
+            cross_circles.set_block_color(coordinate, colors[key])  # 認識結果を辞書に格納
         return cross_circles
 
-    def recognize_block_circle(self, img, circles_coordinates):
+    def to_block_circle_numbers(self, colors):
+        """
+        サークルごとの識別結果から、黒ブロックとカラーブロックが置かれているブロックサークル番号を求める
+        :param colors: サークルのキーと色の辞書
+        :return: (カラーブロックのサークル番号, 黒ブロックのサークル番号)
+        """
         black = None  # 黒ブロックが置かれているブロックサークル番号
         color = None  # カラーブロックが置かれているブロックサークル番号
 
-        # サークル座標のデータ構造からブロックサークルの座標だけ抽出する
-        points = self.extract_block_circles_point(circles_coordinates)
-
-        for (idx, point) in enumerate(points):
-            crop = self.extractor.trim(img, point)
-            # cv2.imshow("crop", crop)
-            # cv2.waitKey(0)
-            # cv2.destroyAllWindows()
-            if Color.BLACK == self.detect_color(self.extractor.closing(crop)):
+        for (idx, key) in enumerate(self.BLOCK_CIRCLES):
+            if Color.BLACK == colors[key]:
                 black = idx + 1
-            elif Color.WHITE != self.detect_color(self.extractor.closing(crop)):
+            elif Color.WHITE != colors[key]:
                 color = idx + 1
 
         return (color, black)
 
     def extract_block_circles_point(self, circles_coordinates):
         points = []
-        for key in ['b' + str(i + 1) for i in range(0, 8)]:
+        for key in self.BLOCK_CIRCLES:
             points.append(circles_coordinates[key])
         return points
 
 
 class BlockExtractor():
+    BLUR_RADIUS = 9  # binarizationのGaussianBlur(19x19)の半径
+
     def trim(self, img, point, margin=5):
         """
         画像を指定の座標周辺で切り取る。
@@ -178,6 +510,148 @@ class BlockExtractor():
         """
         return img[point[1] - margin:point[1] + margin, point[0] - margin:point[0] + margin]
 
+    def to_hsv(self, imgs):
+        """
+        複数の画像をまとめてHSV色空間に変換する。
+
+        Parameters
+        ----------
+        imgs : list
+            BGR画像のリスト
+        """
+        # 全画像の画素を1列に並べて、一度に変換する
+        pixels = np.concatenate([img.reshape(-1, 1, 3) for img in imgs])
+        hsv = cv2.cvtColor(pixels, cv2.COLOR_BGR2HSV)
+        sizes = np.cumsum([img.shape[0] * img.shape[1] for img in imgs])[:-1]
+        return [hsv_img.reshape(img.shape) for (hsv_img, img) in zip(np.split(hsv, sizes), imgs)]
+
+    def roi_windows(self, shape, points, margin, support):
+        """
+        各座標についてtrimで切り取る範囲と、その範囲を計算するために必要な周辺を含めた範囲を求める。
+
+        Parameters
+        ----------
+        shape : tuple
+            画像の形状
+        points : list
+            座標のリスト
+        margin : int
+            trimで切り取る指定座標の周囲(px)
+        support : int
+            切り取る範囲の計算に必要な周辺の幅(px)
+
+        Returns
+        -------
+        windows : list
+            (周辺を含めた範囲, 周辺を含めた範囲内における切り取る範囲, 切り取る範囲)のリスト
+        """
+        (height, width) = shape[:2]
+        windows = []
+        for point in points:
+            (x, y) = (int(point[0]), int(point[1]))
+            (top, btm) = (max(y - margin, 0), min(y + margin, height))
+            (left, right) = (max(x - margin, 0), min(x + margin, width))
+            (win_top, win_btm) = (max(top - support, 0), min(btm + support, height))
+            (win_left, win_right) = (max(left - support, 0), min(right + support, width))
+            windows.append(((slice(win_top, win_btm), slice(win_left, win_right)),
+                            (slice(top - win_top, btm - win_top), slice(left - win_left, right - win_left)),
+                            (slice(top, btm), slice(left, right))))
+        return windows
+
+    def apply_to_rois(self, sources, points, margin, support, process, fill):
+        """
+        各座標の周辺だけに処理を行う。切り取る範囲の画素は、画像全体に処理を行った場合と一致する。
+
+        Parameters
+        ----------
+        sources : list
+            処理に使う画像のリスト(すべて同じ大きさ)。processへ同じ順番で渡す
+        points : list
+            座標のリスト
+        margin : int
+            trimで切り取る指定座標の周囲(px)
+        support : int
+            processの結果がある画素の周囲何pxに依存するか
+        process : function
+            sourcesと同じ数の画像を受け取り、処理結果の画像を返す関数
+        fill : tuple
+            処理しない画素の値
+        """
+        # 1行目を埋めてから残りの行へコピーする(画素ごとにタプルを代入するより速い)
+        result = np.empty_like(sources[0])
+        result[0] = fill
+        result[1:] = result[0]
+        windows = self.roi_windows(sources[0].shape, points, margin, support)
+        size = 2 * (margin + support)
+        # 画像の端にかからない範囲は横に並べて1枚の画像にし、まとめて処理する
+        # (縦長の画像は行ごとのオーバーヘッドでGaussianBlurが遅くなるため横に並べる)
+        # (隣の範囲の影響を受けるのは周辺の幅supportの中だけなので、切り取る範囲の画素は変わらない)
+        inner = []
+        for (window, core_in_window, core) in windows:
+            (rows, cols) = window
+            if rows.stop - rows.start == size and cols.stop - cols.start == size:
+                inner.append((window, core_in_window, core))
+            else:
+                # 画像の端にかかる範囲は、画像の端での処理を変えないように1つずつ処理する
+                result[core] = process(*[source[window] for source in sources])[core_in_window]
+        if inner:
+            strips = [np.concatenate([source[window] for (window, _, _) in inner], axis=1) for source in sources]
+            processed = process(*strips)
+            for (idx, (_, core_in_window, core)) in enumerate(inner):
+                result[core] = processed[:, idx * size:(idx + 1) * size][core_in_window]
+        return result
+
+    def preprocess(self, img, points, margin=5, roi=True):
+        """
+        ブロックの識別に使うHSV画像を作る。
+        数字やノイズを削除し、trimで切り取る範囲ごとにクロージングしてHSV色空間に変換する。
+        切り取る範囲以外の画素は白色になる。
+
+        Parameters
+        ----------
+        img : Mat
+            ブロックビンゴエリアの画像
+        points : list
+            識別に使う座標のリスト
+        margin : int
+            trimで切り取る指定座標の周囲(px)
+        roi : bool
+            Trueの場合、数字やノイズの削除を各座標の周辺だけで行う(切り取る範囲の画素は画像全体で行う場合と同じ)
+        """
+        if roi:
+            img = self.remove_circle_number(img, points=points, margin=margin)
+        else:
+            img = self.remove_circle_number(img, cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+        return self.closed_hsv(img, points, margin)
+
+    def closed_hsv(self, img, points, margin=5):
+        """
+        trimで切り取る範囲ごとにクロージング処理し、HSV色空間に変換する。
+        切り取る範囲以外の画素は白色になる。
+
+        Parameters
+        ----------
+        img : Mat
+            数字やノイズを削除した画像
+        points : list
+            識別に使う座標のリスト
+        margin : int
+            trimで切り取る指定座標の周囲(px)
+        """
+        # NOTE: クロージングは切り取った画像ごとに行う(切り取る範囲の外の画素を使わない)
+        #       画像全体に行うと、範囲の端の画素が範囲の外の画素の影響を受けて識別結果が変わる
+        #       範囲が重なる座標は、後の座標の結果になる(サークル同士は十分に離れている)
+        crops = [self.trim(img, point, margin) for point in points]
+        closed = [self.closing(crop) for crop in crops if crop.size]
+        result = np.empty_like(img)
+        result[0] = (0, 0, 255)
+        result[1:] = result[0]
+        if closed:
+            hsv_crops = iter(self.to_hsv(closed))
+            for point in [point for (point, crop) in zip(points, crops) if crop.size]:
+                self.trim(result, point, margin)[...] = next(hsv_crops)
+        return result
+
     def hsv_decomposition(self, img):
         """
         HSV分解する。
@@ -190,7 +664,7 @@ class BlockExtractor():
         hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
         return cv2.split(hsv)
 
-    def binarization(self, img):
+    def binarization(self, img, hsv=None):
         """
         2値化処理する。
                 
@@ -198,8 +672,13 @@ class BlockExtractor():
         ----------
         img : Mat
             画像
+        hsv : Mat
+            imgをHSV色空間に変換した画像(変換済みの場合に渡す)
         """
-        (h, s, v) = self.hsv_decomposition(img)
+        if hsv is None:
+            (h, s, v) = self.hsv_decomposition(img)
+        else:
+            s = cv2.extractChannel(hsv, 1)
         s = cv2.GaussianBlur(s, (19, 19), 0)
         _, dst = cv2.threshold(s, 57, 255, cv2.THRESH_BINARY)
         return dst
@@ -232,17 +711,28 @@ class BlockExtractor():
         mask = cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel)
         return mask
 
-    def remove_circle_number(self, img):
+    def remove_circle_number(self, img, hsv=None, points=None, margin=5):
         """
         ブロックサークルの数字を削除する。画像の周辺のノイズも削除する。
+        pointsを指定した場合は、各座標の周辺だけを処理する(それ以外の画素は白色になる)。
                 
         Parameters
         ----------
         img : Mat
             画像
+        hsv : Mat
+            imgをHSV色空間に変換した画像(変換済みの場合に渡す)
+        points : list
+            識別に使う座標のリスト
+        margin : int
+            trimで切り取る指定座標の周囲(px)
         """
+        if points is not None:
+            sources = [img] if hsv is None else [img, hsv]
+            return self.apply_to_rois(sources, points, margin, self.BLUR_RADIUS,
+                                      self.remove_circle_number, (255, 255, 255))
         # 2値化処理
-        mask = self.binarization(img)
+        mask = self.binarization(img, hsv)
         mask = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
         # マスク処理をして画像から不要な情報を削除する
         dst = cv2.bitwise_and(img, mask)
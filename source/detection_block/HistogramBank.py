@@ -0,0 +1,216 @@
+"""
+@file: HistogramBank.py
+@brief: ブロックの色識別に用いるサンプル画像のヒストグラムを一度だけ計算し、.npzファイルにキャッシュする
+"""
+import glob
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from block_bingo.BlockBingoCoordinate import Color
+
+
+class HistogramBank:
+    """
+    サンプル画像(detection_block/img/<色>/*.png)のHSVヒストグラムを保持するクラス。
+
+    ヒストグラムはプロセス内で一度だけ計算し、サンプル画像と同じディレクトリに
+    .npzファイルとして保存する。サンプル画像の更新日時やサイズが変わった場合はキャッシュを作り直す。
+    """
+    # 類似度が同じ場合に優先される順番でもあるため、並び順を変えないこと
+    SAMPLE_COLORS = (Color.WHITE, Color.BLACK, Color.BLUE, Color.GREEN, Color.RED, Color.YELLOW)
+    CACHE_FILE_NAME = 'histogram_bank.npz'
+
+    # プロセス内で共有するインスタンス(キーはサンプル画像のディレクトリとキャッシュファイルの絶対パス)
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, sample_dir='detection_block/img', cache_file=None):
+        """
+        Parameters
+        ----------
+        sample_dir: str
+            サンプル画像が色ごとに格納されているディレクトリ
+        cache_file: str
+            ヒストグラムを保存するファイル。Noneの場合はsample_dir直下に保存する
+        """
+        self.sample_dir = sample_dir
+        if cache_file is None:
+            cache_file = os.path.join(sample_dir, self.CACHE_FILE_NAME)
+        self.cache_file = cache_file
+        self.paths = []  # サンプル画像のパス
+        self.colors = []  # サンプル画像の色
+        self.histograms = np.empty((0, 3, 256, 1), dtype=np.float32)  # サンプル画像のヒストグラム
+        self.loaded_cache_file = False
+        self._reference = None  # 一括比較用の行列(reference_matrixで計算する)
+
+    @classmethod
+    def load(cls, sample_dir='detection_block/img', cache_file=None):
+        """
+        プロセス内で共有するヒストグラムを取得する。初回呼び出し時のみキャッシュの読み込みまたは計算を行う。
+        """
+        key = (os.path.abspath(sample_dir), None if cache_file is None else os.path.abspath(cache_file))
+        with cls._lock:
+            if key not in cls._instances:
+                bank = cls(sample_dir, cache_file)
+                bank.prepare()
+                cls._instances[key] = bank
+            return cls._instances[key]
+
+    @classmethod
+    def clear(cls):
+        """
+        プロセス内で共有しているヒストグラムを破棄する。
+        """
+        with cls._lock:
+            cls._instances.clear()
+
+    @staticmethod
+    def calculate_histogram(img):
+        """
+        画像の色相・彩度・明度のヒストグラムを求める。
+
+        Parameters
+        ----------
+        img: numpy.ndarray
+            BGR画像
+        """
+        # HSV色空間に変換する
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        # 色相(Hue)のヒストグラムを求める
+        h = cv2.calcHist([img], [0], None, [256], [0, 256])
+        # 彩度(Saturation)のヒストグラムを求める
+        s = cv2.calcHist([img], [1], None, [256], [0, 256])
+        # 明度(Value)のヒストグラムを求める
+        v = cv2.calcHist([img], [2], None, [256], [0, 256])
+        return (h, s, v)
+
+    def find_sample_files(self):
+        """
+        サンプル画像のパスを色ごとに取得する。
+
+        Returns
+        -------
+        files: list
+            (色, パスのリスト)のリスト
+        """
+        files = []
+        for color in self.SAMPLE_COLORS:
+            paths = sorted(glob.glob(os.path.join(self.sample_dir, color.name.lower(), '*.png')))
+            if len(paths) == 0:
+                raise ValueError('Cannot open image for calculating histogram')
+            files.append((color, paths))
+        return files
+
+    @staticmethod
+    def signature(paths):
+        """
+        キャッシュが古くなっていないかを判定するため、サンプル画像の更新日時とサイズを並べた配列を返す。
+        """
+        stats = [os.stat(path) for path in paths]
+        return np.array([(stat.st_mtime_ns, stat.st_size) for stat in stats], dtype=np.int64).reshape(-1, 2)
+
+    def prepare(self):
+        """
+        キャッシュファイルが最新であれば読み込み、そうでなければヒストグラムを計算して保存する。
+        """
+        paths = []
+        colors = []
+        for (color, files) in self.find_sample_files():
+            paths.extend(files)
+            colors.extend([color] * len(files))
+        signature = self.signature(paths)
+        self._reference = None
+
+        if not self._load_cache(paths, signature):
+            self.paths = paths
+            self.colors = colors
+            self.histograms = self.build(paths)
+            self._save_cache(signature)
+
+    def build(self, paths):
+        """
+        サンプル画像のヒストグラムを計算する。
+        """
+        histograms = np.empty((len(paths), 3, 256, 1), dtype=np.float32)
+        for (idx, path) in enumerate(paths):
+            sample = cv2.imread(path)
+            if sample is None:
+                raise ValueError('Cannot open image for calculating histogram')
+            histograms[idx] = self.calculate_histogram(sample)
+        return histograms
+
+    def _load_cache(self, paths, signature):
+        if not os.path.exists(self.cache_file):
+            return False
+        try:
+            with np.load(self.cache_file) as cache:
+                cached_paths = [str(path) for path in cache['paths']]
+                cached_signature = cache['signature']
+                colors = [Color[name] for name in cache['colors']]
+                histograms = cache['histograms']
+        except (OSError, ValueError, KeyError):
+            return False
+
+        if cached_paths != paths or not np.array_equal(cached_signature, signature):
+            return False
+        if histograms.shape != (len(paths), 3, 256, 1):
+            return False
+
+        self.paths = cached_paths
+        self.colors = colors
+        self.histograms = histograms.astype(np.float32, copy=False)
+        self.loaded_cache_file = True
+        return True
+
+    def _save_cache(self, signature):
+        # 書き込み途中のファイルを読み込まないよう、一時ファイルに書き出してから置き換える
+        tmp_file = self.cache_file + '.tmp.npz'
+        try:
+            np.savez_compressed(tmp_file,
+                                paths=np.array(self.paths),
+                                colors=np.array([color.name for color in self.colors]),
+                                signature=signature,
+                                histograms=self.histograms)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            # キャッシュが保存できなくても識別はできるので、処理を続ける
+            print("ヒストグラムのキャッシュ（{}）を保存できませんでした".format(self.cache_file))
+
+    def groups(self):
+        """
+        色ごとにサンプル画像のヒストグラムをまとめて返す。
+
+        Returns
+        -------
+        groups: list
+            (色, ヒストグラムの配列)のリスト。並び順はSAMPLE_COLORSの通り
+        """
+        colors = np.array([color.value for color in self.colors])
+        return [(color, self.histograms[colors == color.value]) for color in self.SAMPLE_COLORS]
+
+    def group_starts(self):
+        """
+        色ごとのサンプル画像の先頭の添字を返す。サンプル画像はSAMPLE_COLORSの順に並んでいる。
+        """
+        colors = [color.value for color in self.colors]
+        return np.array([colors.index(color.value) for color in self.SAMPLE_COLORS])
+
+    def reference_matrix(self):
+        """
+        全サンプル画像とまとめて比較するための行列を返す。
+
+        Returns
+        -------
+        sqrt_histograms: numpy.ndarray
+            ヒストグラムの平方根。形状は(チャンネル数, ビン数, サンプル数)
+        sums: numpy.ndarray
+            ヒストグラムの総和。形状は(チャンネル数, 1, サンプル数)
+        """
+        if self._reference is None:
+            histograms = self.histograms[..., 0].astype(np.float64)
+            self._reference = (np.sqrt(histograms).transpose(1, 2, 0),
+                               histograms.sum(axis=2).T[:, np.newaxis, :])
+        return self._reference
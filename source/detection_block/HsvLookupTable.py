@@ -0,0 +1,130 @@
+"""
+@file: HsvLookupTable.py
+@brief: 量子化したHSV値からブロックの色を引く表をサンプル画像から作り、画素ごとの多数決で色を識別する
+"""
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from detection_block.HistogramBank import HistogramBank
+
+
+class HsvLookupTable:
+    """
+    HSV色空間を BINS x BINS x BINS に量子化し、各ビンに色を割り当てた表。
+
+    サンプル画像の画素数は識別に影響しないため、サンプル画像を増やしても識別にかかる時間は変わらない。
+    """
+    BINS = 32  # 各チャンネルの量子化数
+    SHIFT = 3  # 256 / BINS = 2 ** SHIFT
+    COLORS = HistogramBank.SAMPLE_COLORS  # 表の値(添字)に対応する色
+
+    # プロセス内で共有するインスタンス(キーはサンプル画像のディレクトリの絶対パス)
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, sample_dir='detection_block/img'):
+        """
+        Parameters
+        ----------
+        sample_dir: str
+            サンプル画像が色ごとに格納されているディレクトリ
+        """
+        self.sample_dir = sample_dir
+        self.table = None  # 各ビンの色の添字(COLORSの添字)
+
+    @classmethod
+    def load(cls, sample_dir='detection_block/img'):
+        """
+        プロセス内で共有する表を取得する。初回呼び出し時のみ表を作る。
+        """
+        key = os.path.abspath(sample_dir)
+        with cls._lock:
+            if key not in cls._instances:
+                lookup_table = cls(sample_dir)
+                lookup_table.fit()
+                cls._instances[key] = lookup_table
+            return cls._instances[key]
+
+    def quantize(self, hsv):
+        """
+        HSV値をビンの番号に変換する。
+
+        Parameters
+        ----------
+        hsv: numpy.ndarray
+            HSV画像(最後の次元がチャンネル)
+        """
+        hsv = hsv >> self.SHIFT
+        return (hsv[..., 0].astype(np.intp) * self.BINS + hsv[..., 1]) * self.BINS + hsv[..., 2]
+
+    def fit(self):
+        """
+        サンプル画像の画素から、ビンごとに最も多く現れる色を求めて表を作る。
+        """
+        bank = HistogramBank(self.sample_dir)
+        # 色ごとの各ビンの出現頻度
+        frequency = np.zeros((len(self.COLORS), self.BINS ** 3), dtype=np.float64)
+        for (color, paths) in bank.find_sample_files():
+            idx = self.COLORS.index(color)
+            for path in paths:
+                sample = cv2.imread(path)
+                if sample is None:
+                    raise ValueError('Cannot open image for fitting lookup table')
+                hsv = cv2.cvtColor(sample, cv2.COLOR_BGR2HSV)
+                frequency[idx] += np.bincount(self.quantize(hsv).ravel(), minlength=self.BINS ** 3)
+            # サンプル画像の画素数が色ごとに異なるため、割合にしておく
+            frequency[idx] /= frequency[idx].sum()
+
+        table = np.argmax(frequency, axis=0)
+        table[frequency.max(axis=0) == 0] = -1
+        self.table = self.fill_empty_bins(table.reshape(self.BINS, self.BINS, self.BINS)).ravel()
+
+    @staticmethod
+    def fill_empty_bins(table):
+        """
+        サンプル画像に現れなかったビン(値が-1)に、隣接するビンの色を繰り返し割り当てる。
+        """
+        table = table.copy()
+        while (table < 0).any():
+            for axis in range(table.ndim):
+                for shift in (1, -1):
+                    neighbor = np.roll(table, shift, axis=axis)
+                    # np.rollで反対側の端から回り込んだ値は使わない
+                    edge = [slice(None)] * table.ndim
+                    edge[axis] = 0 if shift == 1 else -1
+                    neighbor[tuple(edge)] = -1
+                    empty = (table < 0) & (neighbor >= 0)
+                    table[empty] = neighbor[empty]
+        return table
+
+    def color_similarities(self, imgs):
+        """
+        複数のブロック画像について、画素ごとに色を引いて多数決をとり、色ごとの得票率を求める
+
+        Parameters
+        ----------
+        imgs: list
+            BGR画像のリスト
+
+        Returns
+        -------
+        similarity: numpy.ndarray
+            得票率。形状は(画像数, 色数)で、色はCOLORSの順に並ぶ
+        """
+        return self.hsv_similarities([cv2.cvtColor(img, cv2.COLOR_BGR2HSV) for img in imgs])
+
+    def hsv_similarities(self, hsv_imgs):
+        """
+        color_similaritiesと同じ得票率を、HSV画像のリストから求める
+        """
+        # 全画像の画素を1列に並べて、一度に色を引く
+        labels = self.table[self.quantize(np.concatenate([img.reshape(-1, 3) for img in hsv_imgs]))]
+        # 画素がどの画像のものかを投票先の番号に含めて、一度に数える
+        sizes = [img.shape[0] * img.shape[1] for img in hsv_imgs]
+        owners = np.repeat(np.arange(len(hsv_imgs)) * len(self.COLORS), sizes)
+        votes = np.bincount(owners + labels, minlength=len(hsv_imgs) * len(self.COLORS))
+        votes = votes.reshape(len(hsv_imgs), len(self.COLORS)).astype(np.float64)
+        return votes / np.maximum(votes.sum(axis=1, keepdims=True), 1)
@@ -0,0 +1,141 @@
+"""
+@file: WhiteBalance.py
+@brief: ブロックビンゴエリアの白い部分から照明の色・明るさを推定し、サンプル画像を撮影した環境に合わせて補正する
+"""
+import glob
+import os
+import threading
+
+import cv2
+import numpy as np
+
+
+class WhiteBalance:
+    """
+    会場の照明による色かぶりや明るさの違いを、チャンネルごとのゲインで補正するクラス。
+
+    画像中の白いはずの部分(ブロックの置かれていない交点サークルなど)の色が、
+    サンプル画像(detection_block/img/white)の白の色になるように、BGRの各チャンネルを定数倍する。
+    補正は256x3の変換表(cv2.LUT)で一度に行う。
+    """
+    MIN_GAIN = 0.5  # ゲインの下限(白い部分にブロックなどが写っていた場合に、極端な補正をしないため)
+    MAX_GAIN = 2.0  # ゲインの上限
+
+    # プロセス内で共有するインスタンス(キーはサンプル画像のディレクトリの絶対パス)
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, sample_dir='detection_block/img'):
+        """
+        Parameters
+        ----------
+        sample_dir: str
+            サンプル画像が色ごとに格納されているディレクトリ
+        """
+        self.sample_dir = sample_dir
+        self.reference = None  # サンプル画像の白のBGR値
+
+    @classmethod
+    def load(cls, sample_dir='detection_block/img'):
+        """
+        プロセス内で共有するインスタンスを取得する。初回呼び出し時のみサンプル画像の白を求める。
+        """
+        key = os.path.abspath(sample_dir)
+        with cls._lock:
+            if key not in cls._instances:
+                white_balance = cls(sample_dir)
+                white_balance.fit()
+                cls._instances[key] = white_balance
+            return cls._instances[key]
+
+    def fit(self):
+        """
+        サンプル画像の白のBGR値を求める。
+
+        数字を削除した部分(真っ白に塗りつぶした画像)は撮影環境の白ではないため除く。
+        """
+        means = []
+        for path in sorted(glob.glob(os.path.join(self.sample_dir, 'white', '*.png'))):
+            sample = cv2.imread(path)
+            if sample is None:
+                raise ValueError('Cannot open image for white balance')
+            mean = sample.reshape(-1, 3).mean(axis=0)
+            if mean.min() < 250:
+                means.append(mean)
+        if len(means) == 0:
+            raise ValueError('Cannot open image for white balance')
+        self.reference = np.median(means, axis=0)
+
+    @staticmethod
+    def measure_white(img, points, margin=10):
+        """
+        指定した座標周辺の明るい画素から、画像中の白のBGR値を求める。
+
+        白い部分を横切る黒い線やサークルの色を除くため、各領域で明るさが中央値以上の画素だけを使う。
+
+        Parameters
+        ----------
+        img: numpy.ndarray
+            BGR画像
+        points: list
+            白いはずの部分の座標のリスト
+        margin: int
+            指定座標の周囲(px)
+
+        Returns
+        -------
+        white: numpy.ndarray
+            白のBGR値。領域が画像外の場合はNone
+        """
+        (height, width) = img.shape[:2]
+        pixels = []
+        for (x, y) in points:
+            patch = img[max(y - margin, 0):min(y + margin, height), max(x - margin, 0):min(x + margin, width)]
+            patch = patch.reshape(-1, 3)
+            if len(patch) == 0:
+                continue
+            brightness = patch.sum(axis=1, dtype=np.int32)
+            pixels.append(patch[brightness >= np.median(brightness)])
+        if len(pixels) == 0:
+            return None
+        return np.concatenate(pixels).mean(axis=0)
+
+    def gains(self, img, points, margin=10):
+        """
+        画像中の白がサンプル画像の白になるような、チャンネルごとのゲインを求める。
+        """
+        white = self.measure_white(img, points, margin)
+        if white is None:
+            return np.ones(3)
+        return np.clip(self.reference / np.maximum(white, 1), self.MIN_GAIN, self.MAX_GAIN)
+
+    @staticmethod
+    def lookup_table(gains):
+        """
+        チャンネルごとのゲインをcv2.LUTで使う変換表にする。形状は(256, 1, 3)
+        """
+        values = np.arange(256, dtype=np.float64)[:, np.newaxis] * np.asarray(gains)[np.newaxis, :]
+        return np.clip(np.rint(values), 0, 255).astype(np.uint8)[:, np.newaxis, :]
+
+    def apply(self, img, points, margin=10):
+        """
+        画像の照明を補正する。
+
+        Parameters
+        ----------
+        img: numpy.ndarray
+            BGR画像
+        points: list
+            白いはずの部分の座標のリスト
+        margin: int
+            指定座標の周囲(px)
+
+        Returns
+        -------
+        img: numpy.ndarray
+            補正したBGR画像
+        gains: numpy.ndarray
+            補正に使ったBGRのゲイン
+        """
+        gains = self.gains(img, points, margin)
+        return (cv2.LUT(img, self.lookup_table(gains)), gains)
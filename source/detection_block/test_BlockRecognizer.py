@@ -1,16 +1,27 @@
+import itertools
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
+import numpy as np
+import pytest
 
-from BlockRecognizer import BlockRecognizer
+from BlockRecognizer import BlockRecognizer, BlockExtractor, ColorClassification
 from block_bingo.BlockBingoCoordinate import Color
+from Camera import Camera
 
 
-def create_block_recognizer():
+def create_block_recognizer(method='histogram', roi=True, white_balance=False):
     bonus = 1
     is_left = True
-    return BlockRecognizer(bonus, is_left)
+    return BlockRecognizer(bonus, is_left, method=method, roi=roi, white_balance=white_balance)
 
 
-def test_result():
+@pytest.mark.parametrize('roi', [True, False])
+@pytest.mark.parametrize('method', BlockRecognizer.METHODS)
+def test_result(method, roi):
     circles_coordinates = {
         'c00': (34, 61), 'c10': (210, 61), 'c20': (393, 56), 'c30': (573, 58),
         "b1": (122, 153), "b2": (302, 155), "b3": (480, 150),
@@ -21,7 +32,7 @@ def test_result():
         'c03': (49, 608), 'c13': (227, 606), 'c23': (400, 607), 'c33': (578, 608)
         }
     
-    recognizer = create_block_recognizer()
+    recognizer = create_block_recognizer(method, roi)
     img = cv2.imread('detection_block/result.png')
     bc, cc = recognizer.recognize(img, circles_coordinates)
 
@@ -39,7 +50,8 @@ def test_result():
             assert cc.cross_circles[col][row] == result_cc_blocks[col][row]
     
 
-def test_result1():
+@pytest.mark.parametrize('method', BlockRecognizer.METHODS)
+def test_result1(method):
     circles_coordinates = {
         'c00': (43, 48), 'c10': (217, 50), 'c20': (398, 47), 'c30': (576, 48),
         "b1": (130, 145), "b2": (304, 148), "b3": (487, 147),
@@ -49,7 +61,7 @@ def test_result1():
         "b6": (133, 517), "b7": (311, 517), "b8": (483, 515),
         'c03': (52, 606), 'c13': (231, 604), 'c23': (399, 608), 'c33': (581, 607)}
 
-    recognizer = create_block_recognizer()
+    recognizer = create_block_recognizer(method)
     img = cv2.imread('detection_block/result1.png')
     bc, cc = recognizer.recognize(img, circles_coordinates)
     
@@ -65,3 +77,304 @@ def test_result1():
     for row in range(4):
         for col in range(4):
             assert cc.cross_circles[col][row] == result1_cc_blocks[col][row]
+
+
+def test_batch_similarity_equal_to_compare_histogram():
+    circles_coordinates = {
+        'c00': (34, 61), 'c10': (210, 61), 'c20': (393, 56), 'c30': (573, 58),
+        "b1": (122, 153), "b2": (302, 155), "b3": (480, 150),
+        'c01': (36, 243), 'c11': (217, 242), 'c21': (392, 243), 'c31': (577, 241),
+        "b4": (127, 338), "b5": (480, 339),
+        'c02': (43, 425), 'c12': (219, 429), 'c22': (399, 426), 'c32': (572, 427),
+        "b6": (130, 521), "b7": (307, 521), "b8": (481, 520),
+        'c03': (49, 608), 'c13': (227, 606), 'c23': (400, 607), 'c33': (578, 608)
+        }
+
+    recognizer = create_block_recognizer()
+    hsv = recognizer.extractor.preprocess(cv2.imread('detection_block/result.png'), list(circles_coordinates.values()))
+    keys = list(circles_coordinates.keys())
+    similarity = recognizer.circle_similarities(hsv, circles_coordinates, keys)
+    assert similarity.shape == (24, 6)
+
+    # 1サークルずつcv2.compareHistで比較した結果と一致する
+    for (idx, key) in enumerate(keys):
+        crop = np.ascontiguousarray(recognizer.extractor.trim(hsv, circles_coordinates[key]))
+        subject = [cv2.calcHist([crop], [channel], None, [256], [0, 256]) for channel in range(3)]
+        for (col, (color, comparers)) in enumerate(recognizer.bank.groups()):
+            expected = max(recognizer.compare_histogram(subject, comparer) for comparer in comparers)
+            assert abs(similarity[idx, col] - expected) < 1e-9
+
+
+def closed_crop(extractor, img, point):
+    # 変更前の識別と同じ手順(画像全体で数字を削除し、切り取ってからクロージング)で作ったHSV画像
+    crop = extractor.closing(extractor.trim(extractor.remove_circle_number(img), point))
+    return cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+
+
+def test_preprocess_same_as_closing_each_crop():
+    extractor = BlockExtractor()
+    img = cv2.imread('detection_block/result.png')
+    points = [(122, 153), (34, 61), (480, 339), (637, 300)]
+    hsv = extractor.preprocess(img, points)
+    for p in points:
+        assert (extractor.trim(hsv, p) == closed_crop(extractor, img, p)).all()
+    # 切り取る範囲以外は白色
+    assert (hsv[300:320, 300:320] == (0, 0, 255)).all()
+
+
+@pytest.mark.parametrize('point', [(122, 153), (34, 61), (2, 3), (637, 300), (320, 638)])
+def test_roi_same_as_full_frame(point):
+    extractor = BlockExtractor()
+    img = cv2.imread('detection_block/result.png')
+    points = [(480, 339), (483, 344), point]  # 範囲が重なる座標や画像の端の座標も含める
+    full = extractor.preprocess(img, points, roi=False)
+    roi = extractor.preprocess(img, points)
+    full_removed = extractor.remove_circle_number(img)
+    roi_removed = extractor.remove_circle_number(img, cv2.cvtColor(img, cv2.COLOR_BGR2HSV), points)
+    for p in points:
+        assert (extractor.trim(full, p) == extractor.trim(roi, p)).all()
+        assert (extractor.trim(full_removed, p) == extractor.trim(roi_removed, p)).all()
+
+
+def test_to_hsv():
+    extractor = BlockExtractor()
+    img = cv2.imread('detection_block/result.png')
+    crops = [img[0:10, 0:10], img[100:104, 200:207]]
+    for (actual, crop) in zip(extractor.to_hsv(crops), crops):
+        assert (actual == cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)).all()
+
+
+def test_color_classification():
+    similarity = np.array([0.2, 0.9, 0.1, 0.85, 0.0, 0.3])
+    classification = ColorClassification.from_similarity(similarity)
+    assert classification.color == Color.BLACK
+    assert classification.runner_up == Color.GREEN
+    assert abs(classification.margin - 0.05) < 1e-9
+    assert classification.is_ambiguous(0.1)
+    assert not classification.is_ambiguous(0.01)
+
+
+def test_classification_prefers_first_color_when_tie():
+    classification = ColorClassification.from_similarity(np.array([0.5, 0.5, 0.1, 0.1, 0.1, 0.1]))
+    assert (classification.color, classification.runner_up) == (Color.WHITE, Color.BLACK)
+    assert classification.margin == 0
+
+
+def test_recognize_records_classifications():
+    circles_coordinates = {
+        'c00': (43, 48), 'c10': (217, 50), 'c20': (398, 47), 'c30': (576, 48),
+        "b1": (130, 145), "b2": (304, 148), "b3": (487, 147),
+        'c01': (42, 232), 'c11': (222, 237), 'c21': (396, 236), 'c31': (578, 235),
+        "b4": (131, 331), "b5": (484, 333),
+        'c02': (46, 420), 'c12': (222, 422), 'c22': (402, 418), 'c32': (571, 419),
+        "b6": (133, 517), "b7": (311, 517), "b8": (483, 515),
+        'c03': (52, 606), 'c13': (231, 604), 'c23': (399, 608), 'c33': (581, 607)}
+
+    recognizer = create_block_recognizer()
+    recognizer.recognize(cv2.imread('detection_block/result1.png'), circles_coordinates)
+    assert set(recognizer.classifications.keys()) == set(circles_coordinates.keys())
+    assert recognizer.classifications['b5'].color == Color.BLACK
+    assert recognizer.ambiguous_circles == []
+
+    # 差の閾値を大きくすると、あいまいなサークルとして記録される
+    recognizer.min_margin = 0.5
+    recognizer.recognize(cv2.imread('detection_block/result1.png'), circles_coordinates)
+    assert 'c00' in recognizer.ambiguous_circles
+    assert 'b1' not in recognizer.ambiguous_circles
+
+
+@pytest.mark.parametrize('method', BlockRecognizer.METHODS)
+@pytest.mark.parametrize('gains', [(0.75, 1.0, 1.2), (1.25, 1.0, 0.8), (0.9, 1.2, 0.9), (0.7, 0.7, 0.7)])
+def test_recognize_under_different_lighting(method, gains):
+    img = cv2.imread('detection_block/result1.png')
+    keys = list(result1_circles_coordinates.keys())
+    expected = create_block_recognizer(method).classify_frame(img, result1_circles_coordinates, keys)
+
+    # 会場の照明を模して、チャンネルごとに明るさを変える
+    tinted = np.clip(img * np.array(gains), 0, 255).astype(np.uint8)
+    recognizer = create_block_recognizer(method, white_balance=True)
+    classifications = recognizer.classify_frame(tinted, result1_circles_coordinates, keys)
+    assert recognizer.gains == pytest.approx(1 / np.array(gains), rel=0.1)
+    assert all(classifications[key].color == expected[key].color for key in keys)
+
+
+def test_white_balance_off_by_default():
+    assert create_block_recognizer().white_balance is None
+    assert create_block_recognizer(white_balance=True).white_balance is not None
+
+
+def test_white_points():
+    recognizer = create_block_recognizer()
+    points = recognizer.white_points(result1_circles_coordinates)
+    # ブロックの置かれていない8つの交点サークルと、中央のマス
+    assert len(points) == 9
+    assert (217, 50) in points
+    assert (43, 48) not in points
+    assert points[-1] == (307, 332)
+
+
+def test_raise_unknown_method():
+    with pytest.raises(ValueError):
+        create_block_recognizer('unknown')
+
+
+result1_circles_coordinates = {
+    'c00': (43, 48), 'c10': (217, 50), 'c20': (398, 47), 'c30': (576, 48),
+    "b1": (130, 145), "b2": (304, 148), "b3": (487, 147),
+    'c01': (42, 232), 'c11': (222, 237), 'c21': (396, 236), 'c31': (578, 235),
+    "b4": (131, 331), "b5": (484, 333),
+    'c02': (46, 420), 'c12': (222, 422), 'c22': (402, 418), 'c32': (571, 419),
+    "b6": (133, 517), "b7": (311, 517), "b8": (483, 515),
+    'c03': (52, 606), 'c13': (231, 604), 'c23': (399, 608), 'c33': (581, 607)}
+
+
+def test_recognize_stream_early_exit():
+    recognizer = create_block_recognizer()
+    img = cv2.imread('detection_block/result1.png')
+    bc, cc = recognizer.recognize_stream([img] * 10, result1_circles_coordinates, min_votes=3)
+    assert recognizer.frame_count == 3
+    assert recognizer.ambiguous_circles == []
+    assert (5, 2) == (bc.get_black_circle(), bc.get_color_circle())
+    assert cc.cross_circles[2][2] == Color.RED
+
+
+def test_recognize_stream_ignore_bad_frame():
+    recognizer = create_block_recognizer()
+    img = cv2.imread('detection_block/result1.png')
+    # 1枚目は真っ白な画像(例えば露出オーバー)
+    bad = np.full_like(img, 255)
+    frames = [bad, None, img, img, img, img]
+    bc, cc = recognizer.recognize_stream(frames, result1_circles_coordinates, min_votes=3)
+    assert recognizer.frame_count == 4
+    assert recognizer.votes['b5'][Color.BLACK] == 3
+    assert (5, 2) == (bc.get_black_circle(), bc.get_color_circle())
+
+
+def test_recognize_stream_max_frames():
+    recognizer = create_block_recognizer()
+    img = cv2.imread('detection_block/result1.png')
+    bc, cc = recognizer.recognize_stream(iter([img] * 10), result1_circles_coordinates, min_votes=5, max_frames=2)
+    assert recognizer.frame_count == 2
+    # 多数決が定まる前に打ち切った場合は、あいまいなサークルとして記録される
+    assert len(recognizer.ambiguous_circles) == 24
+    assert (5, 2) == (bc.get_black_circle(), bc.get_color_circle())
+
+
+def test_recognize_stream_without_frames():
+    recognizer = create_block_recognizer()
+    with pytest.raises(ValueError):
+        recognizer.recognize_stream([None, None], result1_circles_coordinates)
+
+
+def test_recognize_stream_timeout_without_frames():
+    # 画像が届かない(Noneしか返さない)取得元でも、timeoutで打ち切る
+    recognizer = create_block_recognizer()
+    start = time.time()
+    with pytest.raises(ValueError):
+        recognizer.recognize_stream(itertools.repeat(None), result1_circles_coordinates, timeout=0.1)
+    assert recognizer.frame_count == 0
+    assert time.time() - start < 10
+
+
+def test_is_stable():
+    assert not BlockRecognizer.is_stable(Counter(), 1, 0.5)
+    assert BlockRecognizer.is_stable(Counter({Color.RED: 3}), 3, 0.5)
+    assert not BlockRecognizer.is_stable(Counter({Color.RED: 2}), 3, 0.5)
+    assert not BlockRecognizer.is_stable(Counter({Color.RED: 3, Color.WHITE: 3}), 3, 0.5)
+    assert BlockRecognizer.is_stable(Counter({Color.RED: 4, Color.WHITE: 3}), 3, 0.5)
+
+
+@pytest.mark.parametrize('roi', [True, False])
+@pytest.mark.parametrize('chunk_size', [1, 5, 24])
+def test_classify_frame_with_executor(roi, chunk_size):
+    img = cv2.imread('detection_block/result1.png')
+    keys = list(result1_circles_coordinates.keys())
+    expected = create_block_recognizer(roi=roi).classify_frame(img, result1_circles_coordinates, keys)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        recognizer = BlockRecognizer(1, True, roi=roi, executor=executor, chunk_size=chunk_size)
+        classifications = recognizer.classify_frame(img, result1_circles_coordinates, keys)
+        bc, cc = recognizer.recognize(img, result1_circles_coordinates)
+
+    # 並列に識別しても、結果とその順番は逐次処理と同じ
+    assert list(classifications.keys()) == keys
+    for key in keys:
+        assert classifications[key].color == expected[key].color
+        assert classifications[key].similarity == pytest.approx(expected[key].similarity)
+    assert (5, 2) == (bc.get_black_circle(), bc.get_color_circle())
+
+
+def load_corpus():
+    with open('detection_block/data/corpus.json', mode='r') as fp:
+        return {entry['name']: entry for entry in json.load(fp)['images']}
+
+
+def test_corpus_has_labels_for_all_circles():
+    keys = set(BlockRecognizer.BLOCK_CIRCLES + [key for (key, _) in BlockRecognizer.CROSS_CIRCLES])
+    for entry in load_corpus().values():
+        assert set(entry['circles_coordinates'].keys()) == keys
+        assert set(entry['labels'].keys()) == keys
+        assert all(name in Color.__members__ for name in entry['labels'].values())
+
+
+# 変更前の識別(00d0a07)でも誤認識していたサークル(画像の名前: サークル)。ここには変更前も誤認識していたものだけを書く
+# 正解データは画像を目で見て付けたもので、識別結果から作ったものではない
+#   snapshot_140306 c13: 青ブロックの手前に手が写り込んでおり、赤と識別する
+#   snapshot_140306 c31: 赤ブロックが画像の右端にかかっており、切り取る範囲の大半が青サークルと白のため黄と識別する
+KNOWN_MISSES = {'snapshot_140306': {'c13', 'c31'}}
+CORPUS_NAMES = ['result', 'result1', 'snapshot_140216', 'snapshot_140306', 'snapshot_140509', 'snapshot_140701',
+                'snapshot_140752', 'snapshot_140838']
+
+
+def test_corpus_names():
+    assert CORPUS_NAMES == list(load_corpus().keys())
+
+
+def load_corpus_frame(entry):
+    img = cv2.imread(entry['image'])
+    if 'block_bingo_img_range' in entry:
+        img_range = entry['block_bingo_img_range']
+        img = Camera.clip(img, output_size=(640, 640), l_top=img_range['l_top'], l_btm=img_range['l_btm'],
+                          r_btm=img_range['r_btm'], r_top=img_range['r_top'])
+    circles_coordinates = {key: tuple(point) for (key, point) in entry['circles_coordinates'].items()}
+    return (img, circles_coordinates)
+
+
+@pytest.mark.parametrize('roi', [True, False])
+@pytest.mark.parametrize('name', CORPUS_NAMES)
+def test_preprocess_same_as_closing_each_crop_on_corpus(name, roi):
+    extractor = BlockExtractor()
+    (img, circles_coordinates) = load_corpus_frame(load_corpus()[name])
+    hsv = extractor.preprocess(img, list(circles_coordinates.values()), roi=roi)
+    for point in circles_coordinates.values():
+        assert (extractor.trim(hsv, point) == closed_crop(extractor, img, point)).all()
+
+
+@pytest.mark.parametrize('name', CORPUS_NAMES)
+def test_classify_corpus(name):
+    entry = load_corpus()[name]
+    (img, circles_coordinates) = load_corpus_frame(entry)
+    keys = list(circles_coordinates.keys())
+
+    classifications = create_block_recognizer().classify_frame(img, circles_coordinates, keys)
+    misses = {key for key in keys if classifications[key].color.name != entry['labels'][key]}
+    # 誤認識が増えても減っても失敗させる(減った場合はKNOWN_MISSESを更新する)
+    assert misses == KNOWN_MISSES.get(name, set())
+
+
+@pytest.mark.parametrize('name, fixed, broken', [
+    ('snapshot_140216', set(), {'c31'}),
+    ('snapshot_140306', {'c13'}, set()),
+])
+def test_white_balance_on_corpus(name, fixed, broken):
+    # 照明の補正で誤認識が直るサークルと、新たに誤認識するサークル(既定で補正しない理由)
+    entry = load_corpus()[name]
+    (img, circles_coordinates) = load_corpus_frame(entry)
+    keys = list(circles_coordinates.keys())
+    misses = {}
+    for white_balance in (False, True):
+        classifications = create_block_recognizer(white_balance=white_balance).classify_frame(
+            img, circles_coordinates, keys)
+        misses[white_balance] = {key for key in keys if classifications[key].color.name != entry['labels'][key]}
+    assert misses[False] - misses[True] == fixed
+    assert misses[True] - misses[False] == broken
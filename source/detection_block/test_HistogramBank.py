@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from HistogramBank import HistogramBank
+
+
+sample_dir = 'detection_block/img'
+
+
+@pytest.fixture()
+def copied_sample_dir(tmp_path):
+    target = tmp_path / 'img'
+    shutil.copytree(sample_dir, str(target), ignore=shutil.ignore_patterns('*.npz'))
+    return str(target)
+
+
+def test_build_and_reload_cache(tmp_path):
+    cache_file = str(tmp_path / 'bank.npz')
+    bank = HistogramBank(sample_dir, cache_file)
+    bank.prepare()
+    assert not bank.loaded_cache_file
+    assert os.path.exists(cache_file)
+
+    cached = HistogramBank(sample_dir, cache_file)
+    cached.prepare()
+    assert cached.loaded_cache_file
+    assert cached.paths == bank.paths
+    assert cached.colors == bank.colors
+    assert np.array_equal(cached.histograms, bank.histograms)
+
+
+def test_histograms_equal_to_sample_files(tmp_path):
+    bank = HistogramBank(sample_dir, str(tmp_path / 'bank.npz'))
+    bank.prepare()
+    for (path, histogram) in zip(bank.paths, bank.histograms):
+        expected = HistogramBank.calculate_histogram(cv2.imread(path))
+        assert np.array_equal(np.array(expected), histogram)
+
+
+def test_groups_order():
+    bank = HistogramBank.load(sample_dir)
+    groups = bank.groups()
+    assert [color for (color, _) in groups] == list(HistogramBank.SAMPLE_COLORS)
+    assert sum(len(histograms) for (_, histograms) in groups) == len(bank.paths)
+
+
+def test_load_is_shared_in_process():
+    assert HistogramBank.load(sample_dir) is HistogramBank.load(sample_dir)
+
+
+def test_invalidate_cache_when_sample_modified(copied_sample_dir):
+    bank = HistogramBank(copied_sample_dir)
+    bank.prepare()
+    index = 0
+    path = bank.paths[index]
+
+    # サンプル画像を書き換えると、キャッシュは使われない
+    cv2.imwrite(path, np.zeros((10, 10, 3), dtype=np.uint8))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    modified = HistogramBank(copied_sample_dir)
+    modified.prepare()
+    assert not modified.loaded_cache_file
+    assert not np.array_equal(modified.histograms[index], bank.histograms[index])
+
+
+def test_raise_no_sample_files(copied_sample_dir):
+    shutil.rmtree(os.path.join(copied_sample_dir, 'yellow'))
+    with pytest.raises(ValueError):
+        HistogramBank(copied_sample_dir).prepare()
@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+
+from HsvLookupTable import HsvLookupTable
+from block_bingo.BlockBingoCoordinate import Color
+
+
+sample_dir = 'detection_block/img'
+
+
+def test_fill_empty_bins():
+    table = np.full((4, 4, 4), -1)
+    table[0, 0, 0] = 1
+    table[3, 3, 3] = 2
+    filled = HsvLookupTable.fill_empty_bins(table)
+    assert (filled >= 0).all()
+    assert filled[0, 0, 1] == 1
+    assert filled[3, 3, 2] == 2
+
+
+def test_fit_fills_all_bins():
+    lookup_table = HsvLookupTable.load(sample_dir)
+    assert lookup_table.table.shape == (HsvLookupTable.BINS ** 3,)
+    assert lookup_table.table.min() >= 0
+    assert lookup_table.table.max() < len(HsvLookupTable.COLORS)
+
+
+def test_load_is_shared_in_process():
+    assert HsvLookupTable.load(sample_dir) is HsvLookupTable.load(sample_dir)
+
+
+def test_classify_sample_images():
+    lookup_table = HsvLookupTable.load(sample_dir)
+    for color in (Color.WHITE, Color.RED, Color.BLUE, Color.GREEN, Color.YELLOW):
+        sample = cv2.imread('{}/{}/{}.png'.format(sample_dir, color.name.lower(), color.name.lower()))
+        similarity = lookup_table.color_similarities([sample])
+        assert similarity.shape == (1, len(HsvLookupTable.COLORS))
+        assert abs(similarity.sum() - 1) < 1e-9
+        assert HsvLookupTable.COLORS[np.argmax(similarity[0])] == color
+
+
+def test_color_similarities_of_multiple_images():
+    lookup_table = HsvLookupTable.load(sample_dir)
+    red = cv2.imread('{}/red/red.png'.format(sample_dir))[:10, :10]
+    white = np.full((6, 8, 3), 255, dtype=np.uint8)
+    similarity = lookup_table.color_similarities([red, white])
+    assert [HsvLookupTable.COLORS[idx] for idx in np.argmax(similarity, axis=1)] == [Color.RED, Color.WHITE]
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from WhiteBalance import WhiteBalance
+
+
+sample_dir = 'detection_block/img'
+
+
+def test_reference_is_not_saturated():
+    white_balance = WhiteBalance.load(sample_dir)
+    assert white_balance.reference.shape == (3,)
+    assert (white_balance.reference < 250).all()
+
+
+def test_load_is_shared_in_process():
+    assert WhiteBalance.load(sample_dir) is WhiteBalance.load(sample_dir)
+
+
+def test_lookup_table():
+    table = WhiteBalance.lookup_table([1.0, 0.5, 2.0])
+    assert table.shape == (256, 1, 3)
+    assert table.dtype == np.uint8
+    assert list(table[100, 0]) == [100, 50, 200]
+    # 255を超える値は255にする
+    assert list(table[255, 0]) == [255, 128, 255]
+
+
+def test_measure_white_ignores_dark_line():
+    img = np.full((40, 40, 3), (150, 160, 170), dtype=np.uint8)
+    # 白い部分を横切る黒い線
+    img[:, 18:22] = 0
+    white = WhiteBalance.measure_white(img, [(20, 20)], margin=10)
+    assert white == pytest.approx([150, 160, 170])
+    assert WhiteBalance.measure_white(img, [(100, 100)]) is None
+
+
+def test_apply_maps_white_to_reference():
+    white_balance = WhiteBalance.load(sample_dir)
+    img = np.full((40, 40, 3), (100, 130, 190), dtype=np.uint8)
+    (corrected, gains) = white_balance.apply(img, [(20, 20)])
+    assert gains == pytest.approx(white_balance.reference / [100, 130, 190])
+    assert np.abs(corrected[20, 20].astype(np.float64) - white_balance.reference).max() <= 1
+
+
+def test_gains_are_clipped():
+    white_balance = WhiteBalance.load(sample_dir)
+    img = np.full((40, 40, 3), (10, 255, 255), dtype=np.uint8)
+    gains = white_balance.gains(img, [(20, 20)])
+    assert gains.max() <= WhiteBalance.MAX_GAIN
+    assert gains.min() >= WhiteBalance.MIN_GAIN
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+@file: NumberDetector.py
+@brief: 数字カードを認識するクラスの基底クラス(前処理と学習済みモデルの共有。chainerを使わない)
+"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+
+class NumberDetector:
+    """
+    数字カードの画像を前処理し、学習済みモデルで数字を認識するクラスの基底クラス。
+
+    派生クラスは、学習済みモデルの読み込み(read_model)と推論(predict)を実装する。
+        DetectionNumber: chainerで推論する
+        NumpyDetectionNumber: NumPyだけで推論する(chainerを読み込まない)
+    """
+    # プロセス内で共有する学習済みモデル(キーは(クラス, モデルファイルの絶対パス))
+    _models = {}
+    _lock = threading.Lock()
+
+    def __init__(self, img=None, model_path='my_model.npz'):
+        self.origin_img = img
+        self.preprocess_img = None
+        self.detected_number = None
+        self.probabilities = None  # 複数の画像で認識した時の、各数字の確率(softmaxの平均)
+        self.number_model_path = model_path
+        self.predictor = None  # 学習済みモデル
+        self.data_directory = "data"
+        self.img_directory = "imgs"  # 画像を保管するディレクトリ
+        self.setup()
+
+    def setup(self):
+        # 学習済みモデルの読み込み(プロセス内で一度だけ読み込む)
+        self.predictor = self.load_model(self.number_model_path)
+
+    @classmethod
+    def read_model(cls, model_path):
+        """
+        学習済みモデルを読み込む
+        """
+        raise NotImplementedError()
+
+    @staticmethod
+    def predict(predictor, x):
+        """
+        前処理した画像(1x784)から各数字のスコア(1x10)を求める
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def load_model(cls, model_path='my_model.npz'):
+        """
+        プロセス内で共有する学習済みモデルを取得する。初回呼び出し時のみ読み込み、一度推論して準備しておく
+
+        Parameters
+        ----------
+        model_path: str
+            学習済みモデルのファイル(.npz)
+        """
+        key = (cls, os.path.abspath(model_path))
+        with cls._lock:
+            if key not in cls._models:
+                predictor = cls.read_model(model_path)
+                # 初回の推論は遅いため、数字カードを認識する前に済ませておく
+                cls.predict(predictor, np.zeros((1, 784), dtype=np.float32))
+                cls._models[key] = predictor
+            return cls._models[key]
+
+    @classmethod
+    def load_model_async(cls, model_path='my_model.npz'):
+        """
+        学習済みモデルを別スレッドで読み込む(読み込みが終わる前にload_modelを呼び出すと、終わるまで待つ)
+
+        Returns
+        -------
+        thread: threading.Thread
+            読み込むスレッド
+        """
+        def load():
+            try:
+                cls.load_model(model_path)
+            except Exception as error:
+                # 数字カードを認識する時にもう一度読み込み、その時にエラーを出す
+                print("学習済みモデル({})を読み込めませんでした（{}: {}）".format(model_path, type(error).__name__, error))
+        thread = threading.Thread(target=load, name="{}.load_model".format(cls.__name__), daemon=True)
+        thread.start()
+        return thread
+
+    @classmethod
+    def clear_models(cls):
+        """
+        プロセス内で共有している学習済みモデルを破棄する
+        """
+        with cls._lock:
+            cls._models.clear()
+
+    @staticmethod
+    def preprocess(img):
+        """
+        数字カードの画像を二値化して28x28に縮小し、推論に使う1x784の配列にする
+        """
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        _, img = cv2.threshold(img, 0, 255, cv2.THRESH_OTSU)
+        # 画像を28x28に縮小
+        img = cv2.resize(img, (28, 28))
+        return img.astype(np.float32).reshape(1, 784)
+
+    @staticmethod
+    def softmax(scores):
+        """
+        各数字のスコア(Nx10)を確率にする
+        """
+        exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def _preprocessing(self, is_save=False):
+        if self.origin_img is None:
+            raise FileNotFoundError('数字画像が指定されていません')
+        img = self.preprocess(self.origin_img)
+        if is_save:
+            cv2.imwrite("./imgs/preprocess.jpg", img.reshape(28, 28).astype(np.uint8))
+        self.preprocess_img = img
+
+    def set_img(self, img):
+        self.origin_img = img
+
+    def get_detect_number(self, is_save=False):
+        self._preprocessing(is_save)
+        num = self.predict(self.predictor, self.preprocess_img)
+        return np.argmax(num) + 1
+
+    def get_detect_number_batch(self, imgs):
+        """
+        複数の数字カードの画像(複数のキャプチャや、ずらして切り取った画像)をまとめて推論し、
+        各画像の確率(softmax)の平均が最大の数字を返す
+
+        Parameters
+        ----------
+        imgs: list
+            数字カードの画像のリスト
+
+        Returns
+        -------
+        number: int
+            認識した数字
+        confidence: float
+            認識した数字の確率の平均(0から1)
+        """
+        if len(imgs) == 0:
+            raise FileNotFoundError('数字画像が指定されていません')
+        x = np.concatenate([self.preprocess(img) for img in imgs])
+        self.probabilities = self.softmax(np.asarray(self.predict(self.predictor, x))).mean(axis=0)
+        number = int(np.argmax(self.probabilities))
+        return (number + 1, float(self.probabilities[number]))
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+@file: NumpyDetectionNumber.py
+@brief: 数字カードを認識する(chainerを読み込まず、NumPyだけで学習済みのMLPを推論する)
+"""
+
+import argparse
+
+import numpy as np
+
+try:
+    # CameraSystemなど、sourceディレクトリから読み込む場合
+    from detection_number.NumberDetector import NumberDetector
+except ImportError:
+    # detection_numberディレクトリで実行する場合
+    from NumberDetector import NumberDetector
+
+
+class NumpyMLP:
+    """
+    MLP.forwardと同じ計算(全結合層3つと、間のReLU)をNumPyだけで行うクラス。
+
+    重みは、chainerで保存した学習済みモデル(my_model.npz)か、exportで書き出したファイルから読み込む。
+    exportでは重みをfloat16か、出力の次元ごとにスケールを持つint8に量子化して書き出せる。
+    量子化した重みはそのままメモリに置き、推論する時に入力の次元BLOCK_ROWS行ずつfloat32に戻して計算する
+    (float32に戻した重み全体を毎回作らないため、推論中に増えるメモリはBLOCK_ROWS行分だけになる)。
+    cacheをTrueにすると、最初にfloat32に戻した重みを持ち続けて推論を速くする(メモリはfloat32と同じになる)。
+    """
+    # chainerで保存したファイルでの重みの名前(L.Classifierで保存した場合はpredictor/が付く)
+    LAYERS = ('l1', 'l2', 'l3')
+    # 書き出せる重みの型
+    DTYPES = ('float32', 'float16', 'int8')
+    # 量子化した重みを一度にfloat32に戻す行数
+    BLOCK_ROWS = 128
+
+    def __init__(self, weights, biases, scales=None, cache=False):
+        """
+        Parameters
+        ----------
+        weights: list
+            各層の重み(入力の次元 x 出力の次元。chainerのLinear.Wを転置したもの)。float32、float16、int8のいずれか
+        biases: list
+            各層のバイアス
+        scales: list
+            int8に量子化した各層の重みのスケール(出力の次元ごと)。量子化していない場合はNone
+        cache: bool
+            Trueの場合、量子化した重みをfloat32に戻したものを作っておき、推論に使う
+        """
+        self.weights = [np.ascontiguousarray(weight) if np.asarray(weight).dtype in (np.float16, np.int8)
+                        else np.ascontiguousarray(weight, dtype=np.float32) for weight in weights]
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in biases]
+        self.scales = None if scales is None else [np.asarray(scale, dtype=np.float32) for scale in scales]
+        if (self.scales is None) != (self.weights[0].dtype != np.int8):
+            raise ValueError('スケールはint8の重みの場合だけ指定します')
+        # float32に戻した重み(cacheがTrueで、量子化している場合だけ作る)
+        self.cached_weights = None
+        if cache and self.dtype != 'float32':
+            self.cached_weights = self.dequantize().weights
+
+    @property
+    def dtype(self):
+        """
+        重みの型('float32', 'float16', 'int8')
+        """
+        return self.weights[0].dtype.name
+
+    @property
+    def nbytes(self):
+        """
+        重み・バイアス・スケール(cacheがTrueの場合はfloat32に戻した重みも)が使うメモリ(単位：byte)
+        """
+        arrays = self.weights + self.biases + (self.scales or []) + (self.cached_weights or [])
+        return sum(array.nbytes for array in arrays)
+
+    @classmethod
+    def load(cls, path, cache=False):
+        """
+        学習済みモデルを読み込む。chainerで保存したファイルと、exportで書き出したファイルのどちらも読み込める
+        cacheは__init__と同じ
+        """
+        with np.load(path) as npz:
+            if 'W1' in npz.files:
+                names = [str(i + 1) for i in range(len(cls.LAYERS))]
+                scales = [npz['S' + name] for name in names] if 'S1' in npz.files else None
+                return cls([npz['W' + name] for name in names], [npz['b' + name] for name in names], scales, cache)
+            prefix = 'predictor/' if 'predictor/l1/W' in npz.files else ''
+            return cls([npz['{}{}/W'.format(prefix, layer)].T for layer in cls.LAYERS],
+                       [npz['{}{}/b'.format(prefix, layer)] for layer in cls.LAYERS])
+
+    def save(self, path):
+        """
+        重みを今の型のまま書き出す(W1, b1, W2, b2, W3, b3。int8の場合はスケールS1, S2, S3も書き出す)
+        """
+        arrays = {}
+        for (i, (weight, bias)) in enumerate(zip(self.weights, self.biases)):
+            arrays['W{}'.format(i + 1)] = weight
+            arrays['b{}'.format(i + 1)] = bias
+            if self.scales is not None:
+                arrays['S{}'.format(i + 1)] = self.scales[i]
+        np.savez(path, **arrays)
+
+    def dequantize(self):
+        """
+        重みをfloat32に戻したモデルを返す
+        """
+        weights = [weight.astype(np.float32) for weight in self.weights]
+        if self.scales is not None:
+            weights = [weight * scale for (weight, scale) in zip(weights, self.scales)]
+        return NumpyMLP(weights, self.biases)
+
+    def quantize(self, dtype):
+        """
+        重みを量子化したモデルを返す(バイアスはfloat32のまま)
+
+        Parameters
+        ----------
+        dtype: str
+            'float32', 'float16', 'int8'のいずれか。
+            int8の場合は、出力の次元ごとに重みの絶対値の最大が127になるスケールで丸める
+        """
+        if dtype not in self.DTYPES:
+            raise ValueError('重みの型は{}のいずれかです: {}'.format(', '.join(self.DTYPES), dtype))
+        weights = self.dequantize().weights
+        if dtype == 'float32':
+            return NumpyMLP(weights, self.biases)
+        if dtype == 'float16':
+            return NumpyMLP([weight.astype(np.float16) for weight in weights], self.biases)
+        maximums = [np.abs(weight).max(axis=0) for weight in weights]
+        # 重みがすべて0の出力はスケールを1にする(0で割らないように)
+        scales = [np.where(maximum > 0, maximum / 127, 1).astype(np.float32) for maximum in maximums]
+        return NumpyMLP([np.clip(np.round(weight / scale), -127, 127).astype(np.int8)
+                         for (weight, scale) in zip(weights, scales)], self.biases, scales)
+
+    @classmethod
+    def export(cls, model_path, weights_path, dtype='float32'):
+        """
+        chainerで保存した学習済みモデルを、重みだけのファイルに書き出す(chainerは使わない)
+
+        Parameters
+        ----------
+        dtype: str
+            書き出す重みの型('float32', 'float16', 'int8')
+        """
+        model = cls.load(model_path).quantize(dtype)
+        model.save(weights_path)
+        return model
+
+    def __call__(self, x):
+        h = np.asarray(x, dtype=np.float32)
+        for (i, (weight, bias)) in enumerate(zip(self.weights, self.biases)):
+            if self.cached_weights is not None:
+                h = h @ self.cached_weights[i]
+            elif weight.dtype == np.float32:
+                h = h @ weight
+            else:
+                # int8はスケールを掛ける前の重みで積を求め、出力の次元ごとにスケールを掛ける
+                h = self.blocked_matmul(h, weight)
+                if self.scales is not None:
+                    h *= self.scales[i]
+            h += bias
+            if i + 1 < len(self.weights):
+                np.maximum(h, 0, out=h)
+        return h
+
+
+    @classmethod
+    def blocked_matmul(cls, h, weight):
+        """
+        量子化した重みとの行列積を、重みをBLOCK_ROWS行ずつfloat32に戻して求める
+        """
+        # NOTE: NumPyのfloat16・整数の行列積はBLASを使わず遅いため、float32に戻してから計算する
+        out = np.zeros((h.shape[0], weight.shape[1]), dtype=np.float32)
+        for start in range(0, weight.shape[0], cls.BLOCK_ROWS):
+            stop = start + cls.BLOCK_ROWS
+            out += h[:, start:stop] @ weight[start:stop].astype(np.float32)
+        return out
+
+
+class NumpyDetectionNumber(NumberDetector):
+    """
+    NumPyだけで数字カードを認識するクラス(使い方と認識結果はDetectionNumberと同じ)
+    """
+
+    @classmethod
+    def read_model(cls, model_path):
+        return NumpyMLP.load(model_path)
+
+    @staticmethod
+    def predict(predictor, x):
+        return predictor(x)
+
+
+def main():
+    # chainerで保存した学習済みモデルを、重みだけのファイルに書き出す
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model', nargs='?', default='my_model.npz', help='chainerで保存した学習済みモデル')
+    parser.add_argument('weights', nargs='?', default='my_model_weights.npz', help='書き出すファイル')
+    parser.add_argument('--dtype', choices=NumpyMLP.DTYPES, default='float32',
+                        help='書き出す重みの型(int8は出力の次元ごとにスケールを持つ)')
+    args = parser.parse_args()
+    NumpyMLP.export(args.model, args.weights, args.dtype)
+    print("{}の重みを{}({})に書き出しました".format(args.model, args.weights, args.dtype))
+
+
+if __name__ == '__main__':
+    main()
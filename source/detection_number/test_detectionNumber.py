@@ -1,6 +1,15 @@
 import pytest
 from DetectionNumber import DetectionNumber
+from NumpyDetectionNumber import NumpyDetectionNumber, NumpyMLP
+from MLP import MLP
+from chainer import serializers
+import chainer.links as L
+import numpy as np
 import cv2
+import os
+import subprocess
+import sys
+import tracemalloc
 
 model_path = './detection_number/my_model.npz'
 
@@ -34,3 +43,189 @@ def test_set_img():
     img = cv2.imread("./detection_number/training_scripts/original/1.jpg")
     dn.set_img(img)
     assert dn.get_detect_number(1)
+
+
+@pytest.fixture()
+def random_model_path(tmp_path):
+    # 学習していない(重みが乱数の)モデルを保存する
+    net = L.Classifier(MLP(1000, 10))
+    net.predictor(np.zeros((1, 784), dtype=np.float32))
+    path = str(tmp_path / "random_model.npz")
+    serializers.save_npz(path, net)
+    yield path
+    DetectionNumber.clear_models()
+
+
+def test_load_model_once(random_model_path):
+    first = DetectionNumber(model_path=random_model_path)
+    second = DetectionNumber(model_path=random_model_path)
+    # 2回目以降は読み込み済みのモデルを使う
+    assert first.predictor is second.predictor
+    DetectionNumber.clear_models()
+    assert DetectionNumber(model_path=random_model_path).predictor is not first.predictor
+
+
+def test_load_model_async(random_model_path):
+    thread = DetectionNumber.load_model_async(random_model_path)
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    predictor = DetectionNumber.load_model(random_model_path)
+    # 保存したモデルと同じ推論結果になる
+    net = L.Classifier(MLP(1000, 10))
+    serializers.load_npz(random_model_path, net)
+    img = cv2.imread("./detection_number/training_scripts/original/1.jpg")
+    dn = DetectionNumber(img, model_path=random_model_path)
+    assert dn.predictor is predictor
+    dn._preprocessing()
+    expected = net.predictor(dn.preprocess_img).data
+    assert np.allclose(DetectionNumber.predict(predictor, dn.preprocess_img), expected)
+    assert dn.get_detect_number() == np.argmax(expected) + 1
+
+
+def test_load_model_async_without_file(tmp_path):
+    # 読み込めない場合は、認識する時にエラーになる
+    path = str(tmp_path / "missing.npz")
+    DetectionNumber.load_model_async(path).join(timeout=30)
+    with pytest.raises(FileNotFoundError):
+        DetectionNumber(model_path=path)
+
+
+@pytest.mark.parametrize('number', range(1, 9))
+def test_numpy_same_as_chainer(random_model_path, number):
+    img = cv2.imread(f"./detection_number/training_scripts/original/{number}.jpg")
+    chainer_dn = DetectionNumber(img, model_path=random_model_path)
+    numpy_dn = NumpyDetectionNumber(img, model_path=random_model_path)
+    chainer_dn._preprocessing()
+    expected = DetectionNumber.predict(chainer_dn.predictor, chainer_dn.preprocess_img)
+    numpy_dn._preprocessing()
+    actual = NumpyDetectionNumber.predict(numpy_dn.predictor, numpy_dn.preprocess_img)
+    assert np.allclose(actual, expected, rtol=1e-4, atol=1e-3)
+    assert numpy_dn.get_detect_number() == chainer_dn.get_detect_number()
+
+
+def test_export_weights(random_model_path, tmp_path):
+    weights_path = str(tmp_path / "weights.npz")
+    NumpyMLP.export(random_model_path, weights_path)
+    with np.load(weights_path) as npz:
+        assert sorted(npz.files) == ["W1", "W2", "W3", "b1", "b2", "b3"]
+        assert npz["W1"].shape == (784, 1000) and npz["W1"].dtype == np.float32
+    x = np.random.RandomState(0).randint(0, 256, (1, 784)).astype(np.float32)
+    # 書き出したファイルと、chainerで保存したファイルで同じ推論結果になる
+    assert np.array_equal(NumpyMLP.load(weights_path)(x), NumpyMLP.load(random_model_path)(x))
+    img = cv2.imread("./detection_number/training_scripts/original/3.jpg")
+    assert (NumpyDetectionNumber(img, model_path=weights_path).get_detect_number()
+            == NumpyDetectionNumber(img, model_path=random_model_path).get_detect_number())
+
+
+def test_numpy_without_chainer():
+    # NumpyDetectionNumberはchainerを読み込まない
+    code = "import sys; import NumpyDetectionNumber; print('chainer' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd="./detection_number",
+                            stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_numpy_package_import_without_chainer():
+    # CameraSystemと同じく、sourceディレクトリからdetection_number.NumpyDetectionNumberとして読み込める
+    code = ("import sys; from detection_number.NumpyDetectionNumber import NumpyDetectionNumber; "
+            "print('chainer' in sys.modules)")
+    env = dict(os.environ, PYTHONPATH=".")
+    result = subprocess.run([sys.executable, "-c", code], env=env,
+                            stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    assert result.stdout.strip() == "False"
+
+
+@pytest.mark.parametrize('dtype, ratio', [('float16', 0.5), ('int8', 0.25)])
+def test_export_quantized(random_model_path, tmp_path, dtype, ratio):
+    float32_path = str(tmp_path / "float32.npz")
+    quantized_path = str(tmp_path / f"{dtype}.npz")
+    NumpyMLP.export(random_model_path, float32_path)
+    NumpyMLP.export(random_model_path, quantized_path, dtype)
+    # ファイルもメモリも量子化した型の大きさに比例して小さくなる
+    assert os.path.getsize(quantized_path) < os.path.getsize(float32_path) * (ratio + 0.01)
+    expected_model = NumpyMLP.load(float32_path)
+    model = NumpyMLP.load(quantized_path)
+    assert model.dtype == dtype
+    assert model.nbytes < expected_model.nbytes * (ratio + 0.01)
+    for number in range(1, 9):
+        img = cv2.imread(f"./detection_number/training_scripts/original/{number}.jpg")
+        dn = NumpyDetectionNumber(img, model_path=quantized_path)
+        dn._preprocessing()
+        expected = expected_model(dn.preprocess_img)
+        actual = model(dn.preprocess_img)
+        # 乱数の重みでは、int8の誤差は最大のスコアの3%程度になる
+        tolerance = 0.05 * np.abs(expected).max()
+        assert np.abs(actual - expected).max() < tolerance
+        # 学習していないモデルはスコアの差が小さいため、量子化の誤差の範囲で最大のスコアの数字を選んでいればよい
+        assert expected[0, dn.get_detect_number() - 1] > expected.max() - 2 * tolerance
+
+
+def create_random_mlp():
+    # my_model.npzと同じ大きさ(784 -> 1000 -> 1000 -> 8)の乱数の重み
+    random = np.random.RandomState(0)
+    shapes = [(784, 1000), (1000, 1000), (1000, 8)]
+    return NumpyMLP([random.normal(0, 0.05, shape).astype(np.float32) for shape in shapes],
+                    [random.normal(0, 0.05, shape[1]).astype(np.float32) for shape in shapes])
+
+
+def peak_memory(func):
+    # funcを実行する間に確保したメモリの最大(単位：byte)
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'int8'])
+def test_quantized_inference_memory(dtype):
+    model = create_random_mlp().quantize(dtype)
+    x = np.random.RandomState(1).randint(0, 256, (5, 784)).astype(np.float32)
+    # 推論するたびにfloat32に戻した重み全体(l2は4MB)を作らない
+    peak = peak_memory(lambda: model(x))
+    assert peak < 1000 * NumpyMLP.BLOCK_ROWS * 4 * 2
+    # cacheを指定した場合は、読み込んだ時にfloat32に戻しておき、推論ではメモリを確保しない
+    cached = NumpyMLP(model.weights, model.biases, model.scales, cache=True)
+    assert cached.nbytes > model.dequantize().nbytes
+    assert peak_memory(lambda: cached(x)) < 100 * 1000
+    expected = model.dequantize()(x)
+    tolerance = 1e-4 * np.abs(expected).max()
+    assert np.abs(model(x) - expected).max() < tolerance
+    assert np.abs(cached(x) - expected).max() < tolerance
+
+
+def test_quantize_int8():
+    weights = [np.array([[0.5, 0.0, -0.015], [-1.0, 0.0, 0.02]], dtype=np.float32)]
+    model = NumpyMLP(weights, [np.zeros(3, dtype=np.float32)]).quantize('int8')
+    # 出力の次元ごとに、絶対値の最大が127になる
+    assert np.array_equal(model.weights[0], [[64, 0, -95], [-127, 0, 127]])
+    assert np.allclose(model.scales[0], [1.0 / 127, 1, 0.02 / 127])
+    assert np.allclose(model.dequantize().weights[0], weights[0], atol=0.5 / 127)
+    assert np.allclose(model(np.ones((1, 2))), [[-0.5, 0, 0.005]], atol=0.01)
+    with pytest.raises(ValueError):
+        model.quantize('int4')
+
+
+@pytest.mark.parametrize('detector_class', [DetectionNumber, NumpyDetectionNumber])
+def test_detect_number_batch(random_model_path, detector_class):
+    imgs = [cv2.imread(f"./detection_number/training_scripts/original/{number}.jpg") for number in (2, 2, 5)]
+    dn = detector_class(model_path=random_model_path)
+    (number, confidence) = dn.get_detect_number_batch(imgs)
+    # 各画像の確率(softmax)の平均が最大の数字
+    probabilities = []
+    for img in imgs:
+        dn.set_img(img)
+        dn._preprocessing()
+        probabilities.append(NumpyDetectionNumber.softmax(detector_class.predict(dn.predictor, dn.preprocess_img)))
+    expected = np.concatenate(probabilities).mean(axis=0)
+    assert np.allclose(dn.probabilities, expected, atol=1e-5)
+    assert number == np.argmax(expected) + 1
+    assert confidence == pytest.approx(expected.max(), abs=1e-5)
+    # 同じ画像だけの場合は、1枚で認識した結果と同じ
+    (number, confidence) = dn.get_detect_number_batch(imgs[:1])
+    dn.set_img(imgs[0])
+    assert number == dn.get_detect_number()
+    assert 0 < confidence <= 1
+    with pytest.raises(FileNotFoundError):
+        dn.get_detect_number_batch([])
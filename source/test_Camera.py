@@ -5,13 +5,19 @@
 """
 
 from Camera import Camera
+from capture.FrameGrabber import FrameGrabber
+from capture.FrameSource import FrameSource, DirectorySource
+from capture.MjpegStreamReader import MjpegStreamReader
+from capture.DebugImageWriter import DebugImageWriter
 import pytest
 import cv2
+import numpy as np
 
 
 @pytest.fixture()
 def camera():
-    camera = Camera(url="./img/sample_camera_area.jpg")
+    # デバッグ用の画像(img/img_padding2.pngなど)を上書きしない
+    camera = Camera(url="./img/sample_camera_area.jpg", debug_writer=DebugImageWriter(enabled=False))
     camera.capture(padding=100)
     camera.number_img_range = {
         "l_top": [
@@ -62,3 +68,324 @@ def test_clip_bingo_area(camera):
     img = camera.get_block_bingo_img(is_debug=False)
     actual = cv2.imread("./img/sample_bingo.png")
     assert (img == actual).all()
+
+
+def test_capture_with_grabber(camera):
+    grabber = FrameGrabber("./img/sample_camera_area.jpg", reconnect_interval=0.01)
+    camera_with_grabber = Camera(url="./img/sample_camera_area.jpg", grabber=grabber,
+                                 debug_writer=DebugImageWriter(enabled=False))
+    camera_with_grabber.start_grabber()
+    try:
+        camera_with_grabber.capture(padding=100)
+        first_frame_time = camera_with_grabber.last_frame_time
+        # 2回目は1回目より後に受信した画像を使う
+        camera_with_grabber.capture(padding=100)
+        assert camera_with_grabber.last_frame_time > first_frame_time
+    finally:
+        camera_with_grabber.stop_grabber()
+    assert (camera_with_grabber.original_img == camera.original_img).all()
+    assert (camera_with_grabber.original_img_dummy == camera.original_img_dummy).all()
+
+
+def test_clip_bingo_area_once(camera, monkeypatch):
+    # 座標指定用の画像のために、同じ画像を2回台形補正しない
+    calls = []
+    clip_captured = camera.clip_captured
+    monkeypatch.setattr(camera, "clip_captured", lambda *args: calls.append(args) or clip_captured(*args))
+    img = camera.get_block_bingo_img(is_debug=False)
+    assert len(calls) == 1
+    assert camera.block_bingo_img_dummy is img
+
+
+def test_clip_same_as_padded_image(camera):
+    # 余白を付けた画像から切り取った場合と同じ結果になる
+    img_range = camera.block_bingo_img_range
+    expected = Camera.clip(camera.original_img, output_size=(640, 640),
+                           l_top=img_range["l_top"], l_btm=img_range["l_btm"],
+                           r_btm=img_range["r_btm"], r_top=img_range["r_top"])
+    assert (camera.get_block_bingo_img(is_debug=False) == expected).all()
+    assert camera.original_img.shape == (camera.frame.shape[0] + 200, camera.frame.shape[1] + 200, 3)
+
+
+@pytest.mark.parametrize("url, grabber_class", [
+    ("http://127.0.0.1:1/?action=stream", MjpegStreamReader),
+    ("rtsp://127.0.0.1:1/stream", FrameGrabber),
+])
+def test_start_grabber(url, grabber_class):
+    camera = Camera(url=url)
+    grabber = camera.start_grabber()
+    try:
+        # HTTPの映像配信はMjpegStreamReaderで受信する
+        assert isinstance(grabber, grabber_class)
+    finally:
+        camera.stop_grabber()
+    assert not grabber.is_running
+
+
+def test_start_grabber_without_stream():
+    # 画像ファイルは受信し続ける必要がない
+    camera = Camera(url="./img/sample_camera_area.jpg")
+    assert camera.start_grabber() is None
+    assert camera.grabber is None
+
+
+def test_capture_from_replay_source(camera, tmp_path):
+    for i in range(3):
+        cv2.imwrite(str(tmp_path / "snapshot_{}.png".format(i)), camera.frame)
+    replay = Camera(source=DirectorySource(str(tmp_path)), debug_writer=DebugImageWriter(enabled=False))
+    replay.block_bingo_img_range = camera.block_bingo_img_range
+    for i in range(3):
+        replay.capture(padding=100)
+        assert replay.source.index == i
+        assert (replay.get_block_bingo_img(is_debug=False) == camera.get_block_bingo_img(is_debug=False)).all()
+    # 最後の画像の後はキャプチャできない
+    with pytest.raises(SystemExit):
+        replay.capture(padding=100)
+
+
+def test_capture_from_other_url_closes_source(camera, tmp_path, monkeypatch):
+    # 別のURLからキャプチャする場合は、キャプチャが終わったら取得元を閉じる
+    opened = []  # 閉じていない取得元
+    urls = []  # 開いた取得元のURL
+    open_source = FrameSource.open
+
+    def open_and_record(url):
+        source = open_source(url)
+        monkeypatch.setattr(source, "stop", lambda timeout=None: opened.remove(source))
+        opened.append(source)
+        urls.append(url)
+        return source
+    monkeypatch.setattr(FrameSource, "open", staticmethod(open_and_record))
+    cv2.imwrite(str(tmp_path / "snapshot_0.png"), camera.frame)
+    camera.capture(url=str(tmp_path), padding=100)
+    camera.capture(url=str(tmp_path), padding=100)
+    assert urls == [str(tmp_path)] * 2
+    assert opened == []
+    assert (camera.frame == cv2.imread(str(tmp_path / "snapshot_0.png"))).all()
+
+
+def test_capture_without_debug_images():
+    writer = DebugImageWriter(enabled=False)
+    camera = Camera(url="./img/sample_camera_area.jpg", debug_writer=writer)
+    camera.capture(padding=100)
+    # 保存しない場合は余白を付けた画像も作らない
+    assert camera._original_img is None and camera._original_img_dummy is None
+    assert writer._thread is None
+
+
+def test_capture_writes_debug_images(monkeypatch):
+    written = []
+    writer = DebugImageWriter()
+    monkeypatch.setattr(writer, "save", lambda path, img: written.append((path, img.shape)) or True)
+    camera = Camera(url="./img/sample_camera_area.jpg", debug_writer=writer)
+    camera.capture(padding=100)
+    assert writer.flush(timeout=5.0)
+    assert written == [("./img/img_padding2.png", (920, 1480, 3)), ("./img/img_dummy2.png", (920, 1480, 3))]
+
+
+def test_detect_block_bingo_range(camera, monkeypatch):
+    camera.block_bingo_img_range = None
+    # 自動で検出できた場合は、手動で座標を指定しない
+    monkeypatch.setattr(camera, "get_img", lambda npoints, wname: pytest.fail("手動で指定した"))
+    img = camera.get_block_bingo_img(is_debug=False)
+    assert img.shape == (640, 640, 3)
+    assert camera.modified_settings
+    # 座標は余白付きの画像の座標になる（test_Camera.pyで手動で指定した座標の近く）
+    assert abs(camera.block_bingo_img_range["l_top"] - [248, 390]).max() < 60
+    assert abs(camera.block_bingo_img_range["r_top"] - [739, 160]).max() < 60
+    assert set(Camera.array_to_list(camera.block_bingo_img_range)) == {"l_top", "l_btm", "r_top", "r_btm"}
+
+
+def test_detect_block_bingo_range_fallback(camera, monkeypatch):
+    manual_range = camera.block_bingo_img_range
+    camera.block_bingo_img_range = None
+    # 検出の信頼度が低い場合は、手動で座標を指定する
+    camera.bingo_area_detector.min_confidence = 1.1
+    monkeypatch.setattr(camera, "get_img", lambda npoints, wname: manual_range)
+    img = camera.get_block_bingo_img(is_debug=False)
+    assert (img == cv2.imread("./img/sample_bingo.png")).all()
+    # 自動で検出しない場合
+    camera.bingo_area_detector = None
+    assert camera.detect_block_bingo_range() is None
+
+
+def test_detect_circle_coordinates(camera, monkeypatch):
+    camera.get_block_bingo_img(is_debug=False)
+    # 自動で検出できた場合は、手動で座標を指定しない
+    monkeypatch.setattr(Camera, "move_get_circle_point", property(lambda self: pytest.fail("手動で指定した")))
+    coordinates = camera.get_circle_coordinates_with_range()
+    assert camera.modified_settings
+    assert len(coordinates) == 24
+    # 切り取った画像（sample_bingo.png）の左上の交点サークルの近く
+    assert abs(coordinates["c00"][0] - 52) < 10 and abs(coordinates["c00"][1] - 58) < 10
+
+
+def test_redetect_circle_coordinates(camera):
+    camera.get_block_bingo_img(is_debug=False)
+    stale = {key: [0, 0] for key in camera.circle_point_detector.LATTICE}
+    camera.block_bingo_circle_coordinates = stale
+    # ファイルから読み込んだ座標をそのまま使う
+    assert camera.get_circle_coordinates_with_range() == stale
+    assert not camera.modified_settings
+    # 検出し直すと、検出した座標に置き換える
+    coordinates = camera.get_circle_coordinates_with_range(redetect=True)
+    assert coordinates != stale
+    assert camera.modified_settings
+    # 検出し直した座標のずれが小さい場合は、それまでの座標を使う（設定ファイルを書き換えない）
+    camera.modified_settings = False
+    nearby = {key: [point[0] + 1, point[1] - 2] for (key, point) in coordinates.items()}
+    camera.block_bingo_circle_coordinates = nearby
+    assert camera.get_circle_coordinates_with_range(redetect=True) == nearby
+    assert not camera.modified_settings
+    camera.block_bingo_circle_coordinates = coordinates
+    # 検出の信頼度が低い場合は、それまでの座標を使う
+    camera.circle_point_detector.min_confidence = 1.1
+    assert camera.get_circle_coordinates_with_range(redetect=True) == coordinates
+    camera.circle_point_detector = None
+    assert camera.detect_circle_coordinates() is None
+
+
+def test_save_loaded_settings(camera, tmp_path):
+    # ファイルから読み込んだ座標（list）は、サークルの座標だけ検出し直して保存しても残る
+    camera.get_block_bingo_img(is_debug=False)
+    camera.get_circle_coordinates_with_range(redetect=True)
+    file_name = str(tmp_path / "camera_settings.json")
+    camera.save_settings(file_name)
+    loaded = Camera(url="./img/sample_camera_area.jpg", debug_writer=DebugImageWriter(enabled=False))
+    loaded.load_settings(file_name)
+    assert loaded.number_img_range == camera.number_img_range
+    assert loaded.block_bingo_img_range == camera.block_bingo_img_range
+    assert loaded.block_bingo_circle_coordinates == camera.block_bingo_circle_coordinates
+
+
+def test_check_calibration(camera, tmp_path):
+    file_name = str(tmp_path / "camera_settings.json")
+    camera.modified_settings = True
+    camera.modified_ranges = True
+    camera.save_settings(file_name)
+    # 座標を指定した時と同じ画像の場合は、座標をそのまま使う
+    loaded = Camera(url="./img/sample_camera_area.jpg", debug_writer=DebugImageWriter(enabled=False))
+    loaded.load_settings(file_name)
+    loaded.capture(padding=100)
+    assert loaded.check_calibration()
+    assert loaded.block_bingo_img_range == camera.block_bingo_img_range
+    assert not loaded.modified_settings
+    # カメラが右下に動いた（写っているものが左上にずれた）画像の場合は、座標を補正する
+    img = cv2.imread("./img/sample_camera_area.jpg")
+    cv2.imwrite(str(tmp_path / "moved.png"), cv2.warpAffine(img, np.float32([[1, 0, -20], [0, 1, -12]]),
+                                                           (img.shape[1], img.shape[0])))
+    moved = Camera(url=str(tmp_path / "moved.png"), debug_writer=DebugImageWriter(enabled=False))
+    moved.load_settings(file_name)
+    moved.capture(padding=100)
+    assert moved.check_calibration()
+    assert moved.modified_settings and moved.modified_ranges
+    for key in ("l_top", "l_btm", "r_top", "r_btm"):
+        expected = np.array(camera.block_bingo_img_range[key]) - [20, 12]
+        assert np.abs(moved.block_bingo_img_range[key] - expected).max() <= 3, key
+    # 補正した座標も、サークルの座標もそのまま使って切り取れる
+    assert moved.get_block_bingo_img(is_debug=False).shape == (640, 640, 3)
+
+
+def test_save_settings_keeps_reference(camera, tmp_path):
+    file_name = str(tmp_path / "camera_settings.json")
+    camera.modified_settings = True
+    camera.modified_ranges = True
+    camera.save_settings(file_name)
+    reference = camera.reference_features
+    # カメラが動いた画像で、サークルの座標だけ変えて保存しても、座標を指定した時の特徴点を残す
+    img = cv2.imread("./img/sample_camera_area.jpg")
+    cv2.imwrite(str(tmp_path / "moved.png"), cv2.warpAffine(img, np.float32([[1, 0, -20], [0, 1, -12]]),
+                                                           (img.shape[1], img.shape[0])))
+    moved = Camera(url=str(tmp_path / "moved.png"), debug_writer=DebugImageWriter(enabled=False))
+    moved.load_settings(file_name)
+    moved.capture(padding=100)
+    moved.modified_settings = True
+    moved.save_settings(file_name)
+    assert moved.reference_features == reference
+    # 次に読み込んだ時も、カメラが動いたことが分かる
+    reloaded = Camera(url=str(tmp_path / "moved.png"), debug_writer=DebugImageWriter(enabled=False))
+    reloaded.load_settings(file_name)
+    reloaded.capture(padding=100)
+    assert reloaded.check_calibration()
+    assert reloaded.modified_ranges
+
+
+def test_check_calibration_recalibrate(camera, tmp_path):
+    file_name = str(tmp_path / "camera_settings.json")
+    camera.modified_settings = True
+    camera.modified_ranges = True
+    camera.save_settings(file_name)
+    cv2.imwrite(str(tmp_path / "white.png"), np.full((720, 1280, 3), 255, dtype=np.uint8))
+    other = Camera(url=str(tmp_path / "white.png"), debug_writer=DebugImageWriter(enabled=False))
+    other.load_settings(file_name)
+    other.capture(padding=100)
+    # 比べられない場合は、座標を指定し直す
+    assert not other.check_calibration()
+    assert other.number_img_range is None and other.block_bingo_img_range is None
+    assert other.block_bingo_circle_coordinates is None
+
+
+def test_capture_skips_low_quality_frames(camera, tmp_path, capsys):
+    # ぼやけた画像と途中で切れた画像を読み飛ばす
+    jpeg = cv2.imencode(".jpg", camera.frame)[1].tobytes()
+    cv2.imwrite(str(tmp_path / "snapshot_0.png"), cv2.GaussianBlur(camera.frame, (0, 0), 4))
+    cv2.imwrite(str(tmp_path / "snapshot_1.png"),
+                cv2.imdecode(np.frombuffer(jpeg[:len(jpeg) // 2], dtype=np.uint8), cv2.IMREAD_COLOR))
+    cv2.imwrite(str(tmp_path / "snapshot_2.png"), camera.frame)
+    # 映像配信の代わりに、録画した画像を順番に受信する
+    stream = DirectorySource(str(tmp_path))
+    stream.is_live = True
+    replay = Camera(source=stream, debug_writer=DebugImageWriter(enabled=False))
+    capsys.readouterr()
+    replay.capture(padding=100)
+    assert replay.source.index == 2
+    assert (replay.frame == camera.frame).all()
+    assert replay.quality_gate.problems(replay.frame_quality) == []
+    # 読み飛ばした画像の数に関わらず、キャプチャごとに1回だけ表示する
+    assert len(capsys.readouterr().out.splitlines()) == 1
+
+
+def test_capture_without_usable_frames(camera, tmp_path, capsys):
+    for i in range(3):
+        cv2.imwrite(str(tmp_path / "snapshot_{}.png".format(i)), cv2.GaussianBlur(camera.frame, (0, 0), 4))
+    stream = DirectorySource(str(tmp_path))
+    stream.is_live = True
+    replay = Camera(source=stream, debug_writer=DebugImageWriter(enabled=False))
+    replay.max_capture_attempts = 2
+    capsys.readouterr()
+    # 品質を満たす画像がない場合は、最後の画像を使う
+    replay.capture(padding=100)
+    assert replay.source.index == 1
+    assert replay.quality_gate.problems(replay.frame_quality) == ["ぼやけています"]
+    assert len(capsys.readouterr().out.splitlines()) == 1
+    # 品質を調べない場合は、そのまま使う
+    replay.quality_gate = None
+    replay.capture(padding=100)
+    assert replay.source.index == 2
+    assert replay.frame_quality is None
+
+
+def test_capture_does_not_skip_replayed_frames(camera, tmp_path, capsys):
+    cv2.imwrite(str(tmp_path / "snapshot_0.png"), cv2.GaussianBlur(camera.frame, (0, 0), 4))
+    cv2.imwrite(str(tmp_path / "snapshot_1.png"), camera.frame)
+    replay = Camera(source=DirectorySource(str(tmp_path)), debug_writer=DebugImageWriter(enabled=False))
+    capsys.readouterr()
+    # 録画した画像は、品質が低くても読み飛ばさずに1枚ずつ使う
+    replay.capture(padding=100)
+    assert replay.source.index == 0
+    assert replay.quality_gate.problems(replay.frame_quality) == ["ぼやけています"]
+    assert len(capsys.readouterr().out.splitlines()) == 1
+    replay.capture(padding=100)
+    assert replay.source.index == 1
+    assert replay.quality_gate.problems(replay.frame_quality) == []
+    assert capsys.readouterr().out == ""
+
+
+def test_get_number_imgs(camera):
+    imgs = camera.get_number_imgs(jitter=4, is_debug=False)
+    assert len(imgs) == len(Camera.NUMBER_JITTERS) + 1
+    # 最初の画像はずらさずに切り取る
+    assert (imgs[0] == camera.get_number_img(is_debug=False)).all()
+    assert all(img.shape == imgs[0].shape and not (img == imgs[0]).all() for img in imgs[1:])
+    # ずらす大きさが0の場合は、すべてずらしていない画像と同じ
+    assert all((img == imgs[0]).all() for img in camera.get_number_imgs(jitter=0, is_debug=False))
@@ -0,0 +1,76 @@
+"""
+@file: test_CameraSystem.py
+@brief: CameraSystem.pyの起動時の処理をテストするプログラム
+"""
+
+from CameraSystem import CameraSystem
+from Camera import Camera
+from detection_number.NumpyDetectionNumber import NumpyDetectionNumber, NumpyMLP
+import numpy as np
+import pytest
+import subprocess
+import sys
+import threading
+
+
+def test_import_without_heavy_modules():
+    # 最初の質問を表示するまでに、OpenCV・NumPy・pyserial・tkinterを読み込まない
+    code = ("import sys; import CameraSystem; "
+            "print([name for name in ('cv2', 'numpy', 'serial', 'tkinter', 'PIL', 'chainer') if name in sys.modules])")
+    result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, check=True,
+                            universal_newlines=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_setup_camera_in_background():
+    system = CameraSystem(url="./img/sample_camera_area.jpg")
+    # cameraを参照すると、別スレッドでの準備が終わるまで待つ
+    assert isinstance(system.camera, Camera)
+    assert not system.camera_thread.is_alive()
+    # デバッグ用の画像(img/img_padding2.pngなど)を上書きしない
+    system.camera.debug_writer.enabled = False
+    system.camera.capture(padding=100)
+    assert system.camera.frame is not None
+
+
+def test_setup_camera_error(monkeypatch):
+    def fail(self, file_name="camera_settings.json"):
+        raise ValueError("設定ファイルが壊れています")
+    monkeypatch.setattr(Camera, "load_settings", fail)
+    system = CameraSystem(url="./img/sample_camera_area.jpg")
+    # 別スレッドで起きた例外は、cameraを参照した時に投げ直す
+    with pytest.raises(ValueError, match="設定ファイルが壊れています"):
+        system.camera
+
+
+def test_load_number_model_reports_errors(monkeypatch, capsys, tmp_path):
+    system = CameraSystem(url="./img/sample_camera_area.jpg")
+    system.number_model_path = str(tmp_path / "missing.npz")
+    # 学習済みモデルがない場合
+    system._load_number_model()
+    assert "missing.npz" in capsys.readouterr().out
+    # 認識器を読み込めない場合も、スレッドの中で止まらずにエラーを表示する
+    monkeypatch.setitem(sys.modules, "detection_number.NumpyDetectionNumber", None)
+    system._load_number_model()
+    assert "数字カードの認識器を読み込めませんでした" in capsys.readouterr().out
+
+
+def test_load_number_model_during_camera_setup(monkeypatch, tmp_path):
+    # 映像配信への接続に時間がかかる場合
+    connected = threading.Event()
+    monkeypatch.setattr(Camera, "start_grabber", lambda self, buffer_size=4: connected.wait(10))
+    model_path = str(tmp_path / "weights.npz")
+    shapes = [(784, 16), (16, 16), (16, 10)]
+    NumpyMLP([np.zeros(shape, dtype=np.float32) for shape in shapes],
+             [np.zeros(shape[1], dtype=np.float32) for shape in shapes]).save(model_path)
+    system = CameraSystem(url="./img/sample_camera_area.jpg")
+    system.number_model_path = model_path
+    try:
+        # 学習済みモデルは、カメラの準備が終わるのを待たずに読み込む
+        system._load_number_model()
+        assert system.camera_thread.is_alive()
+        assert any(path.endswith("weights.npz") for (_, path) in NumpyDetectionNumber._models)
+    finally:
+        connected.set()
+        NumpyDetectionNumber.clear_models()
+    assert isinstance(system.camera, Camera)